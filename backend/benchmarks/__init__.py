@@ -0,0 +1 @@
+"""后端性能基准测试与负载测试工具"""
@@ -0,0 +1,106 @@
+"""电影播放基准测试
+
+上传一个合成CT序列，分别测量：
+- per-slice: 逐层请求 /static/images/<uid>.png（原有方式）
+- cine:      一个 /api/series/<id>/cine 流式响应，后台预取后续帧
+每一帧的到达间隔（p95/p99 决定播放是否卡顿）和整体帧率。非PNG格式首次播放时需要转换，
+第二次播放命中格式缓存。
+
+用法（在 backend 目录下）：
+    python -m benchmarks.bench_cine --slices 300 --format webp
+"""
+import argparse
+import io
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+from pydicom.uid import generate_uid
+
+from benchmarks.common import Timings, load_app, print_report
+from benchmarks.synthetic_dicom import make_ct
+from image_encoding import FORMATS
+
+
+def ingest(client, slices, size):
+    rng = np.random.default_rng(0)
+    study_uid, series_uid = generate_uid(), generate_uid()
+    series_id, urls = None, []
+    for index in range(slices):
+        ds = make_ct(size, size, index, rng, study_uid=study_uid, series_uid=series_uid,
+                     series_number=1, instance_number=index + 1, patient_name='Bench^Cine')
+        buffer = io.BytesIO()
+        ds.save_as(buffer, enforce_file_format=True)
+        buffer.seek(0)
+        response = client.post('/api/upload', data={'file': (buffer, f'slice_{index}.dcm')})
+        if response.status_code != 200:
+            raise RuntimeError(f"Upload failed: {response.get_json()}")
+        instance = response.get_json()['instance']
+        series_id = instance['series_id']
+        urls.append(instance['image_url'])
+    return series_id, urls
+
+
+def bench_per_slice(client, urls, fmt):
+    timings = Timings(f'per-slice {fmt}')
+    start = time.perf_counter()
+    for url in urls:
+        response = timings.measure(client.get, f'{url}?format={fmt}')
+        timings.bytes += len(response.get_data())
+    timings.wall_time = time.perf_counter() - start
+    return timings.summary()
+
+
+def bench_cine(client, series_id, fmt, prefetch, name):
+    """逐块读取流式响应，以每个分块（一帧）的到达间隔作为帧间隔"""
+    timings = Timings(name)
+    start = last = time.perf_counter()
+    response = client.get(f'/api/series/{series_id}/cine?format={fmt}&prefetch={prefetch}', buffered=False)
+    try:
+        for chunk in response.response:
+            now = time.perf_counter()
+            timings.add(now - last)
+            timings.bytes += len(chunk)
+            last = now
+    finally:
+        response.close()
+    timings.wall_time = time.perf_counter() - start
+    # 最后一个分块是结束边界，不计为一帧
+    timings.samples.pop()
+    return timings.summary()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='电影播放基准测试')
+    parser.add_argument('--slices', type=int, default=300)
+    parser.add_argument('--size', type=int, default=512)
+    parser.add_argument('--format', choices=sorted(FORMATS), default='webp')
+    parser.add_argument('--prefetch', type=int, default=8)
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='esi_cine_')
+    try:
+        app = load_app(workdir)
+        from database import db
+        with app.app_context():
+            db.create_all()
+        client = app.test_client()
+        series_id, urls = ingest(client, args.slices, args.size)
+
+        results = {}
+        results[f'cine {args.format} (first)'] = bench_cine(client, series_id, args.format, args.prefetch,
+                                                            f'cine {args.format} (first)')
+        results[f'cine {args.format}'] = bench_cine(client, series_id, args.format, args.prefetch,
+                                                    f'cine {args.format}')
+        results[f'per-slice {args.format}'] = bench_per_slice(client, urls, args.format)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print_report(results, extra_columns=['mb_per_s'])
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
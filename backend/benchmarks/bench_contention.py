@@ -0,0 +1,153 @@
+"""入库高峰时的交互延迟基准测试
+
+先上传一张图像作为交互请求的目标，然后分别在空闲时和若干线程持续上传合成CT时测量：
+- annotation: 标注的创建和更新（不经过图像线程池）
+- render:     首次请求 WebP 预览图或 JPEG 缩略图（interactive 优先级，在图像线程池中转换）
+同时统计上传的吞吐量、被拒绝（503）的次数和图像线程池的排队情况。
+
+用法（在 backend 目录下）：
+    python -m benchmarks.bench_contention --uploaders 4 --seconds 20
+    IMAGING_WORKERS=2 IMAGING_QUEUE_SIZE=4 python -m benchmarks.bench_contention
+"""
+import argparse
+import io
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+from flask import current_app
+from pydicom.uid import generate_uid
+
+from benchmarks.common import Timings, load_app, print_report
+from benchmarks.synthetic_dicom import make_ct
+from database import db
+from image_encoding import variant_path
+from imaging_pool import imaging_pool
+
+RECTANGLE = {'shape_type': 'rectangle', 'coordinates': {'x': 10, 'y': 10, 'width': 20, 'height': 20}}
+# JPEG 只用于缩略图
+RENDERS = (('preview_url', 'webp'), ('thumbnail_url', 'jpeg'))
+
+
+def upload(client, index, size, rng, study_uid, series_uid):
+    ds = make_ct(size, size, index, rng, study_uid=study_uid, series_uid=series_uid,
+                 series_number=1, instance_number=index + 1, patient_name='Bench^Contention')
+    buffer = io.BytesIO()
+    ds.save_as(buffer, enforce_file_format=True)
+    buffer.seek(0)
+    return client.post('/api/upload', data={'file': (buffer, f'slice_{index}.dcm')})
+
+
+def uploader(app, worker, size, stop, timings, rejected, lock):
+    """持续上传，timings 和 rejected 由多个上传线程共享，通过 lock 更新"""
+    client = app.test_client()
+    rng = np.random.default_rng(worker)
+    study_uid, series_uid = generate_uid(), generate_uid()
+    index = 0
+    while not stop.is_set():
+        start = time.perf_counter()
+        response = upload(client, index, size, rng, study_uid, series_uid)
+        elapsed = time.perf_counter() - start
+        retry_after = float(response.headers.get('Retry-After', 1))
+        with lock:
+            timings.add(elapsed)
+            if response.status_code == 503:
+                rejected.append(retry_after)
+            elif response.status_code != 200:
+                timings.errors += 1
+        if response.status_code == 503:
+            # 按 Retry-After 退避，但不超过测试剩余时间
+            stop.wait(min(retry_after, 1.0))
+        index += 1
+
+
+def interactive(client, instance, seconds, name):
+    """在给定时间内交替创建/更新标注和请求新的图像变体"""
+    annotations, renders = Timings(f'{name} annotation'), Timings(f'{name} render')
+    deadline = time.perf_counter() + seconds
+    k = 0
+    while time.perf_counter() < deadline:
+        response = annotations.measure(client.post, f"/api/annotations/{instance['id']}", json=RECTANGLE)
+        if response.status_code != 200:
+            annotations.errors += 1
+        else:
+            annotation_id = response.get_json()['id']
+            response = annotations.measure(client.put, f'/api/annotations/{annotation_id}',
+                                           json=dict(RECTANGLE, label=f'ROI {k}'))
+            if response.status_code != 200:
+                annotations.errors += 1
+
+        # 删除已生成的变体，使每次请求都需要转换
+        field, fmt = RENDERS[k % len(RENDERS)]
+        response = renders.measure(client.get, f"{instance[field]}?format={fmt}")
+        if response.status_code != 200:
+            renders.errors += 1
+        drop_variant(instance[field], fmt)
+        k += 1
+        time.sleep(0.05)
+    return annotations.summary(), renders.summary()
+
+
+def drop_variant(url, fmt):
+    path = variant_path(os.path.join(current_app.config['IMAGE_FOLDER'], os.path.basename(url)), fmt)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='入库高峰时的交互延迟基准测试')
+    parser.add_argument('--uploaders', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=20)
+    parser.add_argument('--size', type=int, default=512)
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='esi_contention_')
+    try:
+        app = load_app(workdir)
+        # 只比较图像线程池的调度，不在后台压缩原始文件
+        app.config['ORIGINAL_COMPRESSION'] = 'none'
+        with app.app_context():
+            db.create_all()
+        client = app.test_client()
+        response = upload(client, 0, args.size, np.random.default_rng(0), generate_uid(), generate_uid())
+        instance = response.get_json()['instance']
+
+        results = {}
+        with app.app_context():
+            results['idle annotation'], results['idle render'] = interactive(client, instance, args.seconds / 2,
+                                                                             'idle')
+
+            stop = threading.Event()
+            uploads, rejected, lock = Timings('upload'), [], threading.Lock()
+            threads = [threading.Thread(target=uploader, args=(app, k, args.size, stop, uploads, rejected, lock))
+                       for k in range(args.uploaders)]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            try:
+                results['ingest annotation'], results['ingest render'] = interactive(client, instance, args.seconds,
+                                                                                     'ingest')
+                queues = imaging_pool.stats()['queues']
+            finally:
+                stop.set()
+                for thread in threads:
+                    thread.join()
+            uploads.wall_time = time.perf_counter() - start
+            results['upload'] = uploads.summary()
+            results['upload']['rejected'] = len(rejected)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{args.uploaders} uploaders, {imaging_pool.workers} imaging workers "
+          f"({imaging_pool.bulk_slots} for bulk), queue size {imaging_pool.queue_size}\n")
+    print_report(results, extra_columns=['errors', 'rejected'])
+    print(f"\nImaging queues at end of ingest: {queues}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,81 @@
+"""解码基准测试
+
+生成多帧XA对象并分别以 RLE Lossless 和 JPEG Baseline 编码，比较：
+- pixel_array:   pydicom 默认方式，单线程解码整个对象
+- decode_frames: decoders.py 按插件优先级选择解码器，各帧在线程池中并行解码
+- first_frame:   入库时只解码第一帧
+
+用法（在 backend 目录下）：
+    python -m benchmarks.bench_decode --size 512 --frames 32 --repeat 3
+"""
+import argparse
+import io
+import sys
+
+import numpy as np
+import pydicom
+from pydicom.encaps import encapsulate
+from pydicom.uid import JPEGBaseline8Bit, RLELossless, generate_uid
+
+from benchmarks.common import Timings, print_report
+from benchmarks.synthetic_dicom import make_xa
+import decoders
+
+
+def make_multiframe(size, frames, syntax):
+    ds = make_xa(size, size, 0, np.random.default_rng(0), frames=frames,
+                 study_uid=generate_uid(), series_uid=generate_uid(), series_number=1,
+                 instance_number=1, patient_name='Bench^Decode')
+    if syntax == RLELossless:
+        ds.compress(RLELossless)
+    else:
+        from PIL import Image
+        shift = max(0, int(ds.BitsStored) - 8)
+        encoded = []
+        for frame in ds.pixel_array:
+            buffer = io.BytesIO()
+            Image.fromarray((frame >> shift).astype(np.uint8)).save(buffer, 'JPEG', quality=90)
+            encoded.append(buffer.getvalue())
+        ds.BitsAllocated, ds.BitsStored, ds.HighBit = 8, 8, 7
+        ds.PixelData = encapsulate(encoded)
+        ds['PixelData'].VR = 'OB'
+        ds.file_meta.TransferSyntaxUID = syntax
+    buffer = io.BytesIO()
+    ds.save_as(buffer, enforce_file_format=True)
+    return buffer.getvalue()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='解码基准测试')
+    parser.add_argument('--size', type=int, default=512)
+    parser.add_argument('--frames', type=int, default=32)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    methods = {
+        'pixel_array': lambda ds: ds.pixel_array,
+        'decode_frames': decoders.decode_frames,
+        'first_frame': decoders.decode_frame,
+    }
+    results = {}
+    for syntax in (RLELossless, JPEGBaseline8Bit):
+        raw = make_multiframe(args.size, args.frames, syntax)
+        try:
+            plugin = decoders.plugin_order(syntax)[1][0] or 'native'
+        except decoders.DecodeError as e:
+            print(f"Skipping {syntax.keyword}: {e}")
+            continue
+        for name, method in methods.items():
+            timings = Timings(name)
+            for _ in range(args.repeat):
+                ds = pydicom.dcmread(io.BytesIO(raw))
+                timings.measure(method, ds)
+            results[f'{syntax.keyword}/{plugin} {name}'] = timings.summary()
+
+    print(f"{args.frames} frames of {args.size}x{args.size}, {decoders.DECODE_WORKERS} decode workers\n")
+    print_report(results, columns=['count', 'mean_ms', 'p50_ms', 'p95_ms'])
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
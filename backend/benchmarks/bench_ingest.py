@@ -0,0 +1,157 @@
+"""DICOM 入库与渲染基准测试
+
+在临时目录中生成合成DICOM语料，分别测量：
+- extract_dicom_info / convert_dicom_to_image / normalize_medical_image / create_thumbnail
+- create_image_set（一次解码生成全分辨率图、预览图和缩略图）
+- 各输出格式（PNG/WebP/JPEG）的编码耗时与输出大小
+- /api/upload 和 /api/tree 接口（使用本地 SQLite 代替 MySQL），/api/tree 分别在关闭和开启响应缓存时测量
+
+用法（在 backend 目录下）：
+    python -m benchmarks.bench_ingest --scale small
+    python -m benchmarks.bench_ingest --save-baseline
+"""
+import argparse
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from PIL import Image
+
+from benchmarks.common import BACKEND_DIR, Timings, load_app, print_report, report_regressions, save_baseline
+from benchmarks.synthetic_dicom import CORPUS_SCALES, generate_corpus
+import dicom_utils
+from database import db
+from image_encoding import FORMATS, encode_image
+
+DEFAULT_BASELINE = os.path.join(BACKEND_DIR, 'benchmarks', 'baseline_ingest.json')
+
+
+def bench_functions(corpus, workdir, repeat):
+    """测量各个图像处理函数"""
+    results = {}
+    output_dir = os.path.join(workdir, 'bench_images')
+    os.makedirs(output_dir, exist_ok=True)
+
+    for modality in sorted({m for m, _ in corpus}):
+        paths = [p for m, p in corpus if m == modality]
+        extract = Timings(f'extract_dicom_info[{modality}]')
+        convert = Timings(f'convert_dicom_to_image[{modality}]')
+        normalize = Timings(f'normalize_medical_image[{modality}]')
+        thumbnail = Timings(f'create_thumbnail[{modality}]')
+        image_set = Timings(f'create_image_set[{modality}]')
+        encoders = {fmt: Timings(f'encode_{fmt}[{modality}]') for fmt in FORMATS}
+
+        for _ in range(repeat):
+            for index, path in enumerate(paths):
+                size = os.path.getsize(path)
+                info, ds = extract.measure(dicom_utils.extract_dicom_info, path)
+                extract.bytes += size
+
+                image_path = os.path.join(output_dir, f'{modality}_{index}.png')
+                convert.measure(dicom_utils.convert_dicom_to_image, ds, image_path)
+                convert.bytes += size
+
+                pixels = ds.pixel_array
+                normalize.measure(dicom_utils.normalize_medical_image, pixels)
+                normalize.bytes += pixels.nbytes
+
+                thumb_path = os.path.join(output_dir, f'{modality}_{index}_thumb.png')
+                thumbnail.measure(dicom_utils.create_thumbnail, image_path, thumb_path)
+
+                set_path = os.path.join(output_dir, f'{modality}_{index}_set.png')
+                image_set.measure(dicom_utils.create_image_set, ds, set_path)
+
+                with Image.open(image_path) as image:
+                    image.load()
+                    for fmt, timings in encoders.items():
+                        data = timings.measure(encode_image, image, fmt)
+                        timings.bytes += len(data)
+
+        for timings in (extract, convert, normalize, thumbnail, image_set):
+            results[timings.name] = timings.summary()
+        for timings in encoders.values():
+            summary = timings.summary()
+            summary['mean_kb'] = timings.bytes / max(len(timings.samples), 1) / 1024
+            results[timings.name] = summary
+    return results
+
+
+def bench_endpoints(app, corpus, tree_requests):
+    """通过测试客户端测量 /api/upload 和 /api/tree"""
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+    client = app.test_client()
+    upload = Timings('POST /api/upload')
+    started = time.perf_counter()
+    for _, path in corpus:
+        with open(path, 'rb') as f:
+            payload = f.read()
+        data = {'file': (io.BytesIO(payload), os.path.basename(path))}
+        response = upload.measure(
+            client.post, '/api/upload', data=data, content_type='multipart/form-data')
+        upload.bytes += len(payload)
+        if response.status_code != 200:
+            upload.errors += 1
+    upload.wall_time = time.perf_counter() - started
+
+    results = {upload.name: upload.summary()}
+    # 先关闭响应缓存测量数据库查询和序列化的耗时，再测量命中缓存的耗时
+    cache = app.extensions['response_cache']
+    configured_ttl = cache.ttl
+    for name, ttl in (('GET /api/tree (uncached)', 0), ('GET /api/tree (cached)', configured_ttl)):
+        cache.ttl = ttl
+        tree = Timings(name)
+        started = time.perf_counter()
+        for _ in range(tree_requests):
+            response = tree.measure(client.get, '/api/tree')
+            tree.bytes += len(response.data)
+            if response.status_code != 200:
+                tree.errors += 1
+        tree.wall_time = time.perf_counter() - started
+        results[tree.name] = tree.summary()
+    cache.ttl = configured_ttl
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='DICOM 入库与渲染基准测试')
+    parser.add_argument('--scale', choices=sorted(CORPUS_SCALES), default='default')
+    parser.add_argument('--repeat', type=int, default=1, help='函数级基准的重复次数')
+    parser.add_argument('--tree-requests', type=int, default=50)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help='将本次结果保存为基线')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='允许的p50退化比例')
+    parser.add_argument('--keep', action='store_true', help='保留临时工作目录')
+    args = parser.parse_args(argv)
+
+    baseline_path = os.path.abspath(args.baseline)
+    workdir = tempfile.mkdtemp(prefix='esi_bench_')
+    try:
+        corpus = generate_corpus(os.path.join(workdir, 'corpus'), args.scale)
+        print(f"Generated {len(corpus)} synthetic DICOM files in {workdir}\n")
+
+        app = load_app(workdir)
+        results = bench_functions(corpus, workdir, args.repeat)
+        results.update(bench_endpoints(app, corpus, args.tree_requests))
+    finally:
+        if args.keep:
+            print(f"Working directory kept at {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print_report(results, extra_columns=['mb_per_s', 'mean_kb', 'errors'])
+
+    if args.save_baseline:
+        save_baseline(baseline_path, results)
+        print(f"\nBaseline saved to {baseline_path}")
+        return 0
+    return 0 if report_regressions(results, baseline_path, args.tolerance) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
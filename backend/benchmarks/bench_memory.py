@@ -0,0 +1,122 @@
+"""转换内存基准测试
+
+为每种图像尺寸生成16位合成平片，在独立子进程中执行一次转换（含多分辨率图像编码），
+报告峰值RSS相对于导入完成时的增量（Linux 上先重置峰值记录）：
+
+- stripwise: 正常入库路径，未压缩像素按块内存映射读取
+- decoded:   先整体解码 pixel_array（压缩传输语法的情形），之后按块处理
+- legacy:    原先的整幅转换（float64 裁剪、缩放、类型转换），作为对照
+
+用法（在 backend 目录下）：
+    python -m benchmarks.bench_memory --sizes 1024x1024,2048x2048,5000x4000
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+from pydicom.uid import generate_uid
+
+from benchmarks.common import BACKEND_DIR, print_report
+from benchmarks.synthetic_dicom import make_dx
+
+MODES = ('stripwise', 'decoded', 'legacy')
+
+PROBE = r'''
+import json, resource, sys, time
+import numpy as np, pydicom
+from PIL import Image
+import dicom_utils
+from image_encoding import save_image
+
+def status_kb(field):
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1])
+
+path, output, mode = sys.argv[1:4]
+# 重置峰值RSS（Linux），以导入完成后的实际RSS为基准
+try:
+    with open('/proc/self/clear_refs', 'w') as f:
+        f.write('5')
+    before = status_kb('VmRSS')
+except OSError:
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+start = time.perf_counter()
+if mode == 'stripwise':
+    _, ds = dicom_utils.extract_dicom_info(path)
+    dicom_utils.create_image_set(ds, output)
+elif mode == 'decoded':
+    ds = pydicom.dcmread(path, force=True)
+    ds.pixel_array
+    dicom_utils.create_image_set(ds, output)
+else:
+    ds = pydicom.dcmread(path, force=True)
+    pixels = ds.pixel_array
+    center, width = float(ds.WindowCenter), float(ds.WindowWidth)
+    low, high = center - width / 2, center + width / 2
+    pixels = np.clip(pixels, low, high)
+    pixels = ((pixels - low) / (high - low) * 255).astype(np.uint8)
+    image = Image.fromarray(pixels, mode='L')
+    save_image(image, output, 'png')
+    dicom_utils.create_derived_images(image, output)
+elapsed = time.perf_counter() - start
+try:
+    after = status_kb('VmHWM')
+except OSError:
+    after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({'peak_delta_mb': (after - before) / 1024, 'seconds': elapsed}))
+'''
+
+
+def make_image(path, rows, cols, seed=0):
+    ds = make_dx(rows, cols, 0, np.random.default_rng(seed),
+                 study_uid=generate_uid(), series_uid=generate_uid(), series_number=1,
+                 instance_number=1, patient_name='Bench^Memory')
+    ds.save_as(path, enforce_file_format=True)
+
+
+def parse_sizes(text):
+    sizes = []
+    for item in text.split(','):
+        rows, cols = item.lower().split('x')
+        sizes.append((int(rows), int(cols)))
+    return sizes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='转换内存基准测试')
+    parser.add_argument('--sizes', default='1024x1024,2048x2048,3000x2500,5000x4000')
+    parser.add_argument('--modes', default=','.join(MODES))
+    args = parser.parse_args(argv)
+
+    results = {}
+    workdir = tempfile.mkdtemp(prefix='esi_memory_')
+    try:
+        for rows, cols in parse_sizes(args.sizes):
+            path = os.path.join(workdir, f'dx_{rows}x{cols}.dcm')
+            make_image(path, rows, cols)
+            for mode in args.modes.split(','):
+                output = os.path.join(workdir, f'{mode}_{rows}x{cols}.png')
+                raw = subprocess.check_output([sys.executable, '-c', PROBE, path, output, mode], cwd=BACKEND_DIR)
+                result = json.loads(raw.decode().strip().splitlines()[-1])
+                results[f'{mode}[{rows}x{cols}]'] = {
+                    'pixels_mb': rows * cols * 2 / 1e6,
+                    'peak_rss_mb': result['peak_delta_mb'],
+                    'seconds': result['seconds'],
+                }
+            os.remove(path)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print_report(results, columns=['pixels_mb', 'peak_rss_mb', 'seconds'])
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,103 @@
+"""多平面重建基准测试
+
+上传一个合成CT序列，通过 /api/series/<id>/mpr 在单线程中逐层滚动轴位、冠状位、矢状位和斜切面，
+分别测量未命中平面缓存（提取 + 窗宽窗位 + 编码）和命中缓存时每秒可输出的平面数。
+请求经过完整的路由（体数据检查、默认窗口、图像线程池），首次请求构建体数据的耗时单独列出。
+
+用法（在 backend 目录下）：
+    python -m benchmarks.bench_mpr --slices 150 --format png
+"""
+import argparse
+import shutil
+import sys
+import tempfile
+
+from benchmarks.bench_cine import ingest
+from benchmarks.common import Timings, load_app, print_report
+import mpr
+from image_encoding import FORMATS
+
+
+def request_plane(client, url, timings):
+    response = timings.measure(client.get, url)
+    if response.status_code != 200:
+        timings.errors += 1
+    timings.bytes += len(response.get_data())
+    return response
+
+
+def bench_planes(client, series_id, fmt, limit):
+    base = f'/api/series/{series_id}/mpr?format={fmt}'
+    results = {}
+
+    build = Timings('volume build (first request)')
+    response = request_plane(client, f'{base}&plane=axial&index=0', build)
+    results[build.name] = build.summary()
+    counts = {
+        'axial': int(response.headers['X-MPR-Count']),
+        'coronal': int(client.get(f'{base}&plane=coronal&index=0').headers['X-MPR-Count']),
+        'sagittal': int(client.get(f'{base}&plane=sagittal&index=0').headers['X-MPR-Count']),
+    }
+    plane_ranges = {plane: range(0, count, max(1, count // limit)) for plane, count in counts.items()}
+
+    # 缓存容量为0时每次都重新计算
+    mpr.plane_cache.max_entries = 0
+    try:
+        for plane, indices in plane_ranges.items():
+            timings = Timings(f'{plane} (uncached)')
+            for index in indices:
+                request_plane(client, f'{base}&plane={plane}&index={index}', timings)
+            results[timings.name] = timings.summary()
+
+        oblique = Timings('oblique (uncached)')
+        for k in range(min(limit, 20)):
+            request_plane(client, f'{base}&plane=oblique&normal=1,1,0&offset={(k - 10) * 2.5}', oblique)
+        results[oblique.name] = oblique.summary()
+    finally:
+        mpr.plane_cache.max_entries = mpr.MPR_CACHE_SIZE
+
+    cached = Timings('coronal (cached)')
+    urls = [f'{base}&plane=coronal&index={index}' for index in plane_ranges['coronal']]
+    for url in urls:
+        client.get(url)
+    for url in urls:
+        request_plane(client, url, cached)
+    results[cached.name] = cached.summary()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='多平面重建基准测试')
+    parser.add_argument('--slices', type=int, default=150)
+    parser.add_argument('--size', type=int, default=512)
+    parser.add_argument('--format', choices=sorted(FORMATS), default='png')
+    parser.add_argument('--planes', type=int, default=64, help='每个方向最多测量的平面数')
+    parser.add_argument('--min-rate', type=float, default=20.0, help='未命中缓存时要求达到的平面数/秒')
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='esi_mpr_')
+    try:
+        app = load_app(workdir)
+        from database import db
+        with app.app_context():
+            db.create_all()
+        client = app.test_client()
+        series_id, _ = ingest(client, args.slices, args.size)
+        results = bench_planes(client, series_id, args.format, args.planes)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{args.slices} slices of {args.size}x{args.size}\n")
+    print_report(results, extra_columns=['errors', 'mb_per_s'])
+
+    slow = [name for name, r in results.items()
+            if name.endswith('(uncached)') and not name.startswith('oblique')
+            and r['throughput_per_s'] < args.min_rate]
+    if slow:
+        print(f"\nBelow {args.min_rate:g} planes/s: {', '.join(slow)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,67 @@
+"""冷启动基准测试
+
+在全新的子进程中测量导入 app 模块、create_app() 和第一个 /api/health 请求的耗时，
+并检查启动后是否已导入图像处理库（pydicom/NumPy/Pillow 应延迟到首次使用时导入）。
+
+用法（在 backend 目录下）：
+    python -m benchmarks.bench_startup --runs 10
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.common import BACKEND_DIR, Timings, print_report
+
+PROBE = r'''
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+application = app.create_app({
+    'SQLALCHEMY_DATABASE_URI': 'sqlite://',
+    'UPLOAD_FOLDER': sys.argv[1] + '/uploads',
+    'IMAGE_FOLDER': sys.argv[1] + '/images',
+    'VOLUME_FOLDER': sys.argv[1] + '/volumes',
+})
+created = time.perf_counter()
+application.test_client().get('/api/health')
+served = time.perf_counter()
+print(json.dumps({
+    'import': imported - start,
+    'create_app': created - imported,
+    'first_request': served - created,
+    'heavy_modules': sorted(m for m in ('numpy', 'pydicom', 'PIL') if m in sys.modules),
+}))
+'''
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='冷启动基准测试')
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args(argv)
+
+    timings = {name: Timings(name) for name in ('import app', 'create_app()', 'first request', 'process total')}
+    heavy_modules = set()
+    with tempfile.TemporaryDirectory(prefix='esi_startup_') as workdir:
+        for _ in range(args.runs):
+            total = Timings('process')
+            output = total.measure(
+                subprocess.check_output, [sys.executable, '-c', PROBE, workdir],
+                cwd=BACKEND_DIR, env={**os.environ, 'PYTHONDONTWRITEBYTECODE': '1'})
+            result = json.loads(output.decode().strip().splitlines()[-1])
+            timings['import app'].add(result['import'])
+            timings['create_app()'].add(result['create_app'])
+            timings['first request'].add(result['first_request'])
+            timings['process total'].add(total.samples[0])
+            heavy_modules.update(result['heavy_modules'])
+
+    print_report({name: t.summary() for name, t in timings.items()})
+    print(f"\nImaging modules loaded at startup: {', '.join(sorted(heavy_modules)) or 'none'}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
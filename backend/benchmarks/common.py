@@ -0,0 +1,129 @@
+"""基准测试公共工具：计时、统计、报告和基线比较"""
+import json
+import logging
+import math
+import os
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_app(workdir, database_url=None):
+    """以工作目录作为存储根目录创建 Flask 应用，默认使用工作目录下的 SQLite 数据库"""
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+    from app import create_app
+
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        'UPLOAD_FOLDER': os.path.join(workdir, 'uploads'),
+        'IMAGE_FOLDER': os.path.join(workdir, 'static', 'images'),
+        'VOLUME_FOLDER': os.path.join(workdir, 'volumes'),
+    })
+    logging.getLogger().setLevel(logging.WARNING)
+    return app
+
+
+class Timings:
+    """收集一组操作的耗时样本"""
+
+    def __init__(self, name):
+        self.name = name
+        self.samples = []
+        self.bytes = 0
+        self.errors = 0
+        self.wall_time = 0.0
+
+    def measure(self, func, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.samples.append(time.perf_counter() - start)
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+
+    def summary(self):
+        samples = sorted(self.samples)
+        total = self.wall_time or sum(samples)
+        result = {
+            'count': len(samples),
+            'errors': self.errors,
+            'throughput_per_s': len(samples) / total if total > 0 else 0.0,
+            'mean_ms': sum(samples) / len(samples) * 1000 if samples else 0.0,
+            'p50_ms': percentile(samples, 50) * 1000,
+            'p95_ms': percentile(samples, 95) * 1000,
+            'p99_ms': percentile(samples, 99) * 1000,
+        }
+        if self.bytes:
+            result['mb_per_s'] = self.bytes / total / 1e6 if total > 0 else 0.0
+        return result
+
+
+def percentile(sorted_samples, pct):
+    """最近秩法百分位，输入需已排序"""
+    if not sorted_samples:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_samples)))
+    return sorted_samples[rank - 1]
+
+
+def print_report(results, extra_columns=(), columns=None):
+    """以表格形式打印结果，columns 可替换默认的耗时列"""
+    columns = list(columns or ['count', 'throughput_per_s', 'p50_ms', 'p95_ms', 'p99_ms']) + list(extra_columns)
+    name_width = max([len(name) for name in results] + [10])
+    header = f"{'benchmark':<{name_width}}  " + '  '.join(f"{c:>16}" for c in columns)
+    print(header)
+    print('-' * len(header))
+    for name, summary in results.items():
+        cells = []
+        for column in columns:
+            value = summary.get(column, '')
+            cells.append(f"{value:>16.2f}" if isinstance(value, float) else f"{value!s:>16}")
+        print(f"{name:<{name_width}}  " + '  '.join(cells))
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(path, results):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+
+def compare_to_baseline(results, baseline, tolerance, metric='p50_ms'):
+    """与基线比较，返回退化项列表 [(name, baseline_value, current_value), ...]"""
+    regressions = []
+    for name, summary in results.items():
+        reference = baseline.get(name, {}).get(metric)
+        current = summary.get(metric)
+        if not reference or current is None:
+            continue
+        if current > reference * (1 + tolerance):
+            regressions.append((name, reference, current))
+    return regressions
+
+
+def report_regressions(results, baseline_path, tolerance):
+    """打印与基线的比较结果，存在退化时返回 False"""
+    baseline = load_baseline(baseline_path)
+    if baseline is None:
+        print(f"\nNo baseline at {baseline_path}; run with --save-baseline to create one")
+        return True
+
+    regressions = compare_to_baseline(results, baseline, tolerance)
+    if not regressions:
+        print(f"\nNo regressions against {baseline_path} (tolerance {tolerance:.0%})")
+        return True
+
+    print(f"\nRegressions against {baseline_path} (tolerance {tolerance:.0%}):")
+    for name, reference, current in regressions:
+        print(f"  {name}: p50 {reference:.2f} ms -> {current:.2f} ms ({current / reference - 1:+.0%})")
+    return False
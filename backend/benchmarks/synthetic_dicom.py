@@ -0,0 +1,217 @@
+"""生成用于基准测试的合成DICOM数据集
+
+覆盖常见的像素格式：
+- CT: 有符号16位，带 Rescale 和窗宽窗位标签
+- MR: 12位无符号，无窗宽窗位
+- US: 8位RGB
+- XA: 多帧
+- DX: 大尺寸16位
+"""
+import os
+
+import numpy as np
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.uid import ExplicitVRLittleEndian, generate_uid
+
+# 各类型的 SOP Class UID
+SOP_CLASSES = {
+    'CT': '1.2.840.10008.5.1.4.1.1.2',
+    'MR': '1.2.840.10008.5.1.4.1.1.4',
+    'US': '1.2.840.10008.5.1.4.1.1.6.1',
+    'XA': '1.2.840.10008.5.1.4.1.1.12.1',
+    'DX': '1.2.840.10008.5.1.4.1.1.1.1',
+}
+
+# 语料规模：每种类型的 (实例数, 行, 列[, 帧数])
+CORPUS_SCALES = {
+    'small': {
+        'CT': (8, 512, 512),
+        'MR': (8, 256, 256),
+        'US': (4, 480, 640),
+        'XA': (2, 256, 256, 16),
+        'DX': (1, 2048, 1664),
+    },
+    'default': {
+        'CT': (40, 512, 512),
+        'MR': (24, 256, 256),
+        'US': (10, 480, 640),
+        'XA': (4, 512, 512, 30),
+        'DX': (3, 2800, 2300),
+    },
+}
+
+
+def _phantom(rows, cols, rng):
+    """生成一个简单的体模：椭圆躯干、两侧肺野和中心骨性结构，返回以HU为单位的数组"""
+    y, x = np.ogrid[:rows, :cols]
+    cy, cx = rows / 2, cols / 2
+    image = np.full((rows, cols), -1000.0, dtype=np.float32)
+
+    body = ((x - cx) / (cols * 0.42)) ** 2 + ((y - cy) / (rows * 0.36)) ** 2 <= 1
+    image[body] = 40.0
+
+    for offset in (-0.18, 0.18):
+        lung = ((x - cx - cols * offset) / (cols * 0.12)) ** 2 + ((y - cy) / (rows * 0.2)) ** 2 <= 1
+        image[lung] = -800.0
+
+    bone = (x - cx) ** 2 + (y - cy - rows * 0.22) ** 2 <= (min(rows, cols) * 0.05) ** 2
+    image[bone] = 700.0
+
+    image += rng.normal(0, 12, (rows, cols)).astype(np.float32)
+    return image
+
+
+def _base_dataset(modality, study_uid, series_uid, series_number, instance_number, patient_name):
+    """创建带有公共标签的数据集"""
+    file_meta = FileMetaDataset()
+    file_meta.MediaStorageSOPClassUID = SOP_CLASSES[modality]
+    file_meta.MediaStorageSOPInstanceUID = generate_uid()
+    file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+
+    ds = Dataset()
+    ds.file_meta = file_meta
+    ds.SOPClassUID = file_meta.MediaStorageSOPClassUID
+    ds.SOPInstanceUID = file_meta.MediaStorageSOPInstanceUID
+    ds.StudyInstanceUID = study_uid
+    ds.SeriesInstanceUID = series_uid
+    ds.SeriesNumber = series_number
+    ds.InstanceNumber = instance_number
+    ds.Modality = modality
+    ds.PatientName = patient_name
+    ds.PatientID = 'BENCH-0001'
+    ds.StudyDate = '20240101'
+    return ds
+
+
+def _set_pixels(ds, array, bits_stored, signed=False, photometric='MONOCHROME2'):
+    """写入像素数据及相关的图像像素模块标签"""
+    if array.ndim == 3 and photometric == 'RGB':
+        ds.SamplesPerPixel = 3
+        ds.PlanarConfiguration = 0
+        ds.Rows, ds.Columns = array.shape[:2]
+    else:
+        ds.SamplesPerPixel = 1
+        ds.Rows, ds.Columns = array.shape[-2:]
+        if array.ndim == 3:
+            ds.NumberOfFrames = array.shape[0]
+    ds.PhotometricInterpretation = photometric
+    ds.BitsAllocated = array.dtype.itemsize * 8
+    ds.BitsStored = bits_stored
+    ds.HighBit = bits_stored - 1
+    ds.PixelRepresentation = 1 if signed else 0
+    ds.PixelData = np.ascontiguousarray(array).tobytes()
+
+
+def make_ct(rows, cols, index, rng, **uids):
+    """有符号16位CT切片，带 Rescale 和窗宽窗位"""
+    ds = _base_dataset('CT', **uids)
+    hu = _phantom(rows, cols, rng)
+    intercept = -1024
+    stored = np.clip(hu - intercept, -2048, 4095).astype(np.int16)
+    _set_pixels(ds, stored, bits_stored=16, signed=True)
+    ds.RescaleIntercept = intercept
+    ds.RescaleSlope = 1
+    ds.WindowCenter = 40
+    ds.WindowWidth = 400
+    ds.PixelSpacing = [0.7, 0.7]
+    ds.SliceThickness = 2.5
+    ds.ImageOrientationPatient = [1, 0, 0, 0, 1, 0]
+    ds.ImagePositionPatient = [-179.2, -179.2, -100.0 + index * 2.5]
+    return ds
+
+
+def make_mr(rows, cols, index, rng, **uids):
+    """12位无符号MR切片，不带窗宽窗位标签"""
+    ds = _base_dataset('MR', **uids)
+    signal = (_phantom(rows, cols, rng) + 1000) * 1.6
+    stored = np.clip(signal, 0, 4095).astype(np.uint16)
+    _set_pixels(ds, stored, bits_stored=12)
+    ds.PixelSpacing = [0.9, 0.9]
+    ds.SliceThickness = 4.0
+    ds.ImageOrientationPatient = [1, 0, 0, 0, 1, 0]
+    ds.ImagePositionPatient = [-115.2, -115.2, -40.0 + index * 4.0]
+    return ds
+
+
+def make_us(rows, cols, index, rng, **uids):
+    """8位RGB超声图像"""
+    ds = _base_dataset('US', **uids)
+    gray = np.clip(rng.gamma(2.0, 30.0, (rows, cols)), 0, 255).astype(np.uint8)
+    rgb = np.stack([gray, gray, gray], axis=-1)
+    # 彩色多普勒区域
+    rgb[rows // 3:rows // 2, cols // 3:cols // 2, 0] = 220
+    _set_pixels(ds, rgb, bits_stored=8, photometric='RGB')
+    return ds
+
+
+def make_xa(rows, cols, index, rng, frames=16, **uids):
+    """多帧XA对象"""
+    ds = _base_dataset('XA', **uids)
+    base = np.clip(_phantom(rows, cols, rng) / 8 + 128, 0, 255).astype(np.uint8)
+    shifts = np.arange(frames) % cols
+    stack = np.stack([np.roll(base, int(s), axis=1) for s in shifts])
+    _set_pixels(ds, stack, bits_stored=8)
+    return ds
+
+
+def make_dx(rows, cols, index, rng, **uids):
+    """大尺寸16位DX平片"""
+    ds = _base_dataset('DX', **uids)
+    signal = (_phantom(rows, cols, rng) + 1100) * 6
+    stored = np.clip(signal, 0, 16383).astype(np.uint16)
+    _set_pixels(ds, stored, bits_stored=14)
+    ds.WindowCenter = 8000
+    ds.WindowWidth = 12000
+    return ds
+
+
+GENERATORS = {
+    'CT': make_ct,
+    'MR': make_mr,
+    'US': make_us,
+    'XA': make_xa,
+    'DX': make_dx,
+}
+
+
+def generate_corpus(output_dir, scale='default', seed=0, modalities=None):
+    """生成合成DICOM语料，返回 [(modality, path), ...]"""
+    spec = CORPUS_SCALES[scale]
+    rng = np.random.default_rng(seed)
+    os.makedirs(output_dir, exist_ok=True)
+
+    files = []
+    study_uid = generate_uid()
+    for series_number, (modality, dims) in enumerate(spec.items(), start=1):
+        if modalities and modality not in modalities:
+            continue
+        count, rows, cols = dims[:3]
+        extra = {'frames': dims[3]} if len(dims) > 3 else {}
+        series_uid = generate_uid()
+        for index in range(count):
+            ds = GENERATORS[modality](
+                rows, cols, index, rng,
+                study_uid=study_uid,
+                series_uid=series_uid,
+                series_number=series_number,
+                instance_number=index + 1,
+                patient_name='Bench^Patient',
+                **extra
+            )
+            path = os.path.join(output_dir, f"{modality.lower()}_{index:04d}.dcm")
+            ds.save_as(path, enforce_file_format=True)
+            files.append((modality, path))
+    return files
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='生成合成DICOM语料')
+    parser.add_argument('output_dir')
+    parser.add_argument('--scale', choices=sorted(CORPUS_SCALES), default='default')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    files = generate_corpus(args.output_dir, args.scale, args.seed)
+    print(f"Generated {len(files)} DICOM files in {args.output_dir}")
@@ -0,0 +1,147 @@
+"""序列电影（cine）播放：在一个响应中按顺序连续发送各层图像
+
+响应为 multipart/mixed，每一帧是一个部分，带 Content-Type、Content-Length 和帧序号等头部，
+客户端既可以按边界解析，也可以直接按 Content-Length 读取。
+
+后台线程池提前读取（必要时重新生成和转换格式）后续若干帧（默认 CINE_PREFETCH=8），
+发送当前帧时后面的帧已在准备，客户端断开时取消尚未开始的预取任务。
+"""
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from dicom_utils import image_set_paths, restore_image_set
+from image_encoding import FORMATS, create_variant, variant_path
+from imaging_pool import INTERACTIVE, imaging_pool
+
+logger = logging.getLogger(__name__)
+
+CINE_WORKERS = int(os.environ.get('CINE_WORKERS', '4'))
+MAX_PREFETCH = 64
+
+VARIANTS = ('full', 'preview')
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class CineError(ValueError):
+    pass
+
+
+def prefetch_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=CINE_WORKERS, thread_name_prefix='cine')
+    return _pool
+
+
+def frame_order(count, start=0, direction=1, limit=None):
+    """从 start 开始按方向（1 向后、-1 向前）排列的帧序号"""
+    if count == 0:
+        return []
+    if direction not in (1, -1):
+        raise CineError('direction must be 1 or -1')
+    if not 0 <= start < count:
+        raise CineError(f'start out of range [0, {count - 1}]')
+    order = list(range(start, count)) if direction == 1 else list(range(start, -1, -1))
+    return order[:limit] if limit is not None else order
+
+
+def load_frame(frame, variant, fmt, index=None):
+    """读取一帧的编码图像，被淘汰的图像先重新生成，其他格式首次请求时转换并缓存
+
+    frame 为包含 image_path、dicom_path 的字典。index 为 ArtifactIndex，用于登记访问。
+    重新生成和格式转换在图像线程池中执行，队列已满时抛出 QueueFull，该帧以错误发送。
+    """
+    start = time.perf_counter()
+    source_path = image_set_paths(frame['image_path'])[variant]
+    target_path = variant_path(source_path, fmt)
+    created = []
+    if not os.path.exists(target_path):
+        if not os.path.exists(source_path):
+            paths = imaging_pool.run(INTERACTIVE, restore_image_set, frame['image_path'], frame['dicom_path'])
+            if paths is None:
+                raise FileNotFoundError(f"Image not found: {os.path.basename(source_path)}")
+            created.extend(paths.values())
+        if fmt != 'png':
+            imaging_pool.run(INTERACTIVE, create_variant, source_path, fmt)
+            created.append(target_path)
+    with open(target_path, 'rb') as f:
+        data = f.read()
+
+    if index is not None:
+        if created:
+            index.add(created)
+            index.evict(protect=[source_path, target_path])
+        index.touch(os.path.basename(target_path))
+    metrics.record(f'cine.load.{fmt}', time.perf_counter() - start, len(data))
+    return data
+
+
+def part_headers(boundary, headers):
+    lines = [f'--{boundary}'] + [f'{name}: {value}' for name, value in headers.items()]
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode()
+
+
+def stream_frames(frames, order, variant='full', fmt='png', prefetch=8,
+                  fps=None, index=None, boundary=None):
+    """按 order 依次生成 multipart 各部分的字节串
+
+    读取失败的帧以空内容和 X-Frame-Error 头发送，不中断播放。fps 给出时按该帧率发送。
+    """
+    boundary = boundary or uuid.uuid4().hex
+    prefetch = max(1, min(prefetch, MAX_PREFETCH))
+    pool = prefetch_pool()
+    pending = deque()
+    upcoming = iter(order)
+
+    def submit():
+        position = next(upcoming, None)
+        if position is not None:
+            pending.append((position, pool.submit(load_frame, frames[position], variant, fmt, index)))
+
+    for _ in range(prefetch):
+        submit()
+
+    interval = 1.0 / fps if fps else 0.0
+    next_time = time.monotonic()
+    try:
+        while pending:
+            position, future = pending.popleft()
+            submit()
+            frame = frames[position]
+            headers = {
+                'Content-Type': FORMATS[fmt]['mimetype'],
+                'X-Frame-Index': position,
+                'X-Instance-Id': frame['id'],
+                'X-Instance-Number': frame['instance_number'],
+            }
+            start = time.perf_counter()
+            try:
+                data = future.result()
+            except Exception as e:
+                logger.warning(f"Cine frame {position} (instance {frame['id']}) failed: {e}")
+                headers['X-Frame-Error'] = str(e).replace('\r', ' ').replace('\n', ' ')
+                data = b''
+            # 等待预取结果的时间，持续偏高说明预取跟不上播放
+            metrics.record('cine.wait', time.perf_counter() - start, len(data))
+            headers['Content-Length'] = len(data)
+
+            if interval:
+                delay = next_time - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                next_time = max(next_time + interval, time.monotonic())
+            yield part_headers(boundary, headers) + data + b'\r\n'
+        yield f'--{boundary}--\r\n'.encode()
+    finally:
+        # 客户端断开时取消尚未开始的预取
+        for _, future in pending:
+            future.cancel()
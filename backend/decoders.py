@@ -0,0 +1,162 @@
+"""像素数据解码层
+
+pydicom 3 的 pydicom.pixels 为每种传输语法提供一个解码器，解码器下可以有多个插件
+（pylibjpeg、gdcm、pillow，以及 pydicom 自带的 RLE 解码）。这里按 DECODER_PLUGINS 给出的优先级
+选择第一个已安装的插件，默认 pylibjpeg > gdcm > pillow > pydicom（通常越靠前越快），
+选中的插件解码失败时依次尝试其余插件。未压缩的传输语法不需要插件。
+
+- decode_frame() 只解码指定的一帧，不再像 pixel_array 那样解码整个多帧对象；
+- decode_frames() 在线程池中并行解码多帧对象的各帧（JPEG/JPEG 2000 插件解码时释放 GIL）。
+
+每次解码的耗时和输出字节数按 decode.<传输语法>.<插件> 记录在 metrics 中。
+无法解码时抛出 DecodeError，调用方据此报告错误，不再以测试图像代替。
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+DECODER_PLUGINS = [p.strip() for p in os.environ.get('DECODER_PLUGINS', 'pylibjpeg,gdcm,pillow,pydicom').split(',')
+                   if p.strip()]
+DECODE_WORKERS = int(os.environ.get('DECODE_WORKERS', str(min(8, os.cpu_count() or 1))))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class DecodeError(Exception):
+    pass
+
+
+def decode_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=DECODE_WORKERS, thread_name_prefix='decode')
+    return _pool
+
+
+def transfer_syntax(dicom_data):
+    """数据集的传输语法；非 Part 10 文件没有文件头时按读取时的编码推断为未压缩语法"""
+    from pydicom.uid import ExplicitVRBigEndian, ExplicitVRLittleEndian, ImplicitVRLittleEndian
+    file_meta = getattr(dicom_data, 'file_meta', None)
+    syntax = file_meta.get('TransferSyntaxUID') if file_meta is not None else None
+    if syntax:
+        return syntax
+    implicit, little = getattr(dicom_data, 'original_encoding', (None, None))
+    if implicit is None:
+        raise DecodeError('Dataset has no Transfer Syntax UID')
+    if implicit:
+        return ImplicitVRLittleEndian
+    return ExplicitVRLittleEndian if little else ExplicitVRBigEndian
+
+
+def plugin_order(syntax):
+    """返回 (解码器, 按优先级排列的可用插件)，未压缩语法的插件列表为 ['']"""
+    from pydicom.pixels import get_decoder
+    try:
+        decoder = get_decoder(syntax)
+    except NotImplementedError:
+        raise DecodeError(f"Unsupported transfer syntax {syntax} ({syntax.name})")
+    if not decoder.is_available:
+        missing = '; '.join(decoder.missing_dependencies) or 'no decoding plugin installed'
+        raise DecodeError(f"No decoder available for {syntax.name}: {missing}")
+
+    available = list(decoder.available_plugins)
+    if not available:
+        return decoder, ['']
+    preferred = [p for p in DECODER_PLUGINS if p in available]
+    return decoder, preferred + [p for p in available if p not in preferred]
+
+
+def available_decoders():
+    """各常见传输语法当前选用的插件，供 /api/decoders 排查使用"""
+    from pydicom.uid import (
+        DeflatedExplicitVRLittleEndian, ExplicitVRLittleEndian, JPEG2000, JPEG2000Lossless,
+        JPEGBaseline8Bit, JPEGExtended12Bit, JPEGLosslessSV1, JPEGLSLossless, JPEGLSNearLossless, RLELossless
+    )
+    result = {}
+    for syntax in (ExplicitVRLittleEndian, DeflatedExplicitVRLittleEndian, RLELossless, JPEGBaseline8Bit,
+                   JPEGExtended12Bit, JPEGLosslessSV1, JPEGLSLossless, JPEGLSNearLossless,
+                   JPEG2000Lossless, JPEG2000):
+        try:
+            result[syntax.keyword] = plugin_order(syntax)[1][0] or 'native'
+        except DecodeError:
+            result[syntax.keyword] = None
+    return result
+
+
+def frame_count(dicom_data):
+    return int(getattr(dicom_data, 'NumberOfFrames', 1) or 1)
+
+
+def _decode(decoder, plugins, dicom_data, syntax, index):
+    errors = []
+    for plugin in plugins:
+        start = time.perf_counter()
+        try:
+            array, _ = decoder.as_array(dicom_data, index=index, decoding_plugin=plugin)
+        except Exception as e:
+            errors.append(f"{plugin or 'native'}: {e}")
+            continue
+        metrics.record(f"decode.{syntax.keyword or syntax}.{plugin or 'native'}",
+                       time.perf_counter() - start, array.nbytes)
+        return array
+    raise DecodeError(f"Failed to decode frame {index} ({syntax.name}): {'; '.join(errors)}")
+
+
+def decode_frame(dicom_data, index=0):
+    """解码一帧，返回 (行, 列) 或彩色的 (行, 列, 通道) 数组"""
+    if 'PixelData' not in dicom_data:
+        raise DecodeError('Dataset has no pixel data')
+    syntax = transfer_syntax(dicom_data)
+    decoder, plugins = plugin_order(syntax)
+    if not 0 <= index < frame_count(dicom_data):
+        raise DecodeError(f"Frame {index} out of range [0, {frame_count(dicom_data) - 1}]")
+    return _decode(decoder, plugins, dicom_data, syntax, index)
+
+
+def decode_frames(dicom_data, indices=None):
+    """解码多帧对象的多帧（默认全部），压缩数据在线程池中并行解码，返回 (帧, 行, 列[, 通道]) 数组"""
+    import numpy as np
+    if 'PixelData' not in dicom_data:
+        raise DecodeError('Dataset has no pixel data')
+    syntax = transfer_syntax(dicom_data)
+    decoder, plugins = plugin_order(syntax)
+    count = frame_count(dicom_data)
+    indices = list(range(count)) if indices is None else list(indices)
+    if any(not 0 <= i < count for i in indices):
+        raise DecodeError(f"Frame index out of range [0, {count - 1}]")
+    if not indices:
+        raise DecodeError('No frames requested')
+
+    # 延迟读取的 PixelData 先在当前线程读入，避免各线程同时读取文件
+    dicom_data.PixelData
+
+    first = _decode(decoder, plugins, dicom_data, syntax, indices[0])
+    output = np.empty((len(indices),) + first.shape, dtype=first.dtype)
+    output[0] = first
+    if len(indices) == 1:
+        return output
+
+    start = time.perf_counter()
+    if syntax.is_compressed:
+        pool = decode_pool()
+        futures = [pool.submit(_decode, decoder, plugins, dicom_data, syntax, i) for i in indices[1:]]
+        try:
+            for k, future in enumerate(futures, start=1):
+                output[k] = future.result()
+        except Exception:
+            for future in futures:
+                future.cancel()
+            raise
+    else:
+        for k, i in enumerate(indices[1:], start=1):
+            output[k] = _decode(decoder, plugins, dicom_data, syntax, i)
+    metrics.record(f"decode.frames.{syntax.keyword or syntax}", time.perf_counter() - start, output.nbytes)
+    return output
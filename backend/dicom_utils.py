@@ -1,49 +1,69 @@
-import pydicom
-import numpy as np
-from PIL import Image
+"""DICOM 解析与图像生成
+
+pydicom、NumPy 和 Pillow 导入较慢，均在首次使用时于函数内导入，
+以缩短应用启动和 CLI 命令的耗时。需要在预派生（pre-fork）前共享时调用 preload()。
+"""
 import os
-from datetime import datetime
 import logging
 
-# 设置日志
-logging.basicConfig(level=logging.INFO)
+from decoders import DecodeError, decode_frame
+from image_encoding import save_image
+from storage import find_original, read_original
+from stripwise import conversion_bytes, memory_budget, native_frame, render_strips, unused_bits
+from windowing import compute_histogram, dicom_window, modality_values
+
 logger = logging.getLogger(__name__)
 
-def extract_dicom_info(dicom_path):
-    """提取DICOM文件信息"""
+# 大于该值的元素（主要是 PixelData）延迟读取，未压缩像素可直接从文件按块读取
+DEFER_SIZE = '256 KB'
+
+# 多分辨率图像尺寸：缩略图固定尺寸，预览图为长边像素数
+THUMBNAIL_SIZE = (48, 48)
+PREVIEW_SIZE = int(os.environ.get('PREVIEW_SIZE', '256'))
+
+def preload():
+    """提前导入图像处理库，供 gunicorn preload 模式下各 worker 共享"""
+    import numpy
+    import pydicom
+    from PIL import Image
+
+def header_values(ds, keywords):
+    """按关键字取出头部字段，转换为可存入JSON的值（多值字段为列表），缺失、为空和序列、二进制字段跳过"""
+    from pydicom.multival import MultiValue
+    from pydicom.sequence import Sequence
+    values = {}
+    for keyword in keywords:
+        try:
+            value = ds.get(keyword)
+        except Exception:
+            continue
+        if value is None or value == '' or isinstance(value, (Sequence, bytes)):
+            continue
+        if isinstance(value, (MultiValue, list, tuple)):
+            values[keyword] = [str(v) for v in value]
+        elif isinstance(value, (int, float)):
+            values[keyword] = value
+        else:
+            values[keyword] = str(value)
+    return values
+
+def extract_dicom_info(dicom_path, header_tags=()):
+    """提取DICOM文件信息，header_tags 中的字段另存入 info['header']"""
+    import numpy as np
+    import pydicom
     try:
-        ds = pydicom.dcmread(dicom_path, force=True)
+        ds = pydicom.dcmread(dicom_path, force=True, defer_size=DEFER_SIZE)
         
-        # 安全地获取属性值
         def safe_get(attr, default='Unknown'):
             try:
                 value = getattr(ds, attr, default)
                 if value is None or value == '':
                     return default
-                
-                # 处理不同的DICOM数据类型
-                if hasattr(value, 'original_string'):
-                    return str(value.original_string)
-                elif hasattr(value, '__str__'):
-                    return str(value)
-                else:
-                    return default
-            except Exception as e:
-                logger.warning(f"Error getting attribute {attr}: {e}")
+                return str(value)
+            except:
                 return default
         
-        # 处理患者姓名特殊格式
         patient_name = safe_get('PatientName', 'Unknown Patient')
-        if hasattr(ds, 'PatientName'):
-            try:
-                if hasattr(ds.PatientName, 'family_name') and hasattr(ds.PatientName, 'given_name'):
-                    family_name = ds.PatientName.family_name or ''
-                    given_name = ds.PatientName.given_name or ''
-                    patient_name = f"{family_name} {given_name}".strip()
-                elif hasattr(ds.PatientName, 'original_string'):
-                    patient_name = str(ds.PatientName.original_string)
-            except:
-                pass
         
         info = {
             'study_uid': safe_get('StudyInstanceUID', f'1.2.3.{np.random.randint(1000, 9999)}'),
@@ -53,15 +73,18 @@ def extract_dicom_info(dicom_path):
             'study_date': safe_get('StudyDate', '20240101'),
             'series_number': int(safe_get('SeriesNumber', '1')),
             'instance_number': int(safe_get('InstanceNumber', '1')),
-            'modality': safe_get('Modality', 'OT')
+            'modality': safe_get('Modality', 'OT'),
+            'patient_id': safe_get('PatientID', None),
+            'accession_number': safe_get('AccessionNumber', None),
+            'study_description': safe_get('StudyDescription', None),
+            'series_description': safe_get('SeriesDescription', None),
+            'header': header_values(ds, header_tags)
         }
         
-        logger.info(f"Extracted DICOM info: {info}")
         return info, ds
         
     except Exception as e:
-        logger.error(f"Error reading DICOM file {dicom_path}: {e}")
-        # 如果读取DICOM文件失败，返回默认值
+        logger.error(f"Error reading DICOM file: {e}")
         info = {
             'study_uid': f'1.2.3.{np.random.randint(1000, 9999)}',
             'series_uid': f'1.2.3.{np.random.randint(1000, 9999)}.1',
@@ -70,94 +93,222 @@ def extract_dicom_info(dicom_path):
             'study_date': '20240101',
             'series_number': 1,
             'instance_number': 1,
-            'modality': 'OT'
+            'modality': 'OT',
+            'patient_id': None,
+            'accession_number': None,
+            'study_description': None,
+            'series_description': None,
+            'header': {}
         }
         return info, None
 
-def convert_dicom_to_image(dicom_data, output_path):
-    """将DICOM转换为PNG图像"""
-    try:
-        if dicom_data is None:
-            # 如果没有DICOM数据，创建一个测试图像
-            return create_test_image(output_path)
+def dicom_to_display_array(dicom_data):
+    """将DICOM像素数据转换为8位灰度数组（应用窗宽窗位），无法解码时抛出 DecodeError"""
+    return display_array_with_histogram(dicom_data)[0]
+
+def luminance(pixels):
+    """彩色（RGB）图像转换为亮度（ITU-R BT.601 权重）"""
+    import numpy as np
+    weights = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    return pixels[..., :3].astype(np.float32) @ weights
+
+def display_array_with_histogram(dicom_data):
+    """转换为8位灰度数组并统计直方图，返回 (数组, 直方图)，无法解码时抛出 DecodeError
+
+    像素先经 Rescale 转为 modality 值（与窗宽窗位标签的单位一致）。
+    没有窗宽窗位标签时按直方图的百分位数自动取窗，避免个别极值像素拉伸整幅图像。
+    按行分块处理，未压缩数据按行块直接从文件读取，见 stripwise.py；其他数据由 decoders.py 解码。
+    """
+    if dicom_data is None:
+        raise DecodeError('Unable to read DICOM dataset')
+    
+    # 不能用 hasattr(dicom_data, 'pixel_array')，访问该属性会解码整幅图像
+    if 'PixelData' not in dicom_data:
+        raise DecodeError('Dataset has no pixel data')
+    
+    source = native_frame(dicom_data)
+    unused = unused_bits(dicom_data) if source is not None else 0
+    with memory_budget.reserve(conversion_bytes(dicom_data, decode=source is None)):
+        if source is None:
+            # 多帧数据只解码第一帧
+            source = decode_frame(dicom_data, 0)
+            if source.ndim == 3:
+                source = luminance(source)
         
-        # 检查是否有像素数据
-        if not hasattr(dicom_data, 'pixel_array'):
-            logger.warning("DICOM file has no pixel data, creating test image")
-            return create_test_image(output_path)
+        # 确保是2D灰度图像
+        if len(source.shape) != 2:
+            raise DecodeError(f"Unexpected image dimensions: {source.shape}")
         
-        # 读取像素数据，处理多帧情况
-        try:
-            pixel_array = dicom_data.pixel_array
-            
-            # 如果是多帧数据，只取第一帧
-            if len(pixel_array.shape) == 3 and pixel_array.shape[0] > 1:
-                logger.info(f"Multi-frame DICOM detected, using first frame of {pixel_array.shape[0]} frames")
-                pixel_array = pixel_array[0]
-                
-        except Exception as e:
-            logger.error(f"Error reading pixel array: {e}")
-            return create_test_image(output_path)
+        slope = float(getattr(dicom_data, 'RescaleSlope', 1) or 1)
+        intercept = float(getattr(dicom_data, 'RescaleIntercept', 0) or 0)
+        # 应用窗宽窗位：优先使用DICOM标签，否则使用百分位自动窗口
+        return render_strips(source, slope, intercept, dicom_window(dicom_data), unused)
+
+def read_histogram(dicom_path):
+    """读取DICOM文件并统计直方图，用于补齐旧数据，返回 (直方图, 标签窗口)"""
+    ds = read_original(dicom_path, force=True)
+    pixel_array = decode_frame(ds, 0)
+    if pixel_array.ndim == 3:
+        pixel_array = luminance(pixel_array)
+    return compute_histogram(modality_values(ds, pixel_array)), dicom_window(ds)
+
+def convert_dicom_to_image(dicom_data, output_path):
+    """将DICOM转换为PNG图像 - 专门处理医学灰度图像，无法解码时抛出 DecodeError"""
+    from PIL import Image
+    pixel_array = dicom_to_display_array(dicom_data)
+    
+    # 创建灰度图像
+    image = Image.fromarray(pixel_array, mode='L')
+    save_image(image, output_path, 'png')
+    
+    logger.info(f"Medical image converted and saved: {output_path}")
+    return output_path
+
+def normalize_medical_image(pixel_array):
+    """归一化医学图像"""
+    import numpy as np
+    try:
+        # 减去最小值
+        min_val = pixel_array.min()
+        shifted = pixel_array - min_val
         
-        # 处理不同的数据类型
-        if pixel_array.dtype == np.uint8:
-            normalized_array = pixel_array
-        elif pixel_array.dtype == np.uint16:
-            # 16位转8位
-            normalized_array = (pixel_array / 256).astype(np.uint8)
-        else:
-            # 归一化其他数据类型
-            normalized_array = pixel_array.astype(np.float64)
-            normalized_array -= normalized_array.min()
-            array_max = normalized_array.max()
-            if array_max > 0:
-                normalized_array /= array_max
-            normalized_array = (normalized_array * 255).astype(np.uint8)
+        # 计算最大值
+        max_val = shifted.max()
         
-        # 创建图像
-        if len(normalized_array.shape) == 2:
-            image = Image.fromarray(normalized_array, mode='L')
-        elif len(normalized_array.shape) == 3:
-            if normalized_array.shape[2] == 3:
-                image = Image.fromarray(normalized_array, mode='RGB')
-            else:
-                # 如果是其他通道数，取第一个通道
-                image = Image.fromarray(normalized_array[:,:,0], mode='L')
+        if max_val > 0:
+            # 归一化到0-255
+            normalized = (shifted.astype(np.float32) / max_val * 255)
         else:
-            logger.error(f"Unexpected array shape: {normalized_array.shape}")
-            return create_test_image(output_path)
-        
-        # 确保输出目录存在
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            normalized = shifted.astype(np.float32)
         
-        image.save(output_path, 'PNG')
-        logger.info(f"Image saved to: {output_path}")
-        return output_path
-        
-    except Exception as e:
-        logger.error(f"Error converting DICOM to image: {e}")
-        return create_test_image(output_path)
+        return normalized.astype(np.uint8)
+    except:
+        # 简单归一化作为备选
+        return ((pixel_array - pixel_array.min()) / (pixel_array.max() - pixel_array.min()) * 255).astype(np.uint8)
 
 def create_test_image(output_path):
-    """创建测试图像"""
+    """创建测试灰度图像"""
+    import numpy as np
+    from PIL import Image
     try:
         width, height = 512, 512
-        # 创建一个有纹理的测试图像
+        # 创建医学图像风格的测试图
         image_array = np.random.normal(128, 30, (height, width)).astype(np.uint8)
         
-        # 添加一些结构
+        # 添加一些模拟结构
         y, x = np.ogrid[:height, :width]
         center_y, center_x = height // 2, width // 2
-        radius = 100
         
-        mask = (x - center_x)**2 + (y - center_y)**2 <= radius**2
-        image_array[mask] = np.clip(image_array[mask] + 50, 0, 255)
+        # 模拟病灶
+        radius1 = 80
+        mask1 = (x - center_x)**2 + (y - center_y)**2 <= radius1**2
+        image_array[mask1] = np.clip(image_array[mask1] + 60, 0, 255)
+        
+        # 模拟小病灶
+        radius2 = 30
+        center2_x, center2_y = center_x - 120, center_y - 120
+        mask2 = (x - center2_x)**2 + (y - center2_y)**2 <= radius2**2
+        image_array[mask2] = np.clip(image_array[mask2] - 40, 0, 255)
         
         image = Image.fromarray(image_array, mode='L')
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        image.save(output_path, 'PNG')
-        logger.info(f"Test image created at: {output_path}")
+        save_image(image, output_path, 'png')
         return output_path
     except Exception as e:
         logger.error(f"Error creating test image: {e}")
         return None
+
+def pad_thumbnail(img, size=THUMBNAIL_SIZE):
+    """保持宽高比缩小，并居中放置在白色背景上"""
+    from PIL import Image
+    thumb = img.copy()
+    thumb.thumbnail(size, Image.Resampling.LANCZOS)
+    background = Image.new('L', size, 255)
+    # 计算居中位置
+    x = (size[0] - thumb.size[0]) // 2
+    y = (size[1] - thumb.size[1]) // 2
+    background.paste(thumb, (x, y))
+    return background
+
+def create_thumbnail(source_path, thumbnail_path, size=THUMBNAIL_SIZE):
+    """创建缩略图"""
+    from PIL import Image
+    try:
+        with Image.open(source_path) as img:
+            save_image(pad_thumbnail(img, size), thumbnail_path, 'png')
+            return thumbnail_path
+    except Exception as e:
+        logger.error(f"Error creating thumbnail: {e}")
+        # 如果创建缩略图失败，返回原图路径
+        return source_path
+
+def image_set_paths(image_path):
+    """多分辨率图像组的文件路径：全分辨率、预览图、缩略图"""
+    name_without_ext = os.path.splitext(image_path)[0]
+    return {
+        'thumbnail': f"{name_without_ext}_thumb.png",
+        'preview': f"{name_without_ext}_preview.png",
+        'full': image_path,
+    }
+
+def create_derived_images(image, image_path):
+    """由内存中的全分辨率图像生成预览图和缩略图，缩略图由预览图缩小得到"""
+    from PIL import Image
+    paths = image_set_paths(image_path)
+    # 小于预览尺寸的图像保持原尺寸；大图直接缩小，不复制全分辨率图像
+    scale = PREVIEW_SIZE / max(image.size)
+    if scale < 1:
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        preview = image.resize(size, Image.Resampling.LANCZOS, reducing_gap=2.0)
+    else:
+        preview = image.copy()
+    save_image(preview, paths['preview'], 'png')
+    save_image(pad_thumbnail(preview), paths['thumbnail'], 'png')
+    return paths
+
+def create_image_set(dicom_data, image_path):
+    """一次解码生成全分辨率图、预览图和缩略图，返回 (路径字典, 全分辨率尺寸, 直方图)
+
+    无法解码时抛出 DecodeError，不生成任何文件。
+    """
+    from PIL import Image
+    pixel_array, histogram = display_array_with_histogram(dicom_data)
+    
+    image = Image.fromarray(pixel_array, mode='L')
+    save_image(image, image_path, 'png')
+    logger.info(f"Medical image converted and saved: {image_path}")
+    
+    return create_derived_images(image, image_path), image.size, histogram
+
+def backfill_image_set(image_path):
+    """为旧数据补齐缺失的预览图和缩略图"""
+    from PIL import Image
+    paths = image_set_paths(image_path)
+    if os.path.exists(paths['preview']) and os.path.exists(paths['thumbnail']):
+        return paths
+    # 全分辨率图已被淘汰时由 serve_image 按需重新生成
+    if not os.path.exists(image_path):
+        return paths
+    try:
+        with Image.open(image_path) as img:
+            create_derived_images(img, image_path)
+    except Exception as e:
+        logger.error(f"Error creating derived images for {image_path}: {e}")
+    return paths
+
+def backfill_image_sets(image_paths):
+    """为一批实例补齐缺失的预览图和缩略图"""
+    for image_path in image_paths:
+        backfill_image_set(image_path)
+
+def restore_image_set(image_path, dicom_path):
+    """重新生成被淘汰的图像：全分辨率图仍在时只补齐预览图和缩略图，否则从原始DICOM重新转换
+
+    返回路径字典，原始文件也不存在时返回None，无法解码时抛出 DecodeError。
+    """
+    if os.path.exists(image_path):
+        return backfill_image_set(image_path)
+    if not find_original(dicom_path):
+        return None
+    dicom_data = read_original(dicom_path, force=True, defer_size=DEFER_SIZE)
+    paths, _, _ = create_image_set(dicom_data, image_path)
+    return paths
@@ -0,0 +1,31 @@
+"""gunicorn 配置
+
+preload_app 模式下应用在 master 进程中创建一次，各 worker 通过 fork 共享已导入的模块
+（写时复制）。默认也在 master 中导入 pydicom/NumPy/Pillow，设置 PRELOAD_IMAGING=0 可关闭。
+"""
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('GUNICORN_WORKERS', '4'))
+# 导出给应用：进程内响应缓存据此决定是否在进程间共享失效，图像线程池据此均分CPU核数。
+# 命令行的 -w 在读取本文件之后才生效，post_fork 中再按实际进程数修正
+os.environ['GUNICORN_WORKERS'] = str(workers)
+threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+preload_app = True
+
+
+def on_starting(server):
+    if os.environ.get('PRELOAD_IMAGING', '1') == '1':
+        import dicom_utils
+        dicom_utils.preload()
+
+
+def post_fork(server, worker):
+    os.environ['GUNICORN_WORKERS'] = str(server.cfg.workers)
+    from app import set_worker_processes
+    from database import db
+    from wsgi import app
+    set_worker_processes(app, server.cfg.workers)
+    # 数据库连接不能跨进程共享，fork 后丢弃从 master 继承的连接池
+    with app.app_context():
+        db.engine.dispose(close=False)
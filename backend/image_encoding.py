@@ -0,0 +1,149 @@
+"""图像编码：输出格式、压缩参数与格式协商
+
+支持的格式：
+- png:  无损，zlib 压缩级别可调（0-9，越低编码越快、文件越大）
+- webp: 默认无损，可切换为有损并设置质量
+- jpeg: 有损，适合缩略图
+
+压缩参数可通过环境变量配置，每次编码的CPU耗时和输出字节数记录在 metrics 中。
+"""
+import io
+import logging
+import os
+import threading
+import time
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {
+    'png': {'pil': 'PNG', 'mimetype': 'image/png', 'ext': '.png'},
+    'webp': {'pil': 'WEBP', 'mimetype': 'image/webp', 'ext': '.webp'},
+    'jpeg': {'pil': 'JPEG', 'mimetype': 'image/jpeg', 'ext': '.jpg'},
+}
+
+# 编码参数
+PNG_COMPRESS_LEVEL = int(os.environ.get('PNG_COMPRESS_LEVEL', '3'))
+WEBP_LOSSLESS = os.environ.get('WEBP_LOSSLESS', '1') not in ('0', 'false', 'False')
+WEBP_QUALITY = int(os.environ.get('WEBP_QUALITY', '80'))
+WEBP_METHOD = int(os.environ.get('WEBP_METHOD', '2'))
+JPEG_QUALITY = int(os.environ.get('JPEG_QUALITY', '85'))
+
+
+def _format_name(name):
+    name = name.strip().lower()
+    return 'jpeg' if name == 'jpg' else name
+
+
+def _format_list(variable, default):
+    """读取格式列表，只保留 FORMATS 中支持的格式，未知的名称记录警告后忽略"""
+    names = [_format_name(f) for f in os.environ.get(variable, default).split(',') if f.strip()]
+    unknown = [f for f in names if f not in FORMATS]
+    if unknown:
+        logger.warning(f"Ignoring unsupported formats in {variable}: {unknown}. Supported: {list(FORMATS)}")
+    return [f for f in names if f in FORMATS]
+
+
+def _default_format(variable, default):
+    fmt = _format_name(os.environ.get(variable, default))
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported format in {variable}: {fmt}. Supported: {list(FORMATS)}")
+    return fmt
+
+
+# 可协商的格式（按优先级排列），以及客户端未明确表达偏好时使用的默认格式
+IMAGE_FORMATS = _format_list('IMAGE_FORMATS', 'webp,png')
+THUMBNAIL_FORMATS = _format_list('THUMBNAIL_FORMATS', 'webp,jpeg,png')
+IMAGE_FORMAT = _default_format('IMAGE_FORMAT', 'png')
+THUMBNAIL_FORMAT = _default_format('THUMBNAIL_FORMAT', 'png')
+
+
+def save_options(fmt):
+    """返回指定格式的 Pillow 保存参数"""
+    if fmt == 'png':
+        return {'compress_level': PNG_COMPRESS_LEVEL}
+    if fmt == 'webp':
+        if WEBP_LOSSLESS:
+            return {'lossless': True, 'quality': WEBP_QUALITY, 'method': WEBP_METHOD}
+        return {'quality': WEBP_QUALITY, 'method': WEBP_METHOD}
+    if fmt == 'jpeg':
+        return {'quality': JPEG_QUALITY, 'optimize': False}
+    raise ValueError(f"Unsupported image format: {fmt}")
+
+
+def _encode(image, fp, fmt):
+    """编码到文件对象，记录CPU耗时和输出字节数"""
+    spec = FORMATS[fmt]
+    if fmt == 'jpeg' and image.mode not in ('L', 'RGB'):
+        image = image.convert('RGB')
+
+    start = time.thread_time()
+    position = fp.tell()
+    image.save(fp, spec['pil'], **save_options(fmt))
+    metrics.record(f'encode.{fmt}', time.thread_time() - start, fp.tell() - position)
+
+
+def encode_image(image, fmt='png'):
+    """将 PIL 图像编码为字节串"""
+    buffer = io.BytesIO()
+    _encode(image, buffer, fmt)
+    return buffer.getvalue()
+
+
+def save_image(image, output_path, fmt='png'):
+    """编码并写入文件，直接写入磁盘而不在内存中保留整份编码结果"""
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    # 先写临时文件再重命名，避免并发请求读到半个文件；临时文件名区分进程和线程
+    tmp_path = f"{output_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            _encode(image, f, fmt)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, output_path)
+    return output_path
+
+
+def variant_path(path, fmt):
+    """同一图像其他格式的缓存路径，与原文件并列存放"""
+    return os.path.splitext(path)[0] + FORMATS[fmt]['ext']
+
+
+def create_variant(source_path, fmt):
+    """由PNG源文件生成指定格式的缓存副本，已存在时直接返回路径"""
+    from PIL import Image
+    target_path = variant_path(source_path, fmt)
+    if not os.path.exists(target_path):
+        with Image.open(source_path) as img:
+            save_image(img, target_path, fmt)
+    return target_path
+
+
+def remove_variants(path):
+    """删除图像及其所有格式的缓存副本"""
+    for fmt in FORMATS:
+        candidate = variant_path(path, fmt)
+        if os.path.exists(candidate):
+            os.remove(candidate)
+
+
+def negotiate_format(requested, accept_mimetypes, thumbnail=False):
+    """根据查询参数或 Accept 头选择输出格式，不支持时返回 None
+
+    优先级：显式的 ?format= 参数 > Accept 头中明确列出的允许格式 > 部署默认格式。
+    通配符 */* 不视为偏好，避免给不识别 WebP 的客户端返回 WebP。
+    """
+    allowed = THUMBNAIL_FORMATS if thumbnail else IMAGE_FORMATS
+    default = THUMBNAIL_FORMAT if thumbnail else IMAGE_FORMAT
+    if requested:
+        requested = 'jpeg' if requested.lower() == 'jpg' else requested.lower()
+        return requested if requested in allowed or requested in ('png', default) else None
+
+    listed = {mimetype for mimetype, quality in accept_mimetypes if quality > 0}
+    for fmt in allowed:
+        if FORMATS[fmt]['mimetype'] in listed:
+            return fmt
+    return default
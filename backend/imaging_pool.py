@@ -0,0 +1,158 @@
+"""图像处理线程池：固定线程数、有容量上限的两级优先级队列
+
+DICOM 转换、缩略图生成、格式转换、MPR 和体数据构建等CPU密集的工作都提交到这里执行，
+请求线程只等待结果，上传高峰不会占满所有请求线程而拖慢标注、列表等轻量接口。
+
+- interactive：浏览时的按需渲染（图像重新生成、格式转换、MPR、体数据、直方图补齐）；
+- bulk：批量入库（上传转换）和后台补齐。
+
+空闲线程总是先取 interactive 任务；bulk 任务最多同时占用 workers-1 个线程，线程数至少为2，
+总是留一个线程给 interactive 任务，入库高峰时浏览请求不必等待 bulk 任务完成。
+队列已满时 submit() 抛出 QueueFull，路由据此返回 503 和 Retry-After。
+"""
+import math
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import metrics
+
+INTERACTIVE = 'interactive'
+BULK = 'bulk'
+PRIORITIES = (INTERACTIVE, BULK)
+
+# 线程数和队列长度都是每个进程的；默认由各 gunicorn worker 均分CPU核数，整机的图像线程总数不超过核数
+WORKER_PROCESSES = max(1, int(os.environ.get('GUNICORN_WORKERS', '1')))
+
+
+def default_workers(processes):
+    """每个进程的图像线程数：IMAGING_WORKERS，未设置时为 CPU核数 / 进程数"""
+    return int(os.environ.get('IMAGING_WORKERS', str(max(1, (os.cpu_count() or 1) // max(1, processes)))))
+
+
+IMAGING_WORKERS = default_workers(WORKER_PROCESSES)
+IMAGING_QUEUE_SIZE = int(os.environ.get('IMAGING_QUEUE_SIZE', '64'))
+
+
+class QueueFull(Exception):
+    """队列已满，retry_after 为建议的重试等待秒数"""
+
+    def __init__(self, priority, retry_after):
+        super().__init__(f"Imaging queue is full ({priority})")
+        self.priority = priority
+        self.retry_after = retry_after
+
+
+class PriorityPool:
+    """两级优先级线程池，每个优先级的排队任务数分别限制为 queue_size"""
+
+    def __init__(self, workers=IMAGING_WORKERS, queue_size=IMAGING_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._set_workers(workers)
+        self._queues = {priority: deque() for priority in PRIORITIES}
+        self._active = {priority: 0 for priority in PRIORITIES}
+        self._rejected = {priority: 0 for priority in PRIORITIES}
+        # 每个优先级任务执行耗时的指数滑动平均，用于估算 Retry-After
+        self._run_seconds = {priority: 0.0 for priority in PRIORITIES}
+        self._cond = threading.Condition()
+        self._threads = []
+
+    def _set_workers(self, workers):
+        # 至少两个线程：bulk 任务占满时仍有一个线程处理 interactive 任务
+        self.workers = max(2, workers)
+        self.bulk_slots = self.workers - 1
+
+    def resize(self, workers):
+        """调整线程数，只能在首次提交任务之前调用（如 gunicorn fork 出 worker 之后）"""
+        with self._cond:
+            if self._threads:
+                raise RuntimeError('Cannot resize the imaging pool after it has started')
+            self._set_workers(workers)
+
+    def _start(self):
+        # 在首次提交时启动线程，gunicorn preload 模式下线程不会在 fork 前创建
+        if len(self._threads) < self.workers:
+            for k in range(len(self._threads), self.workers):
+                thread = threading.Thread(target=self._worker, name=f'imaging-{k}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _retry_after(self, priority):
+        depth = sum(len(queue) for queue in self._queues.values())
+        slots = self.workers if priority == INTERACTIVE else self.bulk_slots
+        estimate = math.ceil(depth / slots * (self._run_seconds[priority] or 1.0))
+        return max(1, estimate)
+
+    def submit(self, priority, fn, *args, **kwargs):
+        """提交任务，返回 Future；该优先级的队列已满时抛出 QueueFull"""
+        if priority not in self._queues:
+            raise ValueError(f"Unknown priority: {priority}")
+        future = Future()
+        with self._cond:
+            self._start()
+            queue = self._queues[priority]
+            if len(queue) >= self.queue_size:
+                self._rejected[priority] += 1
+                raise QueueFull(priority, self._retry_after(priority))
+            queue.append((future, fn, args, kwargs, time.perf_counter()))
+            self._cond.notify()
+        return future
+
+    def run(self, priority, fn, *args, **kwargs):
+        """提交任务并等待结果，任务中的异常原样抛出"""
+        return self.submit(priority, fn, *args, **kwargs).result()
+
+    def _next_task(self):
+        while True:
+            if self._queues[INTERACTIVE]:
+                return INTERACTIVE, self._queues[INTERACTIVE].popleft()
+            if self._queues[BULK] and self._active[BULK] < self.bulk_slots:
+                return BULK, self._queues[BULK].popleft()
+            self._cond.wait()
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                priority, (future, fn, args, kwargs, enqueued) = self._next_task()
+                self._active[priority] += 1
+            started = time.perf_counter()
+            metrics.record(f'imaging.wait.{priority}', started - enqueued)
+            try:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(fn(*args, **kwargs))
+                    except BaseException as e:
+                        future.set_exception(e)
+            finally:
+                elapsed = time.perf_counter() - started
+                metrics.record(f'imaging.run.{priority}', elapsed)
+                with self._cond:
+                    self._active[priority] -= 1
+                    previous = self._run_seconds[priority]
+                    self._run_seconds[priority] = elapsed if not previous else previous * 0.8 + elapsed * 0.2
+                    # bulk 线程释放后可能有 bulk 任务可以开始
+                    self._cond.notify_all()
+
+    def stats(self):
+        now = time.perf_counter()
+        with self._cond:
+            return {
+                'workers': self.workers,
+                'bulk_slots': self.bulk_slots,
+                'queue_size': self.queue_size,
+                'queues': {
+                    priority: {
+                        'depth': len(queue),
+                        'active': self._active[priority],
+                        'rejected': self._rejected[priority],
+                        'oldest_wait_ms': round((now - queue[0][4]) * 1000, 3) if queue else 0.0,
+                        'mean_run_ms': round(self._run_seconds[priority] * 1000, 3),
+                    }
+                    for priority, queue in self._queues.items()
+                },
+            }
+
+
+imaging_pool = PriorityPool()
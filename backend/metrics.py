@@ -0,0 +1,38 @@
+"""进程内性能指标：记录各类操作的次数、耗时和字节数"""
+import threading
+from collections import defaultdict
+
+_lock = threading.Lock()
+_stats = defaultdict(lambda: {'count': 0, 'seconds': 0.0, 'bytes': 0, 'max_seconds': 0.0})
+
+
+def record(name, seconds, nbytes=0):
+    """记录一次操作"""
+    with _lock:
+        item = _stats[name]
+        item['count'] += 1
+        item['seconds'] += seconds
+        item['bytes'] += nbytes
+        item['max_seconds'] = max(item['max_seconds'], seconds)
+
+
+def snapshot():
+    """返回当前指标的副本，附带平均耗时和平均字节数"""
+    with _lock:
+        result = {}
+        for name, item in _stats.items():
+            count = item['count']
+            result[name] = {
+                'count': count,
+                'total_ms': round(item['seconds'] * 1000, 3),
+                'mean_ms': round(item['seconds'] * 1000 / count, 3) if count else 0.0,
+                'max_ms': round(item['max_seconds'] * 1000, 3),
+                'bytes': item['bytes'],
+                'mean_bytes': item['bytes'] // count if count else 0,
+            }
+        return result
+
+
+def reset():
+    with _lock:
+        _stats.clear()
@@ -4,8 +4,12 @@ from datetime import datetime
 class Study(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     study_uid = db.Column(db.String(64), unique=True, nullable=False)
-    patient_name = db.Column(db.String(100))
-    study_date = db.Column(db.Date)
+    patient_name = db.Column(db.String(100), index=True)
+    study_date = db.Column(db.Date, index=True)
+    # 检索用的头部字段，见 /api/search
+    patient_id = db.Column(db.String(64), index=True)
+    accession_number = db.Column(db.String(64), index=True)
+    study_description = db.Column(db.String(200), index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     series = db.relationship('Series', backref='study', lazy=True)
 
@@ -14,15 +18,27 @@ class Series(db.Model):
     series_uid = db.Column(db.String(64), unique=True, nullable=False)
     series_number = db.Column(db.Integer)
     modality = db.Column(db.String(20))
-    study_id = db.Column(db.Integer, db.ForeignKey('study.id'), nullable=False)
+    series_description = db.Column(db.String(200), index=True)
+    study_id = db.Column(db.Integer, db.ForeignKey('study.id'), nullable=False, index=True)
+    histogram = db.deferred(db.Column(db.JSON))  # 各实例直方图合并得到的序列直方图
     instances = db.relationship('Instance', backref='series', lazy=True)
 
+    # 按模态检索时只扫描该索引
+    __table_args__ = (db.Index('ix_series_modality_study', 'modality', 'study_id'),)
+
 class Instance(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     instance_uid = db.Column(db.String(64), unique=True, nullable=False)
     instance_number = db.Column(db.Integer)
     image_path = db.Column(db.String(500))
-    series_id = db.Column(db.Integer, db.ForeignKey('series.id'), nullable=False)
+    dicom_path = db.Column(db.String(500))  # 上传的原始DICOM文件
+    width = db.Column(db.Integer)   # 全分辨率图像尺寸
+    height = db.Column(db.Integer)
+    window_center = db.Column(db.Float)  # DICOM 标签中的窗宽窗位
+    window_width = db.Column(db.Float)
+    histogram = db.deferred(db.Column(db.JSON))  # modality 值直方图，见 windowing.py
+    header = db.deferred(db.Column(db.JSON))  # HEADER_TAGS 中配置的头部字段
+    series_id = db.Column(db.Integer, db.ForeignKey('series.id'), nullable=False, index=True)
     annotations = db.relationship('Annotation', backref='instance', lazy=True)
 
 class Annotation(db.Model):
@@ -30,5 +46,7 @@ class Annotation(db.Model):
     shape_type = db.Column(db.String(20), nullable=False)  # rectangle, circle, ellipse
     coordinates = db.Column(db.JSON, nullable=False)  # 存储坐标数据
     label = db.Column(db.String(100))
+    color = db.Column(db.String(20), default='red')  # 添加颜色字段
+    line_width = db.Column(db.Integer, default=2)    # 添加线宽字段
     instance_id = db.Column(db.Integer, db.ForeignKey('instance.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
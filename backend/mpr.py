@@ -0,0 +1,227 @@
+"""多平面重建（MPR）
+
+从缓存的序列体数据（见 volume.py）中提取轴位、冠状位、矢状位及斜切面，
+应用窗宽窗位后编码为图像。正交平面直接取内存映射数组的跨步视图，仅沿层方向插值以校正体素纵横比；
+斜切面使用三线性插值。最近使用的平面按 LRU 缓存编码结果。
+"""
+import os
+import threading
+from collections import OrderedDict
+
+from image_encoding import encode_image
+from volume import open_volume
+from windowing import apply_window, compute_histogram, percentile_window
+
+PLANES = ('axial', 'coronal', 'sagittal', 'oblique')
+MPR_CACHE_SIZE = int(os.environ.get('MPR_CACHE_SIZE', '256'))
+
+
+class MPRError(Exception):
+    """MPR 参数无效"""
+
+
+class PlaneCache:
+    """线程安全的 LRU 缓存，保存编码后的平面图像"""
+
+    def __init__(self, max_entries=MPR_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / total if total else 0.0,
+            }
+
+
+plane_cache = PlaneCache()
+
+# 按 (series_uid, version) 缓存已打开的内存映射，避免每次请求重新打开文件
+_volumes = OrderedDict()
+_volumes_lock = threading.Lock()
+_MAX_OPEN_VOLUMES = 8
+
+
+def get_volume(folder, meta):
+    key = (meta['series_uid'], meta['version'])
+    with _volumes_lock:
+        volume = _volumes.get(key)
+        if volume is None:
+            volume = open_volume(folder, meta)
+            _volumes[key] = volume
+            while len(_volumes) > _MAX_OPEN_VOLUMES:
+                _volumes.popitem(last=False)
+        _volumes.move_to_end(key)
+        return volume
+
+
+def plane_count(meta, plane):
+    """某方向上的平面数量"""
+    depth, rows, columns = meta['shape']
+    return {'axial': depth, 'coronal': rows, 'sagittal': columns}.get(plane)
+
+
+def _resample_rows(plane, row_spacing, col_spacing):
+    """沿第0轴线性插值，使输出像素为正方形"""
+    import numpy as np
+    rows = plane.shape[0]
+    target = max(1, int(round(rows * row_spacing / col_spacing)))
+    if target == rows:
+        return np.asarray(plane, dtype=np.float32)
+    positions = np.linspace(0, rows - 1, target, dtype=np.float32)
+    lower = np.floor(positions).astype(np.intp)
+    upper = np.minimum(lower + 1, rows - 1)
+    weight = (positions - lower)[:, None]
+    out = plane[lower].astype(np.float32)
+    out *= 1 - weight
+    out += plane[upper] * weight
+    return out
+
+
+def extract_orthogonal(volume, meta, plane, index):
+    """提取正交平面，返回 (二维 float32 数组, 像素间距)
+
+    冠状位和矢状位的层方向翻转，使头侧位于图像上方。
+    """
+    import numpy as np
+    slice_spacing, row_spacing, col_spacing = meta['spacing']
+    count = plane_count(meta, plane)
+    if not 0 <= index < count:
+        raise MPRError(f"Index out of range for {plane} plane (0-{count - 1})")
+
+    if plane == 'axial':
+        return np.asarray(volume[index], dtype=np.float32), [row_spacing, col_spacing]
+    if plane == 'coronal':
+        view = volume[::-1, index, :]
+        return _resample_rows(view, slice_spacing, col_spacing), [col_spacing, col_spacing]
+    view = volume[::-1, :, index]
+    return _resample_rows(view, slice_spacing, row_spacing), [row_spacing, row_spacing]
+
+
+def extract_oblique(volume, meta, normal, offset=0.0, size=None):
+    """提取经过体数据中心（沿法向偏移 offset 毫米）的斜切面，三线性插值
+
+    normal 为体数据坐标系 (层, 行, 列) 中的法向量。返回 (二维 float32 数组, 像素间距)。
+    """
+    import numpy as np
+    spacing = np.array(meta['spacing'], dtype=np.float64)
+    shape = np.array(meta['shape'])
+    normal = np.asarray(normal, dtype=np.float64)
+    norm = np.linalg.norm(normal)
+    if normal.shape != (3,) or norm == 0:
+        raise MPRError('Oblique plane requires a non-zero normal with 3 components')
+    normal /= norm
+
+    if (shape < 2).any():
+        raise MPRError('Oblique plane requires at least 2 voxels along each axis')
+
+    # 平面内的两个正交方向：列方向取列轴在平面上的投影，法向接近列轴时改用行轴，
+    # 这样 normal=1,0,0 时输出与轴位图像方向一致
+    col_axis = np.array([0, 0, 1.0]) if abs(normal[2]) < 0.9 else np.array([0, 1.0, 0])
+    v = col_axis - np.dot(col_axis, normal) * normal
+    v /= np.linalg.norm(v)
+    u = np.cross(v, normal)
+
+    step = float(spacing.min())
+    extent = shape * spacing
+    size = size or int(np.ceil(np.linalg.norm(extent) / step))
+    center = (shape - 1) * spacing / 2 + normal * offset
+
+    grid = (np.arange(size, dtype=np.float64) - (size - 1) / 2) * step
+    # 每个采样点的体素坐标 (3, size, size)
+    points = (center[:, None, None]
+              + u[:, None, None] * grid[None, :, None]
+              + v[:, None, None] * grid[None, None, :]) / spacing[:, None, None]
+
+    limit = (shape - 1)[:, None, None]
+    inside = np.all((points >= 0) & (points <= limit), axis=0)
+    lower = np.clip(np.floor(points), 0, limit - 1).astype(np.intp)
+    frac = np.clip(points - lower, 0, 1).astype(np.float32)
+    z, y, x = lower
+    fz, fy, fx = frac
+
+    out = np.zeros((size, size), dtype=np.float32)
+    for dz in (0, 1):
+        wz = fz if dz else 1 - fz
+        for dy in (0, 1):
+            wy = fy if dy else 1 - fy
+            for dx in (0, 1):
+                wx = fx if dx else 1 - fx
+                out += volume[z + dz, y + dy, x + dx] * (wz * wy * wx)
+
+    out[~inside] = float(volume[0].min())
+    return out, [step, step]
+
+
+def render_plane(folder, meta, plane, index=None, window=None, fmt='png', normal=None, offset=0.0,
+                 default_window=None, runner=None):
+    """提取、窗宽窗位并编码一个平面，返回 (图像字节, 平面信息)；结果按 LRU 缓存
+
+    未指定窗口时调用 default_window() 取序列的默认窗口（只在未命中缓存时调用），
+    返回 None 或未提供时按平面数据的百分位计算。
+    runner(func, *args) 用于在线程池中执行未命中缓存时的计算，命中缓存时直接返回。
+    """
+    if plane not in PLANES:
+        raise MPRError(f"Invalid plane. Must be one of: {list(PLANES)}")
+    if plane != 'oblique' and index is None:
+        index = plane_count(meta, plane) // 2
+
+    key = (meta['series_uid'], meta['version'], plane, index, window, fmt,
+           tuple(normal) if normal is not None else None, offset)
+    cached = plane_cache.get(key)
+    if cached is not None:
+        return cached
+
+    # 默认窗口随切片变化，而切片变化时体数据版本随之变化，因此缓存键中记为 None 即可
+    effective = window or (default_window() if default_window else None)
+    args = (folder, meta, plane, index, effective, fmt, normal, offset)
+    result = runner(_render, *args) if runner else _render(*args)
+    plane_cache.put(key, result)
+    return result
+
+
+def _render(folder, meta, plane, index, window, fmt, normal, offset):
+    from PIL import Image
+    volume = get_volume(folder, meta)
+    if plane == 'oblique':
+        if normal is None:
+            raise MPRError('Oblique plane requires normal=z,y,x')
+        data, pixel_spacing = extract_oblique(volume, meta, normal, offset)
+    else:
+        data, pixel_spacing = extract_orthogonal(volume, meta, plane, index)
+
+    center, width = window or percentile_window(compute_histogram(data))
+    pixels = apply_window(data, center, width)
+    encoded = encode_image(Image.fromarray(pixels, mode='L'), fmt)
+    info = {
+        'plane': plane,
+        'index': index,
+        'count': plane_count(meta, plane),
+        'pixel_spacing': pixel_spacing,
+        'window': [center, width],
+    }
+    return encoded, info
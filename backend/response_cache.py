@@ -0,0 +1,264 @@
+"""列表接口（studies/series/instances/tree）的响应缓存
+
+缓存整段 JSON 响应体，键为请求路径和查询参数，条目有过期时间（TTL），进程内后端按 LRU 限制条目数。
+
+失效采用标签版本号：每个响应登记它依赖的标签（如 study:3、series:7），写操作对相关标签的版本号加一，
+读取时版本号不一致的条目视为过期。版本号在执行视图函数之前读取，视图执行期间发生的写操作
+会使刚写入的条目立即过期，不会缓存到旧数据。
+
+默认使用进程内后端。多个 gunicorn worker 时条目仍保存在各进程内，标签版本号保存在共享的 SQLite 文件中
+（SharedVersions，默认与图像访问索引同一文件），任一 worker 的写操作使所有 worker 中的相关条目失效，
+有效期保持配置的值。
+设置 RESPONSE_CACHE_URL=redis://... 后条目和版本号保存在 Redis 中（需要安装 redis 包），
+各 worker 共享同一份缓存；此时条目数上限由 Redis 的 maxmemory 和 allkeys-lru 策略控制。
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, make_response, request
+
+logger = logging.getLogger(__name__)
+
+REDIS_PREFIX = 'esi:response:'
+
+
+class SharedVersions:
+    """保存在 SQLite 文件中的标签版本号，供同一台机器上的多个 worker 进程共享
+
+    每个线程使用自己的连接；fork 之后子进程重新连接，不复用父进程的连接。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        conn = sqlite3.connect(path, timeout=30)
+        try:
+            with conn:
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute('CREATE TABLE IF NOT EXISTS cache_tags ('
+                             'tag TEXT PRIMARY KEY, version INTEGER NOT NULL)')
+        finally:
+            conn.close()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def versions(self, tags):
+        rows = dict(self._connection().execute(
+            f"SELECT tag, version FROM cache_tags WHERE tag IN ({','.join('?' * len(tags))})", tags))
+        return [rows.get(tag, 0) for tag in tags]
+
+    def bump(self, tags):
+        conn = self._connection()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.executemany('INSERT INTO cache_tags VALUES (?, 1) '
+                             'ON CONFLICT (tag) DO UPDATE SET version = version + 1', [(tag,) for tag in tags])
+
+
+class LocalBackend:
+    """进程内后端：OrderedDict 实现 LRU；标签版本号保存在字典中，或由 shared 在进程间共享"""
+
+    def __init__(self, max_entries, shared=None):
+        self.max_entries = max_entries
+        self.shared = shared
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def versions(self, tags):
+        if self.shared:
+            return self.shared.versions(tags)
+        with self._lock:
+            return [self._versions.get(tag, 0) for tag in tags]
+
+    def bump(self, tags):
+        if self.shared:
+            self.shared.bump(tags)
+            return
+        with self._lock:
+            for tag in tags:
+                self._versions[tag] = self._versions.get(tag, 0) + 1
+
+    def size(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class RedisBackend:
+    """Redis 后端：条目以带过期时间的键保存，标签版本号用 INCR 维护"""
+
+    def __init__(self, client, prefix=REDIS_PREFIX):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        return self.client.get(self.prefix + 'entry:' + key)
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + 'entry:' + key, value, ex=max(1, int(ttl)))
+
+    def versions(self, tags):
+        values = self.client.mget([self.prefix + 'tag:' + tag for tag in tags])
+        return [int(value) if value is not None else 0 for value in values]
+
+    def bump(self, tags):
+        pipe = self.client.pipeline(transaction=False)
+        for tag in tags:
+            pipe.incr(self.prefix + 'tag:' + tag)
+        pipe.execute()
+
+    def size(self):
+        return None
+
+
+class ResponseCache:
+    """带标签失效的响应缓存，统计本进程的命中情况
+
+    后端出错（如 Redis 不可用）时按未命中处理，请求直接访问数据库。
+    """
+
+    def __init__(self, backend, ttl):
+        self.backend = backend
+        self.ttl = ttl
+        self._stats = {'hits': 0, 'misses': 0, 'stale': 0, 'invalidations': 0, 'errors': 0}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.ttl > 0
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    @staticmethod
+    def _stamp(versions):
+        return ','.join(str(v) for v in versions).encode()
+
+    def lookup(self, key, tags):
+        """返回 (响应体或None, 当前标签版本号)，版本号用于随后的 store()"""
+        try:
+            versions = self.backend.versions(tags)
+            value = self.backend.get(key)
+        except Exception as e:
+            logger.warning(f"Response cache lookup failed: {e}")
+            self._count('errors')
+            return None, None
+        if value is not None:
+            stamp, body = value.split(b'\n', 1)
+            if stamp == self._stamp(versions):
+                self._count('hits')
+                return body, versions
+            self._count('stale')
+        self._count('misses')
+        return None, versions
+
+    def store(self, key, versions, body):
+        try:
+            self.backend.set(key, self._stamp(versions) + b'\n' + body, self.ttl)
+        except Exception as e:
+            logger.warning(f"Response cache store failed: {e}")
+            self._count('errors')
+
+    def invalidate(self, tags):
+        tags = list(dict.fromkeys(tags))
+        try:
+            self.backend.bump(tags)
+        except Exception as e:
+            # 无法失效时其他 worker 的缓存最多滞后一个 TTL
+            logger.error(f"Response cache invalidation failed for {tags}: {e}")
+            self._count('errors')
+            return
+        with self._lock:
+            self._stats['invalidations'] += len(tags)
+
+    def stats(self):
+        with self._lock:
+            result = dict(self._stats)
+        lookups = result['hits'] + result['misses']
+        result['hit_ratio'] = result['hits'] / lookups if lookups else 0.0
+        result['entries'] = self.backend.size()
+        result['ttl'] = self.ttl
+        if isinstance(self.backend, RedisBackend):
+            result['backend'] = 'redis'
+        else:
+            result['backend'] = 'local+shared-versions' if self.backend.shared else 'local'
+        return result
+
+
+def create_response_cache(url=None, ttl=30, max_entries=512, processes=1, versions_path=None):
+    """按配置创建缓存；配置了 Redis 但不可用时退回进程内后端
+
+    processes 为 worker 进程数，大于1时进程内后端的标签版本号保存在 versions_path（SQLite 文件）中，
+    使写操作对所有 worker 生效。
+    """
+    if url:
+        try:
+            import redis
+            return ResponseCache(RedisBackend(redis.Redis.from_url(url)), ttl)
+        except ImportError:
+            logger.warning('RESPONSE_CACHE_URL requires the redis package, using the in-process cache')
+    shared = None
+    if processes > 1 and ttl > 0:
+        if not versions_path:
+            raise ValueError('versions_path is required for the in-process cache with several worker processes')
+        shared = SharedVersions(versions_path)
+    return ResponseCache(LocalBackend(max_entries, shared), ttl)
+
+
+def cached_response(tags):
+    """缓存 GET 接口的 JSON 响应，tags 根据视图参数返回该响应依赖的标签列表
+
+    只缓存状态码为200的响应，命中与否通过 X-Cache 响应头标出。
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            cache = current_app.extensions['response_cache']
+            if not cache.enabled:
+                return view(**kwargs)
+
+            key = request.full_path
+            body, versions = cache.lookup(key, tags(**kwargs))
+            if body is not None:
+                response = current_app.response_class(body, mimetype='application/json')
+                response.headers['X-Cache'] = 'HIT'
+                return response
+
+            response = make_response(view(**kwargs))
+            if response.status_code == 200 and versions is not None:
+                cache.store(key, versions, response.get_data())
+            response.headers['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+    return decorator
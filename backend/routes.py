@@ -0,0 +1,1048 @@
+"""API 路由"""
+from flask import Blueprint, Response, current_app, request, jsonify, send_file, send_from_directory
+import os
+import traceback
+from werkzeug.utils import secure_filename, safe_join
+from datetime import datetime
+import logging
+import time
+import uuid
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.exc import StaleDataError
+
+import metrics
+from cine import VARIANTS, CineError, frame_order, stream_frames
+from database import db
+from decoders import DecodeError, available_decoders
+from dicom_utils import (
+    backfill_image_sets, create_image_set, create_test_image, extract_dicom_info,
+    image_set_paths, read_histogram, restore_image_set
+)
+from imaging_pool import BULK, INTERACTIVE, QueueFull, imaging_pool
+from image_encoding import FORMATS, create_variant, negotiate_format, remove_variants, variant_path
+from models import Study, Series, Instance, Annotation
+from mpr import MPRError, plane_cache, render_plane
+from response_cache import cached_response
+from search import FILTERS, SearchError, search_studies
+from storage import find_original, remove_original, schedule_compression
+from volume import VolumeError, build_volume, current_volume_meta, public_meta, remove_volume, volume_paths
+from windowing import common_tag_window, default_window, dicom_window, merge_histograms, suggest_windows
+
+logger = logging.getLogger(__name__)
+
+bp = Blueprint('api', __name__)
+
+def instance_image_fields(instance):
+    """实例的多分辨率图像URL，客户端可先显示预览图再切换到全分辨率"""
+    urls = {
+        name: f"/static/images/{os.path.basename(path)}"
+        for name, path in image_set_paths(instance.image_path).items()
+    }
+    return {
+        'image_url': urls['full'],
+        'preview_url': urls['preview'],
+        'thumbnail_url': urls['thumbnail'],
+        'images': urls,
+        'width': instance.width,
+        'height': instance.height
+    }
+
+def remove_instance_images(instance):
+    """删除实例的图像、缩略图及其各格式缓存，以及原始DICOM"""
+    remove_original(instance.dicom_path)
+    if not instance.image_path:
+        return
+    removed = []
+    for path in image_set_paths(instance.image_path).values():
+        removed.extend(variant_path(path, fmt) for fmt in FORMATS)
+        remove_variants(path)
+    artifact_index().discard(removed)
+
+def artifact_index():
+    return current_app.extensions['artifact_index']
+
+def study_tag(study_id):
+    return f'study:{study_id}'
+
+def series_tag(series_id):
+    return f'series:{series_id}'
+
+def invalidate_listings(*tags):
+    """写操作提交后使相关的列表缓存失效，树状结构包含全部数据，总是失效
+
+    标签：'studies' 为研究列表，study:<id> 为该研究的序列列表，series:<id> 为该序列的实例列表。
+    """
+    current_app.extensions['response_cache'].invalidate(['tree', *tags])
+
+def regenerate_image_set(filename):
+    """图像被淘汰后按需重新生成：全分辨率图仍在时只补齐预览图和缩略图，否则从原始DICOM重新转换"""
+    name = os.path.splitext(os.path.basename(filename))[0]
+    for suffix in ('_preview', '_thumb'):
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+    instance = Instance.query.filter_by(instance_uid=name).first()
+    if not instance or not instance.image_path:
+        return False
+    
+    start = time.perf_counter()
+    paths = imaging_pool.run(INTERACTIVE, restore_image_set, instance.image_path, instance.dicom_path)
+    if paths is None:
+        return False
+    artifact_index().add(paths.values())
+    artifact_index().evict(protect=paths.values())
+    metrics.record('storage.regenerate', time.perf_counter() - start)
+    logger.info(f"Regenerated images for instance {instance.instance_uid}")
+    return True
+
+def get_or_create(model, uid_field, uid, **fields):
+    """按UID查询研究或序列，不存在时创建，返回 (记录, 是否新建)
+
+    同一序列的切片并发上传时可能同时创建同一条记录，唯一约束冲突时回滚并使用先提交的记录。
+    """
+    record = model.query.filter_by(**{uid_field: uid}).first()
+    if record:
+        return record, False
+    record = model(**{uid_field: uid}, **fields)
+    db.session.add(record)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return model.query.filter_by(**{uid_field: uid}).one(), False
+    return record, True
+
+def schedule_backfill(image_paths):
+    """按入库优先级在后台检查一批实例，补齐缺失的预览图或缩略图；队列已满时跳过"""
+    image_paths = [path for path in image_paths if path]
+    if not image_paths:
+        return
+    try:
+        imaging_pool.submit(BULK, backfill_image_sets, image_paths)
+    except QueueFull:
+        pass
+
+@bp.errorhandler(QueueFull)
+def imaging_queue_full(e):
+    """图像线程池队列已满，提示客户端稍后重试"""
+    logger.warning(f"Rejected {request.method} {request.path}: {e}")
+    response = jsonify({'error': 'Server is busy processing images, please retry later',
+                        'retry_after': e.retry_after})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
+# 路由
+@bp.route('/static/images/<path:filename>')
+def serve_image(filename):
+    """返回图像，按 ?format= 参数或 Accept 头协商输出格式，编码结果与PNG并列缓存
+
+    图像被磁盘预算淘汰时从原始DICOM重新生成。
+    """
+    start = time.perf_counter()
+    name_without_ext, ext = os.path.splitext(filename)
+    if ext.lower() != '.png':
+        return send_from_directory(current_app.config['IMAGE_FOLDER'], filename)
+    
+    fmt = negotiate_format(request.args.get('format'), request.accept_mimetypes,
+                           thumbnail=name_without_ext.endswith('_thumb'))
+    if fmt is None:
+        return jsonify({'error': f'Unsupported image format. Must be one of: {list(FORMATS)}'}), 400
+    
+    source_path = safe_join(current_app.config['IMAGE_FOLDER'], filename)
+    if source_path is None:
+        return jsonify({'error': 'Image not found'}), 404
+    target_path = variant_path(source_path, fmt)
+    if not os.path.exists(target_path):
+        try:
+            if not os.path.exists(source_path) and not regenerate_image_set(filename):
+                return jsonify({'error': 'Image not found'}), 404
+        except DecodeError as e:
+            logger.error(f"Failed to regenerate {filename}: {e}")
+            return jsonify({'error': f'Unable to decode pixel data: {e}'}), 422
+        if fmt != 'png':
+            imaging_pool.run(INTERACTIVE, create_variant, source_path, fmt)
+            artifact_index().add([target_path])
+            artifact_index().evict(protect=[source_path, target_path])
+    filename = os.path.relpath(target_path, current_app.config['IMAGE_FOLDER'])
+    
+    response = send_from_directory(current_app.config['IMAGE_FOLDER'], filename)
+    response.vary.add('Accept')
+    artifact_index().touch(os.path.basename(target_path))
+    metrics.record(f'serve.{fmt}', time.perf_counter() - start, response.content_length or 0)
+    return response
+
+@bp.route('/api/upload', methods=['POST'])
+def upload_dicom():
+    """上传DICOM文件"""
+    if 'file' not in request.files:
+        return jsonify({'error': 'No file uploaded'}), 400
+    
+    file = request.files['file']
+    if file.filename == '':
+        return jsonify({'error': 'No file selected'}), 400
+    
+    if not file.filename.lower().endswith('.dcm'):
+        return jsonify({'error': 'Please upload a DICOM file (.dcm)'}), 400
+    
+    filename = secure_filename(file.filename)
+    # 临时文件名加随机前缀，并发上传同名文件时不会互相覆盖
+    file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], f"{uuid.uuid4().hex}_{filename}")
+    
+    try:
+        file.save(file_path)
+    except Exception as e:
+        return jsonify({'error': f'Failed to save file: {str(e)}'}), 500
+    
+    try:
+        info, dicom_data = extract_dicom_info(file_path, current_app.config['HEADER_TAGS'])
+        
+        # 新实例先解码生成图像，无法解码时拒绝上传，不写入任何数据库记录
+        instance = Instance.query.filter_by(instance_uid=info['instance_uid']).first()
+        if not instance:
+            image_path = os.path.join(current_app.config['IMAGE_FOLDER'], f"{info['instance_uid']}.png")
+            try:
+                # 一次解码生成全分辨率图、预览图和缩略图，在图像线程池中按入库优先级执行
+                paths, (width, height), histogram = imaging_pool.run(BULK, create_image_set, dicom_data, image_path)
+            except DecodeError as e:
+                logger.warning(f"Rejected {filename}: {e}")
+                os.remove(file_path)
+                return jsonify({'error': f'Unable to decode pixel data: {e}'}), 422
+            except QueueFull:
+                os.remove(file_path)
+                raise
+        
+        # 检查是否已存在
+        study_date = None
+        if info['study_date'] and info['study_date'] != 'Unknown':
+            try:
+                study_date = datetime.strptime(info['study_date'], '%Y%m%d').date()
+            except:
+                study_date = datetime.now().date()
+        else:
+            study_date = datetime.now().date()
+        
+        study, created = get_or_create(
+            Study, 'study_uid', info['study_uid'],
+            patient_name=info['patient_name'],
+            study_date=study_date,
+            patient_id=info['patient_id'],
+            accession_number=info['accession_number'],
+            study_description=info['study_description']
+        )
+        if created:
+            invalidate_listings('studies', study_tag(study.id))
+        
+        series, created = get_or_create(
+            Series, 'series_uid', info['series_uid'],
+            series_number=info['series_number'],
+            modality=info['modality'],
+            series_description=info['series_description'],
+            study_id=study.id
+        )
+        if created:
+            # 研究列表中的序列数随之变化
+            invalidate_listings('studies', study_tag(study.id), series_tag(series.id))
+        
+        if not instance:
+            window = dicom_window(dicom_data) or (None, None)
+            first_in_series = not series.instances
+            
+            artifact_index().add(paths.values())
+            artifact_index().evict(protect=paths.values())
+            
+            # 原始文件按实例UID重命名，避免不同序列中的同名文件互相覆盖，之后在后台压缩
+            dicom_path = os.path.join(current_app.config['UPLOAD_FOLDER'], f"{info['instance_uid']}.dcm")
+            os.replace(file_path, dicom_path)
+            schedule_compression(dicom_path, current_app.config['ORIGINAL_COMPRESSION'])
+            
+            instance = Instance(
+                instance_uid=info['instance_uid'],
+                instance_number=info['instance_number'],
+                image_path=image_path,
+                dicom_path=dicom_path,
+                width=width,
+                height=height,
+                window_center=window[0],
+                window_width=window[1],
+                histogram=histogram,
+                header=info['header'],
+                series_id=series.id
+            )
+            db.session.add(instance)
+            # 将实例直方图合并到序列直方图（序列直方图缺失时留待读取时补齐）
+            if histogram and (series.histogram or first_in_series):
+                series.histogram = merge_histograms([series.histogram, histogram])
+            db.session.commit()
+            # 序列列表中的实例数随之变化
+            invalidate_listings(study_tag(study.id), series_tag(series.id))
+        else:
+            # 重复上传已有实例，保留原来的原始文件
+            os.remove(file_path)
+        
+        # 返回完整的实例信息，包括多分辨率图像URL
+        instance_data = {
+            'id': instance.id,
+            'type': 'instance',
+            'instance_uid': instance.instance_uid,
+            'instance_number': instance.instance_number,
+            **instance_image_fields(instance),
+            'annotation_count': len(instance.annotations),
+            'patient_name': study.patient_name,
+            'study_id': study.id,
+            'series_id': series.id
+        }
+        
+        return jsonify({
+            'message': 'File uploaded successfully',
+            'instance': instance_data  # 返回完整的实例信息
+        })
+        
+    except QueueFull:
+        raise
+    except Exception as e:
+        logger.error(f"Error processing DICOM file: {str(e)}")
+        logger.error(traceback.format_exc())
+        return jsonify({'error': f'Failed to process DICOM file: {str(e)}'}), 500
+
+def validate_annotation_data(data):
+    """验证标注数据"""
+    shape_type = data.get('shape_type')
+    coordinates = data.get('coordinates')
+    
+    if not shape_type or not coordinates:
+        return False, "Missing shape_type or coordinates"
+    
+    valid_shapes = ['rectangle', 'circle', 'ellipse', 'spline', 'freehand']
+    if shape_type not in valid_shapes:
+        return False, f"Invalid shape_type. Must be one of: {valid_shapes}"
+    
+    # 验证不同形状的坐标格式
+    if shape_type == 'rectangle':
+        required_keys = ['x', 'y', 'width', 'height']
+        if not all(key in coordinates for key in required_keys):
+            return False, "Rectangle requires x, y, width, height"
+    
+    elif shape_type == 'circle':
+        required_keys = ['x', 'y', 'radius']
+        if not all(key in coordinates for key in required_keys):
+            return False, "Circle requires x, y, radius"
+    
+    elif shape_type == 'ellipse':
+        required_keys = ['x', 'y', 'radiusX', 'radiusY']
+        if not all(key in coordinates for key in required_keys):
+            return False, "Ellipse requires x, y, radiusX, radiusY"
+    
+    elif shape_type == 'spline':
+        # 样条曲线：点数组
+        if not isinstance(coordinates, dict) or 'points' not in coordinates:
+            return False, "Spline requires points array"
+        if not isinstance(coordinates['points'], list) or len(coordinates['points']) < 3:
+            return False, "Spline requires at least 3 points"
+    
+    elif shape_type == 'freehand':
+        # 自由手绘：点数组
+        if not isinstance(coordinates, dict) or 'points' not in coordinates:
+            return False, "Freehand requires points array"
+        if not isinstance(coordinates['points'], list) or len(coordinates['points']) < 2:
+            return False, "Freehand requires at least 2 points"
+    
+    return True, "Valid"
+
+@bp.route('/api/studies', methods=['GET'])
+@cached_response(lambda: ['studies'])
+def get_studies():
+    try:
+        studies = Study.query.all()
+        result = []
+        for study in studies:
+            result.append({
+                'id': study.id,
+                'patient_name': study.patient_name,
+                'study_date': study.study_date.isoformat() if study.study_date else None,
+                'series_count': len(study.series)
+            })
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({'error': 'Failed to get studies'}), 500
+
+@bp.route('/api/series/<int:study_id>', methods=['GET'])
+@cached_response(lambda study_id: [study_tag(study_id)])
+def get_series(study_id):
+    try:
+        series_list = Series.query.filter_by(study_id=study_id).all()
+        result = []
+        for series in series_list:
+            result.append({
+                'id': series.id,
+                'series_number': series.series_number,
+                'modality': series.modality,
+                'instance_count': len(series.instances)
+            })
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({'error': 'Failed to get series'}), 500
+
+@bp.route('/api/instances/<int:series_id>', methods=['GET'])
+@cached_response(lambda series_id: [series_tag(series_id)])
+def get_instances(series_id):
+    try:
+        instances = Instance.query.filter_by(series_id=series_id).all()
+        result = []
+        for instance in instances:
+            result.append({
+                'id': instance.id,
+                'instance_number': instance.instance_number,
+                **instance_image_fields(instance),
+                'annotation_count': len(instance.annotations)
+            })
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({'error': 'Failed to get instances'}), 500
+
+@bp.route('/api/search', methods=['GET'])
+def get_search_results():
+    """检索研究，按检查日期倒序分页返回
+
+    参数：patient_name=姓名前缀，patient_id、accession=精确匹配，date_from/date_to=检查日期范围
+    （YYYYMMDD 或 YYYY-MM-DD，包含端点），modality=包含该模态的序列，description=研究或序列描述中包含的文字，
+    description_prefix=研究或序列描述的前缀（使用索引），page=页码（从1开始），per_page=每页条数（默认50，最大200）。
+    """
+    filters = {name: request.args.get(name, '').strip() for name in FILTERS}
+    try:
+        page = int(request.args.get('page', 1))
+        per_page = int(request.args.get('per_page', 50))
+        start = time.perf_counter()
+        result = search_studies(filters, page, per_page)
+    except (SearchError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error searching studies: {e}")
+        return jsonify({'error': 'Failed to search studies'}), 500
+    metrics.record('search', time.perf_counter() - start)
+    return jsonify(result)
+
+@bp.route('/api/annotations/<int:instance_id>', methods=['POST'])
+def create_annotation(instance_id):
+    """创建标注"""
+    try:
+        data = request.json
+        
+        # 验证数据
+        is_valid, message = validate_annotation_data(data)
+        if not is_valid:
+            return jsonify({'error': message}), 400
+        
+        # 检查实例是否存在
+        instance = Instance.query.get(instance_id)
+        if not instance:
+            return jsonify({'error': 'Instance not found'}), 404
+        
+        annotation = Annotation(
+            shape_type=data['shape_type'],
+            coordinates=data['coordinates'],
+            label=data.get('label', f'{data["shape_type"].capitalize()} ROI'),
+            color=data.get('color', 'red'),
+            line_width=data.get('line_width', 2),
+            instance_id=instance_id
+        )
+        db.session.add(annotation)
+        db.session.commit()
+        # 实例列表中的标注数随之变化
+        invalidate_listings(series_tag(instance.series_id))
+        
+        return jsonify({
+            'message': 'Annotation created',
+            'id': annotation.id,
+            'annotation': {
+                'id': annotation.id,
+                'shape_type': annotation.shape_type,
+                'coordinates': annotation.coordinates,
+                'label': annotation.label,
+                'color': annotation.color,
+                'line_width': annotation.line_width
+            }
+        })
+        
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error creating annotation: {e}")
+        return jsonify({'error': f'Failed to create annotation: {str(e)}'}), 500
+
+@bp.route('/api/annotations/<int:annotation_id>', methods=['DELETE'])
+def delete_annotation(annotation_id):
+    try:
+        annotation = Annotation.query.get(annotation_id)
+        if annotation:
+            series_id = annotation.instance.series_id
+            db.session.delete(annotation)
+            db.session.commit()
+            invalidate_listings(series_tag(series_id))
+            return jsonify({'message': 'Annotation deleted'})
+        return jsonify({'error': 'Annotation not found'}), 404
+    except StaleDataError:
+        db.session.rollback()
+        return jsonify({'error': 'Annotation not found'}), 404
+    except Exception as e:
+        return jsonify({'error': 'Failed to delete annotation'}), 500
+
+@bp.route('/api/study/<int:study_id>', methods=['DELETE'])
+def delete_study(study_id):
+    """删除研究及其所有关联数据"""
+    try:
+        study = Study.query.get(study_id)
+        if not study:
+            return jsonify({'error': 'Study not found'}), 404
+        
+        tags = ['studies', study_tag(study_id)] + [series_tag(series.id) for series in study.series]
+        
+        # 删除所有相关的序列、实例和标注
+        for series in study.series:
+            for instance in series.instances:
+                # 删除实例的标注
+                for annotation in instance.annotations:
+                    db.session.delete(annotation)
+                # 删除实例文件
+                remove_instance_images(instance)
+                db.session.delete(instance)
+            remove_volume(current_app.config['VOLUME_FOLDER'], series.series_uid)
+            db.session.delete(series)
+        
+        db.session.delete(study)
+        db.session.commit()
+        invalidate_listings(*tags)
+        
+        return jsonify({'message': 'Study deleted successfully'})
+        
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error deleting study {study_id}: {e}")
+        return jsonify({'error': 'Failed to delete study'}), 500
+
+@bp.route('/api/series/<int:series_id>', methods=['DELETE'])
+def delete_series(series_id):
+    """删除序列及其所有关联数据，并清理空的Study"""
+    try:
+        series = Series.query.get(series_id)
+        if not series:
+            return jsonify({'error': 'Series not found'}), 404
+        
+        # 保存父级信息用于后续检查
+        study_id = series.study_id
+        
+        # 删除所有相关的实例和标注
+        for instance in series.instances:
+            # 删除实例的标注
+            for annotation in instance.annotations:
+                db.session.delete(annotation)
+            # 删除实例文件
+            remove_instance_images(instance)
+            db.session.delete(instance)
+        
+        remove_volume(current_app.config['VOLUME_FOLDER'], series.series_uid)
+        db.session.delete(series)
+        db.session.commit()
+        invalidate_listings('studies', study_tag(study_id), series_tag(series_id))
+        
+        # 检查Study是否为空，如果为空则删除
+        study = Study.query.get(study_id)
+        if study and len(study.series) == 0:
+            db.session.delete(study)
+            db.session.commit()
+            invalidate_listings('studies', study_tag(study_id))
+            logger.info(f"Auto-deleted empty study: {study_id}")
+        
+        return jsonify({'message': 'Series deleted successfully'})
+        
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error deleting series {series_id}: {e}")
+        return jsonify({'error': 'Failed to delete series'}), 500
+
+@bp.route('/api/instance/<int:instance_id>', methods=['DELETE'])
+def delete_instance(instance_id):
+    """删除实例及其标注，并清理空的Series和Study"""
+    try:
+        instance = Instance.query.get(instance_id)
+        if not instance:
+            return jsonify({'error': 'Instance not found'}), 404
+        
+        # 保存父级信息用于后续检查
+        series_id = instance.series_id
+        study_id = instance.series.study_id
+        
+        # 删除所有标注
+        for annotation in instance.annotations:
+            db.session.delete(annotation)
+        
+        # 删除图像文件
+        remove_instance_images(instance)
+        
+        db.session.delete(instance)
+        db.session.commit()
+        invalidate_listings(study_tag(study_id), series_tag(series_id))
+        
+        # 检查Series是否为空，如果为空则删除；否则由剩余实例重新合并序列直方图
+        series = Series.query.get(series_id)
+        if series and series.instances:
+            refresh_series_histogram(series)
+            db.session.commit()
+        if series and len(series.instances) == 0:
+            db.session.delete(series)
+            db.session.commit()
+            invalidate_listings('studies', study_tag(study_id))
+            logger.info(f"Auto-deleted empty series: {series_id}")
+            
+            # 检查Study是否为空，如果为空则删除
+            study = Study.query.get(study_id)
+            if study and len(study.series) == 0:
+                db.session.delete(study)
+                db.session.commit()
+                invalidate_listings('studies', study_tag(study_id))
+                logger.info(f"Auto-deleted empty study: {study_id}")
+        
+        return jsonify({'message': 'Instance deleted successfully'})
+        
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error deleting instance {instance_id}: {e}")
+        return jsonify({'error': 'Failed to delete instance'}), 500
+
+def instance_histogram(instance):
+    """返回实例直方图，旧数据缺少时从原始DICOM补齐并保存"""
+    if instance.histogram is None and find_original(instance.dicom_path):
+        try:
+            histogram, window = imaging_pool.run(INTERACTIVE, read_histogram, instance.dicom_path)
+        except QueueFull:
+            raise
+        except Exception as e:
+            logger.warning(f"Failed to compute histogram for instance {instance.id}: {e}")
+            return None
+        instance.histogram = histogram
+        instance.window_center, instance.window_width = window or (None, None)
+        db.session.commit()
+    return instance.histogram
+
+def refresh_series_histogram(series):
+    """由各实例直方图重新合并序列直方图（有实例缺少直方图时置空，待下次读取时补齐）"""
+    histograms = [instance.histogram for instance in series.instances]
+    series.histogram = merge_histograms(histograms) if all(histograms) else None
+
+def series_histogram(series):
+    if series.histogram is None:
+        series.histogram = merge_histograms([instance_histogram(instance) for instance in series.instances])
+        db.session.commit()
+    return series.histogram
+
+def window_response(histogram, modality, tag_windows):
+    """窗口建议：DICOM 标签窗口（多个实例取最常见的一组）、模态预设和百分位窗口"""
+    suggestions = suggest_windows(histogram, modality, common_tag_window(tag_windows))
+    window = default_window(histogram, tag_windows)
+    default = dict(zip(('name', 'center', 'width'), window)) if window else None
+    result = {'modality': modality, 'default': default, 'suggestions': suggestions}
+    if histogram and request.args.get('histogram') == '1':
+        result['histogram'] = histogram
+    return result
+
+@bp.route('/api/instance/<int:instance_id>/window', methods=['GET'])
+def get_instance_window(instance_id):
+    """根据入库时保存的直方图返回窗宽窗位建议，?histogram=1 时附带直方图"""
+    instance = Instance.query.get(instance_id)
+    if not instance:
+        return jsonify({'error': 'Instance not found'}), 404
+    histogram = instance_histogram(instance)
+    result = window_response(histogram, instance.series.modality,
+                             [(instance.window_center, instance.window_width)])
+    return jsonify({'instance_id': instance.id, **result})
+
+@bp.route('/api/instance/<int:instance_id>/header', methods=['GET'])
+def get_instance_header(instance_id):
+    """返回入库时保存的头部字段（HEADER_TAGS），旧数据在运行 reindex-headers 之前为 null"""
+    instance = Instance.query.get(instance_id)
+    if not instance:
+        return jsonify({'error': 'Instance not found'}), 404
+    return jsonify({'instance_id': instance.id, 'header': instance.header})
+
+@bp.route('/api/series/<int:series_id>/window', methods=['GET'])
+def get_series_window(series_id):
+    """根据序列直方图返回窗宽窗位建议，用于整个序列一致的显示"""
+    series = Series.query.get(series_id)
+    if not series:
+        return jsonify({'error': 'Series not found'}), 404
+    histogram = series_histogram(series)
+    result = window_response(histogram, series.modality,
+                             [(i.window_center, i.window_width) for i in series.instances])
+    return jsonify({'series_id': series.id, **result})
+
+def ensure_series_volume(series):
+    """返回序列的体数据元数据，切片有增删时增量重建
+
+    只查询实例UID和原始文件路径两列；切片集合与上次构建时相同时直接返回，不进入图像线程池。
+    """
+    slices = [tuple(row) for row in db.session.query(Instance.instance_uid, Instance.dicom_path)
+              .filter(Instance.series_id == series.id)]
+    folder = current_app.config['VOLUME_FOLDER']
+    meta = current_volume_meta(folder, series.series_uid, slices)
+    if meta is None:
+        meta = imaging_pool.run(INTERACTIVE, build_volume, folder, series.series_uid, slices)
+    return meta
+
+def series_default_window(series):
+    """序列的默认窗口 (窗位, 窗宽)，与 /api/series/<id>/window 的 default 一致"""
+    window = default_window(series_histogram(series),
+                            [(i.window_center, i.window_width) for i in series.instances])
+    return window[1:] if window else None
+
+def volume_headers(meta):
+    return {
+        'X-Volume-Shape': ','.join(str(n) for n in meta['shape']),
+        'X-Volume-Dtype': meta['dtype'],
+        'X-Volume-Spacing': ','.join(f"{s:g}" for s in meta['spacing']),
+        'X-Volume-Version': str(meta['version'])
+    }
+
+@bp.route('/api/series/<int:series_id>/volume/info', methods=['GET'])
+def get_series_volume_info(series_id):
+    """返回序列体数据的形状、类型、体素间距和切片顺序"""
+    series = Series.query.get(series_id)
+    if not series:
+        return jsonify({'error': 'Series not found'}), 404
+    try:
+        meta = ensure_series_volume(series)
+    except VolumeError as e:
+        return jsonify({'error': str(e)}), 422
+    except QueueFull:
+        raise
+    except Exception as e:
+        logger.error(f"Error building volume for series {series_id}: {e}")
+        logger.error(traceback.format_exc())
+        return jsonify({'error': 'Failed to build volume'}), 500
+    return jsonify(public_meta(meta))
+
+@bp.route('/api/series/<int:series_id>/volume', methods=['GET'])
+def get_series_volume(series_id):
+    """以二进制流返回序列体数据（小端、C顺序），支持 HTTP Range 请求
+
+    默认返回 gzip 压缩数据（application/gzip），?compress=0 返回原始字节，
+    此时第 k 层位于 k * 行 * 列 * 字节数 处，可按层进行 Range 请求。
+    """
+    series = Series.query.get(series_id)
+    if not series:
+        return jsonify({'error': 'Series not found'}), 404
+    try:
+        meta = ensure_series_volume(series)
+    except VolumeError as e:
+        return jsonify({'error': str(e)}), 422
+    except QueueFull:
+        raise
+    except Exception as e:
+        logger.error(f"Error building volume for series {series_id}: {e}")
+        logger.error(traceback.format_exc())
+        return jsonify({'error': 'Failed to build volume'}), 500
+    
+    # 数据文件按版本命名且不再修改，元数据指向的版本在发送期间不会被替换
+    paths = volume_paths(current_app.config['VOLUME_FOLDER'], series.series_uid, meta['version'])
+    if request.args.get('compress', '1') == '0':
+        response = send_file(paths['data'], mimetype='application/octet-stream', conditional=True)
+    else:
+        response = send_file(paths['compressed'], mimetype='application/gzip', conditional=True)
+    response.headers.update(volume_headers(meta))
+    return response
+
+@bp.route('/api/series/<int:series_id>/mpr', methods=['GET'])
+def get_series_mpr(series_id):
+    """从序列体数据重建并返回一个平面图像
+
+    参数：plane=axial|coronal|sagittal|oblique，index=平面序号（默认居中），
+    wc/ww=窗位/窗宽（默认取 DICOM 标签或数据范围），format=输出格式；
+    斜切面使用 normal=z,y,x（体数据坐标系中的法向量）和 offset=沿法向偏移的毫米数。
+    """
+    series = Series.query.get(series_id)
+    if not series:
+        return jsonify({'error': 'Series not found'}), 404
+
+    fmt = negotiate_format(request.args.get('format'), request.accept_mimetypes)
+    if fmt is None:
+        return jsonify({'error': f'Unsupported image format. Must be one of: {list(FORMATS)}'}), 400
+    try:
+        plane = request.args.get('plane', 'axial')
+        index = request.args.get('index', type=int)
+        wc, ww = request.args.get('wc', type=float), request.args.get('ww', type=float)
+        window = (wc, ww) if wc is not None and ww is not None else None
+        normal = request.args.get('normal')
+        if normal is not None:
+            normal = tuple(float(v) for v in normal.split(','))
+        offset = request.args.get('offset', 0.0, type=float)
+    except ValueError:
+        return jsonify({'error': 'Invalid MPR parameters'}), 400
+
+    try:
+        meta = ensure_series_volume(series)
+        start = time.perf_counter()
+        data, info = render_plane(current_app.config['VOLUME_FOLDER'], meta, plane, index,
+                                  window, fmt, normal, offset,
+                                  default_window=lambda: series_default_window(series),
+                                  runner=lambda func, *args: imaging_pool.run(INTERACTIVE, func, *args))
+        metrics.record(f'mpr.{plane}', time.perf_counter() - start, len(data))
+    except MPRError as e:
+        return jsonify({'error': str(e)}), 400
+    except VolumeError as e:
+        return jsonify({'error': str(e)}), 422
+    except QueueFull:
+        raise
+    except Exception as e:
+        logger.error(f"Error rendering {request.args.get('plane')} plane for series {series_id}: {e}")
+        logger.error(traceback.format_exc())
+        return jsonify({'error': 'Failed to render plane'}), 500
+
+    response = current_app.response_class(data, mimetype=FORMATS[fmt]['mimetype'])
+    response.headers.update({
+        'X-MPR-Plane': info['plane'],
+        'X-MPR-Index': '' if info['index'] is None else str(info['index']),
+        'X-MPR-Count': '' if info['count'] is None else str(info['count']),
+        'X-MPR-Pixel-Spacing': ','.join(f"{s:g}" for s in info['pixel_spacing']),
+        'X-MPR-Window': ','.join(f"{v:g}" for v in info['window']),
+        'X-Volume-Version': str(meta['version'])
+    })
+    response.vary.add('Accept')
+    return response
+
+@bp.route('/api/series/<int:series_id>/cine', methods=['GET'])
+def get_series_cine(series_id):
+    """在一个 multipart/mixed 响应中按顺序发送序列各层图像，用于电影播放
+
+    参数：start=起始帧序号（按实例号排序），direction=1|-1，count=帧数（默认到序列末尾），
+    size=full|preview，format=输出格式，fps=发送帧率（默认不限速），prefetch=预取帧数。
+    每一帧的序号和实例ID见各部分的 X-Frame-Index、X-Instance-Id 头。
+    """
+    series = Series.query.get(series_id)
+    if not series:
+        return jsonify({'error': 'Series not found'}), 404
+
+    fmt = negotiate_format(request.args.get('format'), request.accept_mimetypes)
+    if fmt is None:
+        return jsonify({'error': f'Unsupported image format. Must be one of: {list(FORMATS)}'}), 400
+    variant = request.args.get('size', 'full')
+    if variant not in VARIANTS:
+        return jsonify({'error': f'Invalid size. Must be one of: {list(VARIANTS)}'}), 400
+
+    instances = sorted((i for i in series.instances if i.image_path),
+                       key=lambda i: (i.instance_number is None, i.instance_number or 0, i.id))
+    # 流式响应在请求上下文之外生成，预先取出所需字段
+    frames = [{'id': i.id, 'instance_number': i.instance_number,
+               'image_path': i.image_path, 'dicom_path': i.dicom_path} for i in instances]
+    try:
+        order = frame_order(len(frames), request.args.get('start', 0, type=int),
+                            request.args.get('direction', 1, type=int), request.args.get('count', type=int))
+    except CineError as e:
+        return jsonify({'error': str(e)}), 400
+    prefetch = request.args.get('prefetch', current_app.config['CINE_PREFETCH'], type=int)
+    fps = request.args.get('fps', type=float)
+
+    boundary = uuid.uuid4().hex
+    stream = stream_frames(frames, order, variant, fmt, prefetch, fps, artifact_index(), boundary)
+    response = Response(stream, mimetype=f'multipart/mixed; boundary={boundary}')
+    response.headers['X-Cine-Count'] = str(len(order))
+    response.headers['X-Cine-Total'] = str(len(frames))
+    response.headers['Cache-Control'] = 'no-store'
+    response.vary.add('Accept')
+    return response
+
+@bp.route('/api/tree', methods=['GET'])
+@cached_response(lambda: ['tree'])
+def get_tree():
+    """获取完整的树状结构数据"""
+    try:
+        # 研究、序列、实例各一次查询，标注只查询各实例的数量
+        studies = Study.query.options(selectinload(Study.series).selectinload(Series.instances)).all()
+        annotation_counts = dict(db.session.query(Annotation.instance_id, func.count(Annotation.id))
+                                 .group_by(Annotation.instance_id))
+        result = []
+        image_paths = []
+        
+        for study in studies:
+            study_data = {
+                'id': study.id,
+                'type': 'study',
+                'study_uid': study.study_uid,
+                'patient_name': study.patient_name,
+                'study_date': study.study_date.isoformat() if study.study_date else None,
+                'children': []
+            }
+            
+            for series in study.series:
+                series_data = {
+                    'id': series.id,
+                    'type': 'series',
+                    'series_uid': series.series_uid,
+                    'series_number': series.series_number,
+                    'modality': series.modality,
+                    'children': []
+                }
+                
+                for instance in series.instances:
+                    image_paths.append(instance.image_path)
+                    instance_data = {
+                        'id': instance.id,
+                        'type': 'instance',
+                        'instance_uid': instance.instance_uid,
+                        'instance_number': instance.instance_number,
+                        **instance_image_fields(instance),
+                        'annotation_count': annotation_counts.get(instance.id, 0),
+                        'patient_name': study.patient_name
+                    }
+                    series_data['children'].append(instance_data)
+                
+                study_data['children'].append(series_data)
+            
+            result.append(study_data)
+        
+        # 旧数据可能缺少预览图或缩略图，在后台补齐（在此之前由 serve_image 按需生成）
+        schedule_backfill(image_paths)
+        return jsonify(result)
+        
+    except Exception as e:
+        logger.error(f"Error getting tree data: {e}")
+        return jsonify({'error': 'Failed to get tree data'}), 500
+
+@bp.route('/api/create-test-data', methods=['POST'])
+def create_test_data():
+    """创建测试数据"""
+    try:
+        # 创建一个测试研究
+        study = Study(
+            study_uid='1.2.3.4.5',
+            patient_name='Test Patient',
+            study_date=datetime.now().date()
+        )
+        db.session.add(study)
+        db.session.commit()
+
+        # 创建测试序列
+        series = Series(
+            series_uid='1.2.3.4.5.1',
+            series_number=1,
+            modality='CT',
+            study_id=study.id
+        )
+        db.session.add(series)
+        db.session.commit()
+
+        # 创建测试实例
+        instance = Instance(
+            instance_uid='1.2.3.4.5.1.1',
+            instance_number=1,
+            image_path='static/images/test_image.png',
+            series_id=series.id
+        )
+        db.session.add(instance)
+        db.session.commit()
+        invalidate_listings('studies', study_tag(study.id), series_tag(series.id))
+
+        return jsonify({
+            'message': 'Test data created', 
+            'study_id': study.id,
+            'instance_id': instance.id
+        })
+    
+    except Exception as e:
+        logger.error(f"Error creating test data: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """返回进程内性能指标（编码耗时、输出字节数等）"""
+    return jsonify(metrics.snapshot())
+
+@bp.route('/api/cache/stats', methods=['GET'])
+def get_cache_stats():
+    """返回本进程的缓存命中统计：列表响应缓存和 MPR 平面缓存"""
+    return jsonify({
+        'responses': current_app.extensions['response_cache'].stats(),
+        'mpr_planes': plane_cache.stats()
+    })
+
+@bp.route('/api/imaging/queue', methods=['GET'])
+def get_imaging_queue():
+    """返回图像线程池各优先级的排队数、执行数和拒绝数；等待和执行耗时见 /api/metrics 中的 imaging.*"""
+    return jsonify(imaging_pool.stats())
+
+@bp.route('/api/health', methods=['GET'])
+def health_check():
+    # 健康检查不导入图像处理库，保持冷启动后的首个探测请求轻量
+    return jsonify({
+        'status': 'healthy',
+        'timestamp': datetime.now().isoformat()
+    })
+
+@bp.route('/api/decoders', methods=['GET'])
+def get_decoders():
+    """各传输语法当前选用的解码插件，None 表示无法解码"""
+    return jsonify(available_decoders())
+
+@bp.route('/api/simple-upload', methods=['POST'])
+def simple_upload():
+    """简化的上传接口，不解析DICOM"""
+    try:
+        if 'file' not in request.files:
+            return jsonify({'error': 'No file uploaded'}), 400
+        
+        file = request.files['file']
+        if file.filename == '':
+            return jsonify({'error': 'No file selected'}), 400
+        
+        import uuid
+        # 生成唯一ID
+        file_id = str(uuid.uuid4())
+        filename = f"{file_id}.dcm"
+        file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
+        file.save(file_path)
+        
+        # 创建对应的测试图像
+        image_filename = f"{file_id}.png"
+        image_path = os.path.join(current_app.config['IMAGE_FOLDER'], image_filename)
+        
+        create_test_image(image_path)
+        
+        return jsonify({
+            'message': 'File uploaded successfully (simplified)',
+            'image_url': f"/static/images/{image_filename}",
+            'file_id': file_id
+        })
+    except Exception as e:
+        logger.error(f"Error in simple upload: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/api/annotations/<int:annotation_id>', methods=['PUT'])
+def update_annotation(annotation_id):
+    """更新标注"""
+    try:
+        annotation = Annotation.query.get(annotation_id)
+        if not annotation:
+            return jsonify({'error': 'Annotation not found'}), 404
+        
+        data = request.json
+        if 'coordinates' in data:
+            annotation.coordinates = data['coordinates']
+        if 'label' in data:
+            annotation.label = data['label']
+        if 'color' in data:
+            annotation.color = data['color']
+        if 'line_width' in data:
+            annotation.line_width = data['line_width']
+        
+        # 列表接口只包含标注数量，更新标注内容不需要使缓存失效
+        db.session.commit()
+        # 提交后不再访问 annotation 的属性：重新加载时可能已被并发删除
+        return jsonify({'message': 'Annotation updated', 'id': annotation_id})
+        
+    except StaleDataError:
+        # 读取之后被并发的删除请求删除
+        db.session.rollback()
+        return jsonify({'error': 'Annotation not found'}), 404
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error updating annotation {annotation_id}: {e}")
+        return jsonify({'error': 'Failed to update annotation'}), 500
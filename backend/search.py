@@ -0,0 +1,155 @@
+"""研究检索
+
+检索字段保存在带索引的列中：study.patient_name / patient_id / study_date / accession_number /
+study_description，series.modality / series_description。其余配置的头部字段（HEADER_TAGS）
+以 JSON 保存在 instance.header 中（延迟加载，不进入列表接口），通过 /api/instance/<id>/header 返回，
+不参与过滤。
+
+姓名按前缀匹配（LIKE 'abc%' 可以使用索引），检查号和患者ID精确匹配。描述有两种匹配方式：
+description 按包含匹配（需要扫描，10万研究约百毫秒），description_prefix 按前缀匹配，
+以范围比较使用研究描述和序列描述的索引。是否区分大小写取决于数据库：MySQL 默认排序规则均不区分，
+SQLite 的 LIKE 不区分（ASCII字符），范围比较区分。
+结果按检查日期倒序分页返回。
+"""
+import logging
+from datetime import datetime
+
+from sqlalchemy import func, or_
+
+from database import db
+from models import Instance, Series, Study
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+FILTERS = ('patient_name', 'patient_id', 'date_from', 'date_to', 'modality', 'accession', 'description',
+           'description_prefix')
+
+
+class SearchError(ValueError):
+    pass
+
+
+def parse_date(value):
+    """解析 YYYYMMDD 或 YYYY-MM-DD"""
+    for fmt in ('%Y%m%d', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    raise SearchError(f"Invalid date: {value}. Use YYYYMMDD or YYYY-MM-DD")
+
+
+def _like_escape(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _prefix_range(column, value):
+    """column 以 value 开头的条件，写成范围比较，SQLite 和 MySQL 都可以使用索引"""
+    upper = value[:-1] + chr(ord(value[-1]) + 1)
+    return (column >= value) & (column < upper)
+
+
+def build_query(filters):
+    """根据过滤条件构造研究查询，filters 为 {名称: 字符串}，空值忽略"""
+    query = Study.query
+    value = filters.get('patient_name')
+    if value:
+        query = query.filter(Study.patient_name.like(_like_escape(value) + '%', escape='\\'))
+    if filters.get('patient_id'):
+        query = query.filter(Study.patient_id == filters['patient_id'])
+    if filters.get('accession'):
+        query = query.filter(Study.accession_number == filters['accession'])
+    if filters.get('date_from'):
+        query = query.filter(Study.study_date >= parse_date(filters['date_from']))
+    if filters.get('date_to'):
+        query = query.filter(Study.study_date <= parse_date(filters['date_to']))
+    if filters.get('modality'):
+        # 子查询只扫描 series(modality, study_id) 索引，比逐个研究关联检查快
+        studies = db.session.query(Series.study_id).filter(Series.modality == filters['modality'].upper())
+        query = query.filter(Study.id.in_(studies))
+    value = filters.get('description')
+    if value:
+        pattern = '%' + _like_escape(value) + '%'
+        studies = db.session.query(Series.study_id).filter(Series.series_description.like(pattern, escape='\\'))
+        query = query.filter(or_(
+            Study.study_description.like(pattern, escape='\\'),
+            Study.id.in_(studies)
+        ))
+    value = filters.get('description_prefix')
+    if value:
+        studies = db.session.query(Series.study_id).filter(_prefix_range(Series.series_description, value))
+        query = query.filter(or_(
+            _prefix_range(Study.study_description, value),
+            Study.id.in_(studies)
+        ))
+    return query
+
+
+def search_studies(filters, page=1, per_page=DEFAULT_PAGE_SIZE):
+    """分页检索，返回 {'total', 'page', 'per_page', 'results'}"""
+    if page < 1:
+        raise SearchError('page must be >= 1')
+    if not 1 <= per_page <= MAX_PAGE_SIZE:
+        raise SearchError(f'per_page must be between 1 and {MAX_PAGE_SIZE}')
+
+    query = build_query(filters)
+    total = query.order_by(None).count()
+    studies = (query.order_by(Study.study_date.desc(), Study.id.desc())
+               .offset((page - 1) * per_page).limit(per_page).all())
+
+    # 一次查询取出本页各研究的模态和序列数
+    modalities = {study.id: {} for study in studies}
+    if studies:
+        rows = (db.session.query(Series.study_id, Series.modality, func.count(Series.id))
+                .filter(Series.study_id.in_(list(modalities)))
+                .group_by(Series.study_id, Series.modality).all())
+        for study_id, modality, count in rows:
+            modalities[study_id][modality] = count
+
+    results = [{
+        'id': study.id,
+        'study_uid': study.study_uid,
+        'patient_name': study.patient_name,
+        'patient_id': study.patient_id,
+        'study_date': study.study_date.isoformat() if study.study_date else None,
+        'accession_number': study.accession_number,
+        'study_description': study.study_description,
+        'modalities': sorted(m for m in modalities[study.id] if m),
+        'series_count': sum(modalities[study.id].values()),
+    } for study in studies]
+    return {'total': total, 'page': page, 'per_page': per_page, 'results': results}
+
+
+def reindex_headers(header_tags, batch_size=500):
+    """为旧数据补齐检索字段：从原始DICOM读取头部（不读取像素），返回更新的实例数"""
+    from dicom_utils import header_values
+    from storage import find_original, read_original
+
+    updated = 0
+    last_id = 0
+    while True:
+        instances = (Instance.query.filter(Instance.id > last_id, Instance.header.is_(None))
+                     .order_by(Instance.id).limit(batch_size).all())
+        if not instances:
+            break
+        for instance in instances:
+            last_id = instance.id
+            if not find_original(instance.dicom_path):
+                continue
+            try:
+                ds = read_original(instance.dicom_path, stop_before_pixels=True, force=True)
+            except Exception as e:
+                logger.warning(f"Failed to read header of instance {instance.id}: {e}")
+                continue
+            instance.header = header_values(ds, header_tags)
+            study, series = instance.series.study, instance.series
+            study.patient_id = study.patient_id or ds.get('PatientID') or None
+            study.accession_number = study.accession_number or ds.get('AccessionNumber') or None
+            study.study_description = study.study_description or ds.get('StudyDescription') or None
+            series.series_description = series.series_description or ds.get('SeriesDescription') or None
+            updated += 1
+        db.session.commit()
+    return updated
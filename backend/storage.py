@@ -0,0 +1,263 @@
+"""存储分层
+
+原始DICOM：入库后在后台压缩（默认 gzip，安装 zstandard 后可选 zstd）。数据库中的 dicom_path 不变，
+压缩文件与其并列存放（<uid>.dcm.gz / <uid>.dcm.zst），通过 find_original()/read_original() 读取。
+
+生成的图像（全分辨率图、预览图及各格式副本）：在磁盘预算（IMAGE_CACHE_BUDGET_MB）内按最近访问时间淘汰，
+被淘汰的图像由 serve_image 在下次请求时从原始DICOM重新生成。缩略图很小且列表页频繁使用，不参与淘汰。
+访问时间记录在 SQLite 索引中（每个文件一行：文件名、大小、最近访问时间），访问先在内存中累积，
+定期批量写入，多个 worker 进程共享同一个索引文件。
+"""
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+COMPRESSED_SUFFIXES = {'gzip': '.gz', 'zstd': '.zst'}
+DEFAULT_LEVELS = {'gzip': 6, 'zstd': 3}
+
+_compressor = None
+_compressor_lock = threading.Lock()
+
+
+def _zstandard():
+    """zstd 为可选依赖，未安装时返回None"""
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+
+def compression_method(method):
+    """校验压缩方式，zstd 不可用时退回 gzip"""
+    method = (method or 'none').lower()
+    if method == 'zstd' and _zstandard() is None:
+        logger.warning('ORIGINAL_COMPRESSION=zstd requires the zstandard package, using gzip')
+        return 'gzip'
+    if method not in COMPRESSED_SUFFIXES:
+        return 'none'
+    return method
+
+
+def original_candidates(dicom_path):
+    """原始文件可能的存放位置：未压缩，或各压缩格式"""
+    return [(dicom_path, 'none')] + [(dicom_path + suffix, method) for method, suffix in COMPRESSED_SUFFIXES.items()]
+
+
+def find_original(dicom_path):
+    """返回原始文件当前的实际路径，不存在时返回None"""
+    if not dicom_path:
+        return None
+    for path, _ in original_candidates(dicom_path):
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def read_original(dicom_path, **kwargs):
+    """读取原始DICOM（自动解压），kwargs 传给 pydicom.dcmread
+
+    未压缩文件直接按路径读取，保留 defer_size 按需读取的能力；压缩文件忽略 defer_size。
+    """
+    import io
+    import pydicom
+    for path, method in original_candidates(dicom_path):
+        try:
+            if method == 'none':
+                return pydicom.dcmread(path, **kwargs)
+            # 压缩文件无法按偏移延迟读取，整体读入
+            kwargs.pop('defer_size', None)
+            if method == 'gzip':
+                with gzip.open(path, 'rb') as f:
+                    return pydicom.dcmread(f, **kwargs)
+            zstandard = _zstandard()
+            if zstandard is None:
+                continue
+            with open(path, 'rb') as f:
+                data = zstandard.ZstdDecompressor().stream_reader(f).read()
+            return pydicom.dcmread(io.BytesIO(data), **kwargs)
+        except FileNotFoundError:
+            # 可能正被后台压缩替换，继续尝试下一个位置
+            continue
+    raise FileNotFoundError(f"Original DICOM not found: {dicom_path}")
+
+
+def compress_original(dicom_path, method='gzip', level=None):
+    """压缩原始文件并删除未压缩版本，返回压缩后的路径；原始文件在压缩期间被删除时返回 None"""
+    method = compression_method(method)
+    if method == 'none' or not os.path.exists(dicom_path):
+        return find_original(dicom_path)
+
+    start = time.perf_counter()
+    target = dicom_path + COMPRESSED_SUFFIXES[method]
+    tmp_path = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+    level = level or DEFAULT_LEVELS[method]
+    try:
+        with open(dicom_path, 'rb') as src:
+            if method == 'gzip':
+                with gzip.open(tmp_path, 'wb', compresslevel=level) as dst:
+                    shutil.copyfileobj(src, dst, 1024 * 1024)
+            else:
+                with open(tmp_path, 'wb') as dst:
+                    _zstandard().ZstdCompressor(level=level).copy_stream(src, dst)
+        os.replace(tmp_path, target)
+        os.remove(dicom_path)
+    except FileNotFoundError:
+        # 压缩期间实例被删除（remove_original 已删除原始文件），丢弃压缩结果，不留下孤立的压缩文件
+        for path in (tmp_path, target):
+            if os.path.exists(path):
+                os.remove(path)
+        logger.info(f"Original removed during compression, discarded {target}")
+        return None
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    metrics.record(f'storage.compress.{method}', time.perf_counter() - start, os.path.getsize(target))
+    return target
+
+
+def _compress_in_background(dicom_path, method, level):
+    try:
+        compress_original(dicom_path, method, level)
+    except Exception as e:
+        logger.error(f"Failed to compress {dicom_path}: {e}")
+
+
+def schedule_compression(dicom_path, method='gzip', level=None):
+    """在后台线程中压缩原始文件，不阻塞上传请求"""
+    global _compressor
+    if compression_method(method) == 'none':
+        return None
+    with _compressor_lock:
+        if _compressor is None:
+            _compressor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='compress')
+    return _compressor.submit(_compress_in_background, dicom_path, method, level)
+
+
+def remove_original(dicom_path):
+    if not dicom_path:
+        return
+    for path, _ in original_candidates(dicom_path):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def evictable(name):
+    return not os.path.splitext(name)[0].endswith('_thumb')
+
+
+class ArtifactIndex:
+    """生成图像的访问索引与按磁盘预算的LRU淘汰
+
+    文件名均为相对图像目录的名称。budget_bytes 为0时只记录不淘汰。
+    """
+
+    def __init__(self, folder, index_path, budget_bytes=0, flush_interval=5.0):
+        self.folder = folder
+        self.index_path = index_path
+        self.budget_bytes = budget_bytes
+        self.flush_interval = flush_interval
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+        os.makedirs(os.path.dirname(index_path) or '.', exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS artifacts ('
+                         'name TEXT PRIMARY KEY, size INTEGER NOT NULL, atime REAL NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS artifacts_atime ON artifacts (atime)')
+            if conn.execute('SELECT COUNT(*) FROM artifacts').fetchone()[0] == 0:
+                self._scan(conn)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.index_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _scan(self, conn):
+        """索引为空时登记图像目录中已有的文件，以修改时间作为初始访问时间"""
+        rows = []
+        for entry in os.scandir(self.folder):
+            if entry.is_file() and not entry.name.endswith('.tmp'):
+                stat = entry.stat()
+                rows.append((entry.name, stat.st_size, stat.st_mtime))
+        conn.executemany('INSERT OR REPLACE INTO artifacts VALUES (?, ?, ?)', rows)
+
+    def add(self, paths):
+        """登记新生成的文件"""
+        now = time.time()
+        rows = [(os.path.basename(p), os.path.getsize(p), now) for p in paths if os.path.exists(p)]
+        with self._connect() as conn:
+            conn.executemany('INSERT OR REPLACE INTO artifacts VALUES (?, ?, ?)', rows)
+
+    def touch(self, name):
+        """记录一次访问，定期批量写入索引"""
+        with self._lock:
+            self._pending[name] = time.time()
+            due = time.monotonic() - self._last_flush >= self.flush_interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+        if pending:
+            with self._connect() as conn:
+                conn.executemany('UPDATE artifacts SET atime = ? WHERE name = ?',
+                                 [(atime, name) for name, atime in pending.items()])
+
+    def discard(self, paths):
+        with self._connect() as conn:
+            conn.executemany('DELETE FROM artifacts WHERE name = ?', [(os.path.basename(p),) for p in paths])
+
+    def usage(self):
+        with self._connect() as conn:
+            return conn.execute('SELECT COALESCE(SUM(size), 0) FROM artifacts').fetchone()[0]
+
+    def evict(self, protect=()):
+        """超出预算时按最近访问时间删除文件，直到降至预算的90%，返回删除的字节数"""
+        if self.budget_bytes <= 0:
+            return 0
+        self.flush()
+        total = self.usage()
+        if total <= self.budget_bytes:
+            return 0
+
+        start = time.perf_counter()
+        protect = {os.path.basename(p) for p in protect}
+        target = self.budget_bytes * 0.9
+        freed = 0
+        with self._connect() as conn:
+            removed = []
+            for name, size in conn.execute('SELECT name, size FROM artifacts ORDER BY atime'):
+                if total - freed <= target:
+                    break
+                if name in protect or not evictable(name):
+                    continue
+                try:
+                    os.remove(os.path.join(self.folder, name))
+                except FileNotFoundError:
+                    pass
+                removed.append((name,))
+                freed += size
+            conn.executemany('DELETE FROM artifacts WHERE name = ?', removed)
+        metrics.record('storage.evict', time.perf_counter() - start, freed)
+        logger.info(f"Evicted {len(removed)} image files ({freed} bytes) to stay within the image cache budget")
+        return freed
@@ -0,0 +1,231 @@
+"""按行分块（strip）的低内存图像转换
+
+整幅转换时，Rescale、窗宽窗位、裁剪和类型转换各产生一份全尺寸临时数组，
+5000×4000 的16位图像每次请求要额外占用数百MB。这里按行分块处理，
+只分配一个8位输出数组和固定大小的分块缓冲区：
+
+- 未压缩的小端像素数据按行块直接从文件读取第一帧，不解码整个 pixel_array；
+- 压缩数据由 decoders.py 解码第一帧，之后的处理同样按块进行。
+
+同一进程内的转换任务共享内存预算（CONVERSION_MEMORY_BUDGET_MB），额度不足时后续任务等待。
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import metrics
+from windowing import histogram_layout, percentile_window
+
+# 分块缓冲区总大小（浮点缓冲、索引缓冲合计）
+STRIP_BYTES = int(os.environ.get('STRIP_BYTES', str(8 * 1024 * 1024)))
+CONVERSION_MEMORY_BUDGET = int(os.environ.get('CONVERSION_MEMORY_BUDGET_MB', '512')) * 1024 * 1024
+
+PIXEL_DATA = 0x7FE00010
+# 每个像素的分块缓冲区字节数：float32 数值、float32 中间结果、int64 直方图索引
+_STRIP_BYTES_PER_PIXEL = 16
+
+
+class MemoryBudget:
+    """进程内的内存预算，reserve() 在可用额度不足时阻塞
+
+    单个任务的估算超过总预算时按总预算计，保证它能在其他任务结束后运行。
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.in_use = 0
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def reserve(self, nbytes):
+        nbytes = min(nbytes, self.capacity)
+        start = time.perf_counter()
+        with self._cond:
+            while self.in_use + nbytes > self.capacity:
+                self._cond.wait()
+            self.in_use += nbytes
+        metrics.record('memory_budget.wait', time.perf_counter() - start, nbytes)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.in_use -= nbytes
+                self._cond.notify_all()
+
+
+memory_budget = MemoryBudget(CONVERSION_MEMORY_BUDGET)
+
+
+def strip_rows(columns):
+    return max(1, STRIP_BYTES // max(1, columns * _STRIP_BYTES_PER_PIXEL))
+
+
+def conversion_bytes(dicom_data, decode=True):
+    """估算一次转换的内存占用：8位输出、分块缓冲区，以及需要解码时解码出的第一帧"""
+    rows, columns = int(dicom_data.Rows), int(dicom_data.Columns)
+    # 分块缓冲区外加一块读取缓冲区（按最大4字节计）
+    total = rows * columns + min(rows, strip_rows(columns)) * columns * (_STRIP_BYTES_PER_PIXEL + 4)
+    if decode:
+        samples = int(getattr(dicom_data, 'SamplesPerPixel', 1) or 1)
+        # pydicom 解码时按 BitsAllocated 取整到1/2/4/8字节
+        itemsize = max(1, (int(getattr(dicom_data, 'BitsAllocated', 16) or 16) + 7) // 8)
+        total += rows * columns * samples * itemsize
+        if samples > 1:
+            # 彩色图像另需一份 float32 亮度数组
+            total += rows * columns * 4
+    return total
+
+
+class NativePixels:
+    """未压缩像素数据的按行读取器，每次读取复用同一块缓冲区，不占用整幅图像的内存
+
+    支持 shape、dtype 和按行切片 pixels[r0:r1]，返回的数组在下一次读取时被覆盖。
+    """
+
+    def __init__(self, filename, offset, dtype, shape):
+        self.filename = filename
+        self.offset = offset
+        self.dtype = dtype
+        self.shape = shape
+        self._buffer = None
+
+    def __getitem__(self, rows):
+        import numpy as np
+        r0, r1 = rows.start or 0, min(rows.stop, self.shape[0])
+        if self._buffer is None or self._buffer.shape[0] < r1 - r0:
+            self._buffer = np.empty((r1 - r0, self.shape[1]), dtype=self.dtype)
+        strip = self._buffer[:r1 - r0]
+        row_bytes = self.shape[1] * self.dtype.itemsize
+        with open(self.filename, 'rb') as f:
+            f.seek(self.offset + r0 * row_bytes)
+            if f.readinto(strip.reshape(-1).view(np.uint8)) != strip.nbytes:
+                raise ValueError(f"Pixel data in {self.filename} is truncated")
+        return strip
+
+
+def native_frame(dicom_data):
+    """未压缩单通道像素数据第一帧的按行读取器，不满足条件时返回None
+
+    要求 PixelData 尚未读入内存（读取时使用 defer_size），且文件仍在原位置。
+    """
+    import numpy as np
+    filename = getattr(dicom_data, 'filename', None)
+    file_meta = getattr(dicom_data, 'file_meta', None)
+    if not isinstance(filename, str) or not os.path.exists(filename) or file_meta is None:
+        return None
+    syntax = file_meta.get('TransferSyntaxUID')
+    if syntax is None or not syntax.is_little_endian or syntax.is_compressed or syntax.is_deflated:
+        return None
+    if int(getattr(dicom_data, 'SamplesPerPixel', 1) or 1) != 1:
+        return None
+    bits = int(getattr(dicom_data, 'BitsAllocated', 0) or 0)
+    if bits not in (8, 16, 32):
+        return None
+
+    element = dicom_data.get_item(PIXEL_DATA, keep_deferred=True)
+    if element is None or element.value is not None or not hasattr(element, 'value_tell'):
+        return None
+    signed = int(getattr(dicom_data, 'PixelRepresentation', 0) or 0) == 1
+    dtype = np.dtype(f"<{'i' if signed else 'u'}{bits // 8}")
+    rows, columns = int(dicom_data.Rows), int(dicom_data.Columns)
+    if element.length == 0xFFFFFFFF or element.length < rows * columns * dtype.itemsize:
+        return None
+    return NativePixels(filename, element.value_tell, dtype, (rows, columns))
+
+
+def unused_bits(dicom_data):
+    """BitsAllocated 中未使用的高位数，需要与 pydicom 一样屏蔽或进行符号扩展"""
+    bits = int(getattr(dicom_data, 'BitsAllocated', 0) or 0)
+    stored = int(getattr(dicom_data, 'BitsStored', bits) or bits)
+    return max(bits - stored, 0)
+
+
+def render_strips(source, slope=1.0, intercept=0.0, window=None, unused=0):
+    """按行分块完成 Rescale、直方图统计和窗宽窗位，返回 (8位数组, 直方图)
+
+    source 为已解码的二维数组或 NativePixels。直方图格式见 windowing.py。
+    未给出 window 时按直方图百分位自动取窗，需要多遍历一次数据。
+    """
+    import numpy as np
+    rows, columns = source.shape
+    step = min(rows, strip_rows(columns))
+    integral = (np.issubdtype(source.dtype, np.integer)
+                and float(slope).is_integer() and float(intercept).is_integer())
+
+    raw = np.empty((step, columns), dtype=source.dtype) if unused else None
+    if unused and np.issubdtype(source.dtype, np.signedinteger):
+        def read(r0, r1):
+            strip = raw[:r1 - r0]
+            np.left_shift(source[r0:r1], unused, out=strip)
+            np.right_shift(strip, unused, out=strip)
+            return strip
+    elif unused:
+        mask = (1 << (source.dtype.itemsize * 8 - unused)) - 1
+        def read(r0, r1):
+            return np.bitwise_and(source[r0:r1], mask, out=raw[:r1 - r0])
+    else:
+        def read(r0, r1):
+            return source[r0:r1]
+
+    # 第一遍：原始值的范围，Rescale 是线性的，直接换算得到 modality 值的范围
+    low = high = None
+    for r0 in range(0, rows, step):
+        strip = read(r0, min(r0 + step, rows))
+        strip_low, strip_high = strip.min().item(), strip.max().item()
+        low = strip_low if low is None else min(low, strip_low)
+        high = strip_high if high is None else max(high, strip_high)
+    low, high = sorted((low * slope + intercept, high * slope + intercept))
+    if integral:
+        low, high = int(low), int(high)
+    bin_width, start, bins = histogram_layout(low, high, integral)
+
+    values = np.empty((step, columns), dtype=np.float32)
+    scratch = np.empty((step, columns), dtype=np.float32)
+    indices = np.empty((step, columns), dtype=np.int64)
+    output = np.empty((rows, columns), dtype=np.uint8)
+    counts = np.zeros(bins, dtype=np.int64)
+
+    def modality(r0, r1):
+        strip = values[:r1 - r0]
+        np.copyto(strip, read(r0, r1), casting='unsafe')
+        if slope != 1:
+            strip *= np.float32(slope)
+        if intercept:
+            strip += np.float32(intercept)
+        return strip
+
+    def window_into(strip, r0, r1, center, width):
+        strip -= np.float32(center - width / 2)
+        strip *= np.float32(255.0 / max(width, 1e-6))
+        np.clip(strip, 0, 255, out=strip)
+        np.copyto(output[r0:r1], strip, casting='unsafe')
+
+    # 第二遍：统计直方图；已知窗口时同时输出
+    for r0 in range(0, rows, step):
+        r1 = min(r0 + step, rows)
+        strip = modality(r0, r1)
+        index = indices[:r1 - r0]
+        np.floor_divide(strip, np.float32(bin_width), out=scratch[:r1 - r0])
+        np.copyto(index, scratch[:r1 - r0], casting='unsafe')
+        index -= start
+        np.clip(index, 0, bins - 1, out=index)
+        counts += np.bincount(index.ravel(), minlength=bins)
+        if window:
+            window_into(strip, r0, r1, *window)
+
+    histogram = {
+        'start': start,
+        'bin_width': bin_width,
+        'counts': counts.tolist(),
+        'min': low,
+        'max': high,
+    }
+
+    # 第三遍：按直方图百分位取窗
+    if not window:
+        center, width = percentile_window(histogram)
+        for r0 in range(0, rows, step):
+            r1 = min(r0 + step, rows)
+            window_into(modality(r0, r1), r0, r1, center, width)
+    return output, histogram
@@ -0,0 +1,61 @@
+"""测试公共配置：backend 目录下的模块以顶层模块方式导入（与应用运行时一致）"""
+import io
+import os
+import sys
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+
+@pytest.fixture
+def app(tmp_path):
+    """使用临时目录和 SQLite 数据库的应用"""
+    from app import create_app
+    from database import db
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'test.db'}",
+        'UPLOAD_FOLDER': str(tmp_path / 'uploads'),
+        'IMAGE_FOLDER': str(tmp_path / 'static' / 'images'),
+        'VOLUME_FOLDER': str(tmp_path / 'volumes'),
+        'ORIGINAL_COMPRESSION': 'none',
+    })
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def post_dicom(client):
+    """上传一张合成CT切片，返回响应；同一研究/序列的UID相同时归入同一序列"""
+    import numpy as np
+    from pydicom.uid import generate_uid
+    from benchmarks.synthetic_dicom import make_ct
+
+    def post_dicom(study_uid=None, series_uid=None, index=0, size=32):
+        ds = make_ct(size, size, index, np.random.default_rng(index), study_uid=study_uid or generate_uid(),
+                     series_uid=series_uid or generate_uid(), series_number=1, instance_number=index + 1,
+                     patient_name='Test^Patient')
+        buffer = io.BytesIO()
+        ds.save_as(buffer, enforce_file_format=True)
+        buffer.seek(0)
+        return client.post('/api/upload', data={'file': (buffer, f'slice_{index}.dcm')})
+    return post_dicom
+
+
+@pytest.fixture
+def upload(post_dicom):
+    """上传成功时返回接口返回的实例信息"""
+    def upload(**kwargs):
+        response = post_dicom(**kwargs)
+        assert response.status_code == 200, response.get_json()
+        return response.get_json()['instance']
+    return upload
@@ -0,0 +1,42 @@
+"""合成语料可被入库流程读取，基线比较能发现退化"""
+import pytest
+from PIL import Image
+
+from benchmarks.common import Timings, compare_to_baseline, percentile
+from benchmarks.synthetic_dicom import CORPUS_SCALES, generate_corpus
+from dicom_utils import convert_dicom_to_image, extract_dicom_info
+
+
+def test_small_corpus_converts(tmp_path):
+    modalities = ['CT', 'MR', 'US', 'XA']
+    corpus = generate_corpus(str(tmp_path / 'corpus'), 'small', modalities=modalities)
+    spec = CORPUS_SCALES['small']
+    assert len(corpus) == sum(spec[m][0] for m in modalities)
+
+    for modality, path in corpus:
+        info, ds = extract_dicom_info(path)
+        assert info['modality'] == modality
+        output = convert_dicom_to_image(ds, str(tmp_path / f"{info['instance_uid']}.png"))
+        with Image.open(output) as image:
+            # 多帧数据只转换第一帧
+            assert image.size == (spec[modality][2], spec[modality][1])
+            assert image.mode == 'L'
+
+
+def test_percentiles_and_summary():
+    timings = Timings('op')
+    for ms in range(1, 101):
+        timings.add(ms / 1000)
+    timings.errors = 2
+    summary = timings.summary()
+    assert summary['count'] == 100
+    assert summary['errors'] == 2
+    assert summary['p50_ms'] == pytest.approx(50)
+    assert summary['p99_ms'] == pytest.approx(99)
+    assert percentile([], 50) == 0.0
+
+
+def test_baseline_comparison_flags_regressions():
+    baseline = {'fast': {'p50_ms': 10.0}, 'slow': {'p50_ms': 10.0}, 'removed': {'p50_ms': 1.0}}
+    results = {'fast': {'p50_ms': 12.0}, 'slow': {'p50_ms': 13.0}, 'new': {'p50_ms': 100.0}}
+    assert compare_to_baseline(results, baseline, tolerance=0.25) == [('slow', 10.0, 13.0)]
@@ -0,0 +1,46 @@
+"""图像线程池：队列满时返回 503 和 Retry-After，bulk 任务不占用最后一个线程"""
+import threading
+
+import pytest
+
+import routes
+from imaging_pool import BULK, INTERACTIVE, PriorityPool, QueueFull
+
+
+@pytest.fixture
+def busy_pool(monkeypatch):
+    """bulk 线程被占用且 bulk 队列已满的线程池，替换路由使用的线程池"""
+    pool = PriorityPool(workers=2, queue_size=1)
+    release = threading.Event()
+    started = threading.Event()
+    running = pool.submit(BULK, lambda: (started.set(), release.wait()))
+    assert started.wait(5)
+    queued = pool.submit(BULK, release.wait)
+    monkeypatch.setattr(routes, 'imaging_pool', pool)
+    yield pool
+    release.set()
+    running.result(5)
+    queued.result(5)
+
+
+def test_single_worker_keeps_interactive_thread():
+    pool = PriorityPool(workers=1, queue_size=4)
+    assert (pool.workers, pool.bulk_slots) == (2, 1)
+
+
+def test_interactive_runs_while_bulk_is_busy(busy_pool):
+    assert busy_pool.run(INTERACTIVE, lambda: 'done') == 'done'
+    with pytest.raises(QueueFull) as error:
+        busy_pool.submit(BULK, lambda: None)
+    assert error.value.retry_after >= 1
+    assert busy_pool.stats()['queues']['bulk']['rejected'] == 1
+
+
+def test_queue_full_returns_503_with_retry_after(busy_pool, client, post_dicom):
+    response = post_dicom()
+    assert response.status_code == 503
+    retry_after = int(response.headers['Retry-After'])
+    assert retry_after >= 1
+    assert response.get_json()['retry_after'] == retry_after
+    # 被拒绝的上传不留下记录
+    assert client.get('/api/studies').get_json() == []
@@ -0,0 +1,31 @@
+"""负载测试工具：预置数据后按比例回放的请求全部成功"""
+import threading
+
+import pytest
+from werkzeug.serving import make_server
+
+from benchmarks.loadtest import (DEFAULT_MIX, LoadState, build_upload_payloads, parse_mix, run_load,
+                                 seed_database)
+
+
+def test_parse_mix():
+    assert parse_mix('tree=2,upload') == {'tree': 2.0, 'upload': 1.0}
+    with pytest.raises(ValueError):
+        parse_mix('tree=1,unknown=2')
+
+
+def test_replay_against_seeded_server(app):
+    seeded = seed_database(app, 2, 2, 3, 1)
+    state = LoadState(*seeded, build_upload_payloads(4, 32))
+    assert (len(state.study_ids), len(state.series_ids), len(state.instance_ids)) == (2, 4, 12)
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        timings, _ = run_load(f'http://127.0.0.1:{server.server_port}', state, parse_mix(DEFAULT_MIX),
+                              concurrency=4, duration=10, max_requests=80)
+    finally:
+        server.shutdown()
+
+    assert sum(len(t.samples) for t in timings.values()) == 80
+    assert {name: t.errors for name, t in timings.items() if t.errors} == {}
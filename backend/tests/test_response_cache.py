@@ -0,0 +1,74 @@
+"""列表接口缓存按标签失效"""
+import pytest
+
+from response_cache import LocalBackend, ResponseCache, SharedVersions, create_response_cache
+
+RECTANGLE = {'shape_type': 'rectangle', 'coordinates': {'x': 1, 'y': 1, 'width': 5, 'height': 5}}
+
+
+def _get(client, url):
+    response = client.get(url)
+    assert response.status_code == 200
+    return response.headers['X-Cache'], response.get_json()
+
+
+def test_write_invalidates_only_affected_listings(client, upload):
+    first, second = upload(), upload()
+    urls = ['/api/studies', '/api/tree', f"/api/instances/{first['series_id']}",
+            f"/api/instances/{second['series_id']}"]
+    for url in urls:
+        assert _get(client, url)[0] == 'MISS'
+        assert _get(client, url)[0] == 'HIT'
+
+    response = client.post(f"/api/annotations/{first['id']}", json=RECTANGLE)
+    assert response.status_code == 200
+
+    state, instances = _get(client, f"/api/instances/{first['series_id']}")
+    assert state == 'MISS'
+    assert instances[0]['annotation_count'] == 1
+    assert _get(client, '/api/tree')[0] == 'MISS'
+    assert _get(client, f"/api/instances/{second['series_id']}")[0] == 'HIT'
+    assert _get(client, '/api/studies')[0] == 'HIT'
+
+
+def test_upload_invalidates_study_list(client, upload):
+    upload()
+    _get(client, '/api/studies')
+    upload()
+    state, studies = _get(client, '/api/studies')
+    assert state == 'MISS'
+    assert len(studies) == 2
+
+
+def test_invalidation_during_view_is_not_cached():
+    # 查询后、写入前发生的失效使刚写入的条目立即过期
+    cache = ResponseCache(LocalBackend(16), ttl=30)
+    body, versions = cache.lookup('/a', ['series:1'])
+    assert body is None
+    cache.invalidate(['series:1'])
+    cache.store('/a', versions, b'old')
+    assert cache.lookup('/a', ['series:1'])[0] is None
+    cache.store('/a', cache.lookup('/a', ['series:1'])[1], b'new')
+    assert cache.lookup('/a', ['series:1'])[0] == b'new'
+
+
+def test_shared_versions_reach_other_workers(tmp_path):
+    path = str(tmp_path / 'versions.sqlite')
+    # 两个进程内缓存代表两个 worker，只共享版本号
+    workers = [create_response_cache(ttl=30, processes=2, versions_path=path) for _ in range(2)]
+    for cache in workers:
+        _, versions = cache.lookup('/api/studies', ['studies'])
+        cache.store('/api/studies', versions, b'[]')
+        assert cache.lookup('/api/studies', ['studies'])[0] == b'[]'
+        assert cache.ttl == 30
+
+    workers[0].invalidate(['studies'])
+    for cache in workers:
+        assert cache.lookup('/api/studies', ['studies'])[0] is None
+    assert SharedVersions(path).versions(['studies', 'tree']) == [1, 0]
+
+
+def test_multiple_workers_require_shared_versions():
+    with pytest.raises(ValueError):
+        create_response_cache(ttl=30, processes=2)
+    assert create_response_cache(ttl=0, processes=2).enabled is False
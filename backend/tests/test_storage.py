@@ -0,0 +1,76 @@
+"""原始DICOM压缩、图像按预算淘汰和按需重新生成"""
+import os
+import time
+
+import numpy as np
+import pydicom
+import pytest
+
+from database import db
+from models import Instance
+from storage import ArtifactIndex, compress_original, find_original, read_original, remove_original
+
+
+@pytest.fixture
+def dicom_path(tmp_path):
+    from pydicom.uid import generate_uid
+    from benchmarks.synthetic_dicom import make_ct
+    ds = make_ct(16, 16, 0, np.random.default_rng(0), study_uid=generate_uid(), series_uid=generate_uid(),
+                 series_number=1, instance_number=1, patient_name='Test^Storage')
+    path = str(tmp_path / 'original.dcm')
+    ds.save_as(path, enforce_file_format=True)
+    return path
+
+
+def test_compressed_original_reads_back(dicom_path):
+    expected = pydicom.dcmread(dicom_path)
+    target = compress_original(dicom_path, 'gzip')
+    assert target == dicom_path + '.gz'
+    assert not os.path.exists(dicom_path)
+    assert find_original(dicom_path) == target
+
+    ds = read_original(dicom_path, defer_size=1024)
+    assert ds.SOPInstanceUID == expected.SOPInstanceUID
+    np.testing.assert_array_equal(ds.pixel_array, expected.pixel_array)
+
+    remove_original(dicom_path)
+    assert find_original(dicom_path) is None
+    assert compress_original(dicom_path, 'gzip') is None
+
+
+def _write(folder, name, size):
+    with open(os.path.join(folder, name), 'wb') as f:
+        f.write(b'\0' * size)
+    return os.path.join(folder, name)
+
+
+def test_eviction_removes_least_recent_images(tmp_path):
+    folder = tmp_path / 'images'
+    folder.mkdir()
+    index = ArtifactIndex(str(folder), str(tmp_path / 'index.sqlite'), budget_bytes=3000, flush_interval=0)
+    paths = [_write(folder, name, 1000) for name in ('a.png', 'b.png', 'c_thumb.png', 'd.png')]
+    index.add(paths)
+    for name in ('c_thumb.png', 'a.png', 'b.png', 'd.png'):
+        time.sleep(0.01)
+        index.touch(name)
+
+    # 超出预算1000字节，降至90%以下需要删除两个文件；缩略图和受保护的文件不删除
+    assert index.evict(protect=[paths[1]]) == 2000
+    assert sorted(os.listdir(folder)) == ['b.png', 'c_thumb.png']
+    assert index.usage() == 2000
+
+
+def test_evicted_image_is_regenerated_from_compressed_original(app, client, upload):
+    instance = upload()
+    with app.app_context():
+        dicom_path = db.session.get(Instance, instance['id']).dicom_path
+    compress_original(dicom_path, 'gzip')
+    image_path = os.path.join(app.config['IMAGE_FOLDER'], os.path.basename(instance['image_url']))
+    expected = open(image_path, 'rb').read()
+    os.remove(image_path)
+    app.extensions['artifact_index'].discard([image_path])
+
+    response = client.get(instance['image_url'])
+    assert response.status_code == 200
+    assert response.data == expected
+    assert os.path.exists(image_path)
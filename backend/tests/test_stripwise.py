@@ -0,0 +1,49 @@
+"""按行分块转换与整幅转换结果一致"""
+import numpy as np
+import pytest
+
+import stripwise
+from stripwise import render_strips
+from windowing import apply_window, compute_histogram
+
+
+def _render(monkeypatch, strip_bytes, *args, **kwargs):
+    monkeypatch.setattr(stripwise, 'STRIP_BYTES', strip_bytes)
+    return render_strips(*args, **kwargs)
+
+
+@pytest.fixture
+def ct_pixels():
+    rng = np.random.default_rng(0)
+    return rng.integers(0, 4096, size=(97, 64), dtype=np.uint16)
+
+
+@pytest.mark.parametrize('window', [None, (40.0, 400.0)])
+def test_strips_match_single_pass(monkeypatch, ct_pixels, window):
+    # 每块1行，与整幅作为一块处理比较
+    strips = _render(monkeypatch, 64 * 16, ct_pixels, 1.0, -1024.0, window)
+    whole = _render(monkeypatch, 1 << 30, ct_pixels, 1.0, -1024.0, window)
+    np.testing.assert_array_equal(strips[0], whole[0])
+    assert strips[1] == whole[1]
+
+
+def test_histogram_matches_full_array(monkeypatch, ct_pixels):
+    _, histogram = _render(monkeypatch, 64 * 16 * 5, ct_pixels, 1.0, -1024.0)
+    expected = compute_histogram(ct_pixels.astype(np.int32) - 1024)
+    assert histogram == expected
+
+
+def test_unused_bits_are_masked(monkeypatch, ct_pixels):
+    # BitsStored=12 时高4位的无关数据不影响结果
+    noisy = ct_pixels | np.uint16(0xF000)
+    masked = _render(monkeypatch, 64 * 16 * 3, noisy, 1.0, -1024.0, None, unused=4)
+    clean = _render(monkeypatch, 64 * 16 * 3, ct_pixels, 1.0, -1024.0, None)
+    np.testing.assert_array_equal(masked[0], clean[0])
+    assert masked[1] == clean[1]
+
+
+def test_window_matches_full_array(monkeypatch, ct_pixels):
+    pixels, _ = _render(monkeypatch, 64 * 16 * 2, ct_pixels, 1.0, -1024.0, (40.0, 400.0))
+    expected = apply_window(ct_pixels.astype(np.float32) - 1024, 40.0, 400.0)
+    # 分块计算与整幅计算的浮点舍入可能相差1个灰度
+    assert np.abs(pixels.astype(np.int16) - expected).max() <= 1
@@ -0,0 +1,28 @@
+"""并发上传同一新序列的切片"""
+import threading
+
+from pydicom.uid import generate_uid
+
+from database import db
+from models import Instance, Series, Study
+
+
+def test_concurrent_uploads_share_new_series(app, post_dicom):
+    study_uid, series_uid = generate_uid(), generate_uid()
+    barrier = threading.Barrier(6)
+    codes = []
+
+    def upload(index):
+        barrier.wait()
+        codes.append(post_dicom(study_uid=study_uid, series_uid=series_uid, index=index).status_code)
+
+    threads = [threading.Thread(target=upload, args=(k,)) for k in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert codes == [200] * 6
+    with app.app_context():
+        assert (Study.query.count(), Series.query.count(), Instance.query.count()) == (1, 1, 6)
+        assert db.session.query(Instance.series_id).distinct().count() == 1
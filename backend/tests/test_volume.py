@@ -0,0 +1,65 @@
+"""序列体数据在切片增删时重建"""
+import os
+
+import numpy as np
+import pytest
+from pydicom.uid import generate_uid
+
+from benchmarks.synthetic_dicom import make_ct
+from volume import build_volume, current_volume_meta, load_volume_meta, open_volume
+
+SIZE = 16
+
+
+@pytest.fixture
+def series(tmp_path):
+    """4层合成CT，返回 (体数据目录, 序列UID, [(实例UID, 路径, HU数组), ...])，按层位置排列"""
+    rng = np.random.default_rng(0)
+    study_uid, series_uid = generate_uid(), generate_uid()
+    slices = []
+    for k in range(4):
+        ds = make_ct(SIZE, SIZE, k, rng, study_uid=study_uid, series_uid=series_uid, series_number=1,
+                     instance_number=k + 1, patient_name='Test^Volume')
+        path = str(tmp_path / f'slice_{k}.dcm')
+        ds.save_as(path, enforce_file_format=True)
+        slices.append((ds.SOPInstanceUID, path, ds.pixel_array.astype(np.int16) - 1024))
+    return str(tmp_path / 'volumes'), series_uid, slices
+
+
+def _build(folder, series_uid, slices):
+    return build_volume(folder, series_uid, [(uid, path) for uid, path, _ in slices])
+
+
+def _assert_volume(folder, meta, slices):
+    assert meta['instance_uids'] == [uid for uid, _, _ in slices]
+    np.testing.assert_array_equal(open_volume(folder, meta), np.stack([hu for _, _, hu in slices]))
+
+
+def test_rebuild_on_added_and_removed_slices(series):
+    folder, series_uid, slices = series
+    # 乱序提交，按层位置排序
+    first = _build(folder, series_uid, [slices[3], slices[0], slices[1]])
+    assert first['version'] == 1
+    _assert_volume(folder, first, [slices[0], slices[1], slices[3]])
+
+    added = _build(folder, series_uid, slices)
+    assert added['version'] == 2
+    assert added['shape'] == [4, SIZE, SIZE]
+    _assert_volume(folder, added, slices)
+    # 上一版本的文件保留给仍在读取的请求
+    assert os.path.exists(os.path.join(folder, f'{series_uid}.v1.raw'))
+
+    removed = _build(folder, series_uid, slices[1:])
+    assert removed['version'] == 3
+    _assert_volume(folder, removed, slices[1:])
+    assert load_volume_meta(folder, series_uid)['version'] == 3
+    assert not os.path.exists(os.path.join(folder, f'{series_uid}.v1.raw'))
+
+
+def test_unchanged_slices_reuse_volume(series):
+    folder, series_uid, slices = series
+    meta = _build(folder, series_uid, slices)
+    pairs = [(uid, path) for uid, path, _ in slices]
+    assert current_volume_meta(folder, series_uid, list(reversed(pairs)))['version'] == meta['version']
+    assert current_volume_meta(folder, series_uid, pairs[:-1]) is None
+    assert _build(folder, series_uid, slices)['version'] == meta['version']
@@ -0,0 +1,60 @@
+"""直方图合并与百分位取窗"""
+import numpy as np
+import pytest
+
+from windowing import (common_tag_window, compute_histogram, default_window, histogram_percentile,
+                       merge_histograms, percentile_window)
+
+
+def _total(histogram):
+    return sum(histogram['counts'])
+
+
+def test_merge_matches_histogram_of_all_values():
+    rng = np.random.default_rng(1)
+    first = rng.integers(-1024, 400, size=5000)
+    second = rng.integers(-200, 3000, size=3000)
+    merged = merge_histograms([compute_histogram(first), None, compute_histogram(second)])
+    expected = compute_histogram(np.concatenate([first, second]))
+    # 箱边界对齐，合并结果与直接统计全部数值相同
+    assert merged['bin_width'] == expected['bin_width']
+    assert merged == expected
+
+
+def test_merge_rebins_to_widest_bin():
+    narrow = compute_histogram(np.arange(0, 100))
+    wide = compute_histogram(np.arange(0, 4000, 7))
+    merged = merge_histograms([narrow, wide])
+    assert merged['bin_width'] == wide['bin_width'] > narrow['bin_width']
+    assert _total(merged) == _total(narrow) + _total(wide)
+    assert (merged['min'], merged['max']) == (0, 3997)
+
+
+def test_merge_of_nothing():
+    assert merge_histograms([None, None]) is None
+
+
+def test_percentiles_follow_sample_quantiles():
+    values = np.random.default_rng(2).normal(40, 100, size=200000).astype(np.float32)
+    histogram = compute_histogram(values)
+    for pct in (0.5, 50, 99.5):
+        assert histogram_percentile(histogram, pct) == pytest.approx(
+            np.percentile(values, pct), abs=histogram['bin_width'])
+
+
+def test_percentile_window_ignores_outliers():
+    # 少量填充值（-3024）不应拉宽自动窗口
+    values = np.concatenate([np.random.default_rng(3).integers(-100, 100, size=10000),
+                             np.full(10, -3024)])
+    center, width = percentile_window(compute_histogram(values))
+    assert -20 < center < 20
+    assert 150 < width < 260
+
+
+def test_default_window_prefers_common_tags():
+    histogram = compute_histogram(np.arange(-1000, 1000))
+    tags = [(40, 400), (None, None), (40, 400), (-600, 1500), (10, 0)]
+    assert common_tag_window(tags) == (40, 400)
+    assert default_window(histogram, tags) == ('dicom', 40, 400)
+    assert default_window(histogram, [(None, None)])[0] == 'auto'
+    assert default_window(None, []) is None
@@ -0,0 +1,433 @@
+"""序列体数据
+
+将序列中的各层切片按空间位置排序，经 Rescale 后堆叠为连续的三维数组（int16 或 float32），
+以无文件头的原始字节保存为可内存映射的文件，同时生成 gzip 压缩副本供下载：
+
+    <series_uid>.v<版本>.raw     体数据，形状 (层数, 行, 列)，C 顺序、小端
+    <series_uid>.v<版本>.raw.gz  压缩副本
+    <series_uid>.json            元数据：版本号、形状、类型、体素间距、切片顺序及各切片的几何信息
+
+切片增删后重新构建时，未变化的切片直接从旧文件复制，只解码新增的切片。
+数据文件按版本命名且写入后不再修改，新版本的两个数据文件写完后才替换元数据，读取方按元数据中的版本
+打开文件，不会读到新旧混合的数据；上一版本保留到下一次重建，正在读取旧版本的请求不受影响。
+同一序列的构建在进程内用线程锁、在进程间用锁文件（fcntl.flock）互斥。
+"""
+import glob
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # 非 POSIX 系统只有进程内的锁
+    fcntl = None
+
+from decoders import DecodeError, decode_frame
+from storage import find_original, read_original
+
+logger = logging.getLogger(__name__)
+
+VOLUME_COMPRESS_LEVEL = int(os.environ.get('VOLUME_COMPRESS_LEVEL', '1'))
+
+_locks = {}
+_locks_guard = threading.Lock()
+_meta_cache = {}
+
+
+class VolumeError(Exception):
+    """序列无法组成体数据"""
+
+
+class _Overflow(Exception):
+    """数据超出 int16 范围，需要改用 float32"""
+
+
+@contextmanager
+def _series_lock(folder, series_uid):
+    """同一序列的构建和删除互斥：进程内用线程锁，进程间用锁文件"""
+    with _locks_guard:
+        lock = _locks.setdefault(series_uid, threading.Lock())
+    with lock:
+        if fcntl is None:
+            yield
+            return
+        with open(volume_paths(folder, series_uid)['lock'], 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def volume_paths(folder, series_uid, version=None):
+    """元数据和锁文件的路径；给出版本号时包括该版本的数据文件"""
+    base = os.path.join(folder, series_uid)
+    paths = {'meta': f"{base}.json", 'lock': f"{base}.lock"}
+    if version is not None:
+        paths['data'] = f"{base}.v{version}.raw"
+        paths['compressed'] = f"{base}.v{version}.raw.gz"
+    return paths
+
+
+def _read_meta(path):
+    """读取元数据文件，按修改时间缓存解析结果，不存在或不完整时返回None"""
+    try:
+        mtime = os.stat(path).st_mtime_ns
+        cached = _meta_cache.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        with open(path) as f:
+            meta = json.load(f)
+        _meta_cache[path] = (mtime, meta)
+        return meta
+    except (OSError, ValueError):
+        return None
+
+
+def load_volume_meta(folder, series_uid):
+    """读取元数据，元数据或其指向的数据文件缺失时返回None"""
+    meta = _read_meta(volume_paths(folder, series_uid)['meta'])
+    if meta is None or 'version' not in meta:
+        return None
+    paths = volume_paths(folder, series_uid, meta['version'])
+    if not (os.path.exists(paths['data']) and os.path.exists(paths['compressed'])):
+        return None
+    return meta
+
+
+def slice_fingerprint(slices):
+    """切片集合 [(instance_uid, dicom_path), ...] 的摘要，与顺序无关"""
+    digest = hashlib.sha1()
+    for uid, dicom_path in sorted(slices, key=lambda s: s[0]):
+        digest.update(f"{uid}\0{dicom_path}\n".encode())
+    return digest.hexdigest()
+
+
+def current_volume_meta(folder, series_uid, slices):
+    """切片集合与上次构建时相同时返回元数据，否则返回None（需要 build_volume）
+
+    只比较摘要，不加锁、不读取DICOM，用于请求线程中快速判断是否需要重建。
+    """
+    meta = load_volume_meta(folder, series_uid)
+    if meta and meta.get('fingerprint') == slice_fingerprint(slices):
+        return meta
+    return None
+
+
+def _write_meta(folder, series_uid, meta):
+    path = volume_paths(folder, series_uid)['meta']
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def open_volume(folder, meta, mode='r'):
+    """以内存映射方式打开体数据"""
+    import numpy as np
+    return np.memmap(volume_paths(folder, meta['series_uid'], meta['version'])['data'],
+                     dtype=np.dtype(meta['dtype']).newbyteorder('<'), mode=mode,
+                     shape=tuple(meta['shape']))
+
+
+def _data_files(folder, series_uid):
+    """序列的全部数据文件 {路径: 版本}，旧格式（文件名不带版本）的版本记为 None"""
+    base = glob.escape(os.path.join(folder, series_uid))
+    files = {}
+    for path in glob.glob(f"{base}.v*.raw") + glob.glob(f"{base}.v*.raw.gz"):
+        match = re.search(r'\.v(\d+)\.raw(\.gz)?$', path)
+        if match:
+            files[path] = int(match.group(1))
+    for path in glob.glob(f"{base}.raw") + glob.glob(f"{base}.raw.gz"):
+        files[path] = None
+    return files
+
+
+def _remove_stale_files(folder, series_uid, keep):
+    for path, version in _data_files(folder, series_uid).items():
+        if version not in keep:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def remove_volume(folder, series_uid):
+    paths = volume_paths(folder, series_uid)
+    if not os.path.isdir(folder):
+        return
+    with _series_lock(folder, series_uid):
+        _meta_cache.pop(paths['meta'], None)
+        _remove_stale_files(folder, series_uid, keep=())
+        if os.path.exists(paths['meta']):
+            os.remove(paths['meta'])
+    if os.path.exists(paths['lock']):
+        os.remove(paths['lock'])
+
+
+def _float_list(value, length):
+    try:
+        result = [float(v) for v in value]
+        return result if len(result) == length else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _first_float(value):
+    """窗宽窗位可能是多值，取第一个"""
+    if value is None:
+        return None
+    try:
+        return float(value[0] if hasattr(value, '__len__') else value)
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def read_slice_header(dicom_path):
+    """读取切片的几何信息和 Rescale 参数（不读取像素数据）"""
+    ds = read_original(dicom_path, stop_before_pixels=True, force=True)
+    return {
+        'path': dicom_path,
+        'rows': int(ds.Rows),
+        'columns': int(ds.Columns),
+        'frames': int(getattr(ds, 'NumberOfFrames', 1) or 1),
+        'samples': int(getattr(ds, 'SamplesPerPixel', 1) or 1),
+        'instance_number': int(getattr(ds, 'InstanceNumber', 0) or 0),
+        'position': _float_list(getattr(ds, 'ImagePositionPatient', None), 3),
+        'orientation': _float_list(getattr(ds, 'ImageOrientationPatient', None), 6),
+        'pixel_spacing': _float_list(getattr(ds, 'PixelSpacing', None), 2),
+        'slice_thickness': float(getattr(ds, 'SliceThickness', 0) or 0),
+        'slope': float(getattr(ds, 'RescaleSlope', 1) or 1),
+        'intercept': float(getattr(ds, 'RescaleIntercept', 0) or 0),
+        'window_center': _first_float(getattr(ds, 'WindowCenter', None)),
+        'window_width': _first_float(getattr(ds, 'WindowWidth', None)),
+    }
+
+
+def _slice_normal(orientation):
+    import numpy as np
+    if not orientation:
+        return None
+    row, col = np.array(orientation[:3]), np.array(orientation[3:])
+    normal = np.cross(row, col)
+    norm = np.linalg.norm(normal)
+    return normal / norm if norm > 0 else None
+
+
+def sort_slices(headers):
+    """按 ImagePositionPatient 在切片法向上的投影排序，缺少几何信息时按 InstanceNumber 排序
+
+    headers: {instance_uid: header}，返回 [(instance_uid, 位置), ...]
+    """
+    import numpy as np
+    first = next(iter(headers.values()))
+    normal = _slice_normal(first['orientation'])
+    has_geometry = normal is not None and all(h['position'] for h in headers.values())
+
+    keyed = []
+    for uid, header in headers.items():
+        if has_geometry:
+            key = float(np.dot(header['position'], normal))
+        else:
+            key = float(header['instance_number'])
+        keyed.append((key, header['instance_number'], uid))
+    keyed.sort()
+    return [(uid, key) for key, _, uid in keyed], has_geometry
+
+
+def _slice_spacing(positions, has_geometry, header):
+    import numpy as np
+    if has_geometry and len(positions) > 1:
+        diffs = np.abs(np.diff(positions))
+        diffs = diffs[diffs > 1e-6]
+        if diffs.size:
+            return float(np.median(diffs))
+    return header['slice_thickness'] or 1.0
+
+
+def read_slice_pixels(header, dtype):
+    """解码并 Rescale 一层切片，转换为目标类型"""
+    import numpy as np
+    ds = read_original(header['path'], force=True)
+    try:
+        pixels = decode_frame(ds, 0)
+    except DecodeError as e:
+        raise VolumeError(f"Failed to decode slice {header['path']}: {e}")
+    if pixels.ndim != 2:
+        raise VolumeError(f"Slice {header['path']} is not a single-frame grayscale image")
+
+    if np.dtype(dtype) == np.int16:
+        slope, intercept = int(header['slope']), int(header['intercept'])
+        rescaled = pixels.astype(np.int32)
+        if slope != 1:
+            rescaled *= slope
+        if intercept:
+            rescaled += intercept
+        if rescaled.size and (rescaled.min() < -32768 or rescaled.max() > 32767):
+            raise _Overflow()
+        return rescaled.astype(np.int16)
+
+    rescaled = pixels.astype(np.float32)
+    if header['slope'] != 1:
+        rescaled *= np.float32(header['slope'])
+    if header['intercept']:
+        rescaled += np.float32(header['intercept'])
+    return rescaled
+
+
+def _write_compressed(volume, path, level):
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with gzip.open(tmp_path, 'wb', compresslevel=level) as f:
+            for plane in volume:
+                f.write(plane.tobytes())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def build_volume(folder, series_uid, slices, compress_level=VOLUME_COMPRESS_LEVEL):
+    """构建或增量更新序列体数据，返回元数据
+
+    slices: [(instance_uid, dicom_path), ...]，即序列当前的全部切片。
+    切片集合未变化时直接返回已有元数据。
+    """
+    os.makedirs(folder, exist_ok=True)
+    with _series_lock(folder, series_uid):
+        return _build_locked(folder, series_uid, slices, compress_level)
+
+
+def _build_locked(folder, series_uid, slices, compress_level):
+    import numpy as np
+
+    fingerprint = slice_fingerprint(slices)
+    old_meta = load_volume_meta(folder, series_uid)
+    old_headers = old_meta['slices'] if old_meta else {}
+
+    headers = {}
+    for uid, dicom_path in slices:
+        if not find_original(dicom_path):
+            logger.warning(f"Original DICOM for instance {uid} not found, skipping")
+            continue
+        try:
+            if uid in old_headers:
+                headers[uid] = dict(old_headers[uid], path=dicom_path)
+            else:
+                headers[uid] = read_slice_header(dicom_path)
+        except Exception as e:
+            logger.warning(f"Failed to read DICOM header for instance {uid}: {e}")
+    if not headers:
+        raise VolumeError('Series has no readable slices')
+
+    # 只保留与第一层尺寸一致的单帧灰度切片
+    reference = next(iter(headers.values()))
+    headers = {
+        uid: h for uid, h in headers.items()
+        if h['frames'] == 1 and h['samples'] == 1
+        and (h['rows'], h['columns']) == (reference['rows'], reference['columns'])
+    }
+    if not headers:
+        raise VolumeError('Series has no single-frame grayscale slices')
+
+    ordered, has_geometry = sort_slices(headers)
+    order = [uid for uid, _ in ordered]
+    if old_meta and old_meta['instance_uids'] == order:
+        if old_meta.get('fingerprint') != fingerprint:
+            # 体数据不变（如新增的切片无法使用），只记录新的摘要，之后的请求不必再进入这里
+            old_meta = dict(old_meta, fingerprint=fingerprint)
+            _write_meta(folder, series_uid, old_meta)
+        return old_meta
+
+    integral = all(h['slope'].is_integer() and h['intercept'].is_integer() for h in headers.values())
+    candidates = ['int16', 'float32'] if integral else ['float32']
+    shape = (len(order), reference['rows'], reference['columns'])
+
+    # 版本号按元数据文件递增（数据文件缺失时也不复用旧版本号，避免与已缓存的平面混淆）
+    previous = _read_meta(volume_paths(folder, series_uid)['meta'])
+    version = previous.get('version', 0) + 1 if previous else 1
+    paths = volume_paths(folder, series_uid, version)
+    tmp_data = f"{paths['data']}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+    old_volume = open_volume(folder, old_meta) if old_meta else None
+    old_index = {uid: k for k, uid in enumerate(old_meta['instance_uids'])} if old_meta else {}
+    published = False
+    try:
+        for dtype in candidates:
+            reused = decoded = 0
+            volume = np.memmap(tmp_data, dtype=np.dtype(dtype).newbyteorder('<'), mode='w+', shape=shape)
+            try:
+                for k, uid in enumerate(order):
+                    old_k = old_index.get(uid)
+                    if (old_k is not None and old_volume.shape[1:] == shape[1:]
+                            and np.can_cast(old_volume.dtype, volume.dtype, 'safe')):
+                        volume[k] = old_volume[old_k]
+                        reused += 1
+                    else:
+                        volume[k] = read_slice_pixels(headers[uid], dtype)
+                        decoded += 1
+                break
+            except _Overflow:
+                logger.info(f"Series {series_uid} exceeds int16 range, using float32")
+                continue
+            finally:
+                volume.flush()
+                del volume
+        del old_volume
+        os.replace(tmp_data, paths['data'])
+
+        positions = [key for _, key in ordered]
+        meta = {
+            'series_uid': series_uid,
+            'shape': list(shape),
+            'dtype': dtype,
+            'byte_order': 'little',
+            # 体素间距，顺序与 shape 一致：(层间距, 行间距, 列间距)
+            'spacing': [
+                _slice_spacing(positions, has_geometry, reference),
+                *(reference['pixel_spacing'] or [1.0, 1.0]),
+            ],
+            'origin': headers[order[0]]['position'],
+            'orientation': reference['orientation'],
+            'instance_uids': order,
+            'version': version,
+            'fingerprint': fingerprint,
+            'slices': {uid: headers[uid] for uid in order},
+        }
+
+        data = open_volume(folder, meta)
+        _write_compressed(data, paths['compressed'], compress_level)
+        del data
+        meta['bytes'] = os.path.getsize(paths['data'])
+        meta['compressed_bytes'] = os.path.getsize(paths['compressed'])
+
+        # 最后替换元数据：此前读取方仍使用上一版本的完整文件
+        _write_meta(folder, series_uid, meta)
+        published = True
+    finally:
+        if os.path.exists(tmp_data):
+            os.remove(tmp_data)
+        if not published:
+            for path in (paths['data'], paths['compressed']):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    # 保留上一版本，供已读取旧元数据的请求继续使用
+    _remove_stale_files(folder, series_uid, keep={version, old_meta['version']} if old_meta else {version})
+    logger.info(f"Built volume for series {series_uid}: shape={shape} dtype={dtype} "
+                f"reused={reused} decoded={decoded}")
+    return meta
+
+
+def public_meta(meta):
+    """对外返回的元数据（不含各切片的详细信息）"""
+    return {key: value for key, value in meta.items() if key != 'slices'}
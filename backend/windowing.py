@@ -0,0 +1,206 @@
+"""灰度直方图与窗宽窗位
+
+直方图以 modality 值（Rescale 之后，如CT的HU）统计，格式为：
+
+    {'start': 起始箱序号, 'bin_width': 箱宽, 'counts': [...], 'min': 最小值, 'max': 最大值}
+
+第 i 个箱覆盖 [(start + i) * bin_width, (start + i + 1) * bin_width)。箱宽取2的整数次幂，
+且箱边界对齐到箱宽的整数倍，因此不同实例的直方图可以无损地合并为序列直方图。
+自动窗宽窗位按百分位数计算，避免个别极值像素或填充值拉伸整幅图像。
+"""
+import math
+import os
+
+HISTOGRAM_BINS = int(os.environ.get('HISTOGRAM_BINS', '256'))
+AUTO_WINDOW_PERCENTILES = (0.5, 99.5)
+
+# 各模态的预设窗口：window 为固定的 (窗位, 窗宽)，percentiles 为按直方图计算的百分位范围
+WINDOW_PRESETS = {
+    'CT': {
+        'soft_tissue': {'window': (40, 400)},
+        'lung': {'window': (-600, 1500)},
+        'bone': {'window': (400, 1800)},
+        'brain': {'window': (40, 80)},
+        'liver': {'window': (60, 160)},
+        'mediastinum': {'window': (50, 350)},
+    },
+    'default': {
+        'auto': {'percentiles': AUTO_WINDOW_PERCENTILES},
+        'high_contrast': {'percentiles': (5, 95)},
+        'full_range': {'percentiles': (0, 100)},
+    },
+}
+
+
+def modality_values(dicom_data, pixel_array):
+    """应用 RescaleSlope/RescaleIntercept，整数参数时保持整数类型"""
+    import numpy as np
+    slope = float(getattr(dicom_data, 'RescaleSlope', 1) or 1)
+    intercept = float(getattr(dicom_data, 'RescaleIntercept', 0) or 0)
+    if slope == 1 and intercept == 0:
+        return pixel_array
+    if slope.is_integer() and intercept.is_integer() and np.issubdtype(pixel_array.dtype, np.integer):
+        values = pixel_array.astype(np.int32)
+        if slope != 1:
+            values *= int(slope)
+        values += int(intercept)
+        return values
+    return pixel_array.astype(np.float32) * np.float32(slope) + np.float32(intercept)
+
+
+def dicom_window(dicom_data):
+    """读取 WindowCenter/WindowWidth 标签（多值时取第一个），缺失或无效时返回None"""
+    try:
+        center = getattr(dicom_data, 'WindowCenter', None)
+        width = getattr(dicom_data, 'WindowWidth', None)
+        if center is None or width is None:
+            return None
+        center = float(center[0] if hasattr(center, '__len__') else center)
+        width = float(width[0] if hasattr(width, '__len__') else width)
+        return (center, width) if width > 0 else None
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def _bin_width(low, high, integral):
+    span = high - low + (1 if integral else 0)
+    if span <= 0:
+        return 1.0
+    width = 2.0 ** math.ceil(math.log2(span / HISTOGRAM_BINS))
+    return max(width, 1.0) if integral else width
+
+
+def histogram_layout(low, high, integral):
+    """由数值范围确定 (箱宽, 起始箱序号, 箱数)"""
+    width = _bin_width(low, high, integral)
+    start = math.floor(low / width)
+    return width, start, math.floor(high / width) - start + 1
+
+
+def compute_histogram(values):
+    """统计直方图及最小值、最大值"""
+    import numpy as np
+    values = values.ravel()
+    if values.size == 0:
+        return None
+    low, high = values.min().item(), values.max().item()
+    integral = np.issubdtype(values.dtype, np.integer)
+    width, start, bins = histogram_layout(low, high, integral)
+
+    if integral and width.is_integer():
+        # 整数数据的箱宽为2的幂，右移即向下取整除法
+        shift = int(width).bit_length() - 1
+        indices = (values >> shift).astype(np.int64)
+    else:
+        indices = np.floor(values / width).astype(np.int64)
+    indices -= start
+    counts = np.bincount(indices, minlength=bins)
+    return {
+        'start': start,
+        'bin_width': width,
+        'counts': counts.tolist(),
+        'min': low,
+        'max': high,
+    }
+
+
+def _rebin(histogram, width):
+    """将直方图合并到更大的箱宽（箱宽均为2的幂，合并无损）"""
+    factor = int(round(width / histogram['bin_width']))
+    start = histogram['start'] // factor
+    counts = [0] * ((histogram['start'] + len(histogram['counts']) - 1) // factor - start + 1)
+    for i, count in enumerate(histogram['counts']):
+        counts[(histogram['start'] + i) // factor - start] += count
+    return start, counts
+
+
+def merge_histograms(histograms):
+    """合并多个直方图，例如由实例直方图得到序列直方图"""
+    histograms = [h for h in histograms if h]
+    if not histograms:
+        return None
+    low = min(h['min'] for h in histograms)
+    high = max(h['max'] for h in histograms)
+    width = max(h['bin_width'] for h in histograms)
+    while math.floor(high / width) - math.floor(low / width) + 1 > HISTOGRAM_BINS * 2:
+        width *= 2
+
+    start = math.floor(low / width)
+    merged = [0] * (math.floor(high / width) - start + 1)
+    for histogram in histograms:
+        h_start, counts = _rebin(histogram, width)
+        for i, count in enumerate(counts):
+            merged[h_start - start + i] += count
+    return {'start': start, 'bin_width': width, 'counts': merged, 'min': low, 'max': high}
+
+
+def histogram_percentile(histogram, pct):
+    """按累计计数求百分位数，箱内线性插值"""
+    counts = histogram['counts']
+    total = sum(counts)
+    if total == 0:
+        return histogram['min']
+    target = total * pct / 100.0
+    cumulative = 0
+    for i, count in enumerate(counts):
+        if count and cumulative + count >= target:
+            low = (histogram['start'] + i) * histogram['bin_width']
+            value = low + histogram['bin_width'] * (target - cumulative) / count
+            return min(max(value, histogram['min']), histogram['max'])
+        cumulative += count
+    return histogram['max']
+
+
+def percentile_window(histogram, percentiles=AUTO_WINDOW_PERCENTILES):
+    """由直方图的百分位范围计算 (窗位, 窗宽)"""
+    low = histogram_percentile(histogram, percentiles[0])
+    high = histogram_percentile(histogram, percentiles[1])
+    width = max(high - low, histogram['bin_width'])
+    return (low + high) / 2, width
+
+
+def suggest_windows(histogram, modality=None, tag_window=None):
+    """返回可选窗口列表：DICOM 标签窗口、模态预设和基于直方图的百分位窗口"""
+    suggestions = []
+    if tag_window:
+        suggestions.append({'name': 'dicom', 'center': tag_window[0], 'width': tag_window[1]})
+    presets = dict(WINDOW_PRESETS.get((modality or '').upper(), {}))
+    presets.update(WINDOW_PRESETS['default'])
+    for name, preset in presets.items():
+        if 'window' in preset:
+            center, width = preset['window']
+        elif histogram:
+            center, width = percentile_window(histogram, preset['percentiles'])
+        else:
+            continue
+        suggestions.append({'name': name, 'center': center, 'width': width})
+    return suggestions
+
+
+def common_tag_window(tag_windows):
+    """多个实例的 (窗位, 窗宽) 标签中最常见的一组，忽略缺失和无效的值"""
+    tag_windows = [tuple(w) for w in tag_windows if w[0] is not None and w[1]]
+    return max(set(tag_windows), key=tag_windows.count) if tag_windows else None
+
+
+def default_window(histogram, tag_windows):
+    """默认窗口：最常见的 DICOM 标签窗口，其次直方图的百分位窗口，返回 (名称, 窗位, 窗宽) 或 None
+
+    实例、序列的窗口建议和 MPR 平面使用同一规则，各接口显示一致。
+    """
+    tag_window = common_tag_window(tag_windows)
+    if tag_window:
+        return ('dicom',) + tag_window
+    if histogram:
+        return ('auto',) + percentile_window(histogram)
+    return None
+
+
+def apply_window(values, center, width):
+    """线性窗宽窗位映射到 0-255，原地计算以减少临时数组"""
+    import numpy as np
+    data = np.array(values, dtype=np.float32, copy=True)
+    data -= center - width / 2
+    data *= 255.0 / max(width, 1e-6)
+    np.clip(data, 0, 255, out=data)
+    return data.astype(np.uint8)
@@ -0,0 +1,4 @@
+"""WSGI 入口，供 gunicorn 等服务器使用：gunicorn -c gunicorn.conf.py wsgi:app"""
+from app import create_app
+
+app = create_app()
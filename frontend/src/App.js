@@ -96,6 +96,9 @@ function App() {
             <div className="viewer-container">
               <ImageViewer
                 imageUrl={selectedInstance.image_url}
+                previewUrl={selectedInstance.preview_url}
+                imageWidth={selectedInstance.width}
+                imageHeight={selectedInstance.height}
                 annotations={annotations}
                 onAnnotationCreate={handleAnnotationCreate}
                 onAnnotationUpdate={handleAnnotationUpdate}
@@ -9,6 +9,9 @@ import { useImageViewer } from '../hooks/useImageViewer';
 
 const ImageViewer = ({ 
   imageUrl, 
+  previewUrl,
+  imageWidth,
+  imageHeight,
   annotations, 
   onAnnotationCreate, 
   onAnnotationUpdate,
@@ -53,6 +56,9 @@ const ImageViewer = ({
     toolManager,
   } = useImageViewer({
     imageUrl,
+    previewUrl,
+    imageWidth,
+    imageHeight,
     annotations,
     onAnnotationCreate,
     onAnnotationUpdate,
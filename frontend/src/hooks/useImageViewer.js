@@ -4,6 +4,9 @@ import { AnnotationToolManager } from '../tools/AnnotationToolManager';
 
 export const useImageViewer = ({
   imageUrl,
+  previewUrl,
+  imageWidth,
+  imageHeight,
   annotations,
   onAnnotationCreate,
   onAnnotationUpdate,
@@ -433,35 +436,66 @@ export const useImageViewer = ({
 
   useEffect(() => {
     if (imageUrl) {
-      const img = new Image();
-      img.crossOrigin = "anonymous";
-      img.onload = () => {
+      let cancelled = false;
+      let fullLoaded = false;
+
+      // 画布始终使用全分辨率尺寸，标注坐标不随预览图变化
+      const showImage = (img, width, height, resetView) => {
         setImageObj(img);
         setImageLoaded(true);
         if (canvasRef.current) {
-          canvasRef.current.width = img.width;
-          canvasRef.current.height = img.height;
-          setCanvasSize({ width: img.width, height: img.height });
+          canvasRef.current.width = width;
+          canvasRef.current.height = height;
+          setCanvasSize({ width, height });
+        }
+        if (resetView) {
+          setTransform({
+            scale: 1,
+            rotation: 0,
+            translateX: 0,
+            translateY: 0
+          });
         }
-        setTransform({
-          scale: 1,
-          rotation: 0,
-          translateX: 0,
-          translateY: 0
-        });
         setForceRender(prev => prev + 1);
       };
+
+      // 已知全分辨率尺寸时，先显示预览图，全分辨率加载完成后再替换
+      const usePreview = previewUrl && previewUrl !== imageUrl && imageWidth && imageHeight;
+      if (usePreview) {
+        const preview = new Image();
+        preview.crossOrigin = "anonymous";
+        preview.onload = () => {
+          if (!cancelled && !fullLoaded) {
+            showImage(preview, imageWidth, imageHeight, true);
+          }
+        };
+        preview.src = `http://localhost:5000${previewUrl}`;
+      }
+
+      const img = new Image();
+      img.crossOrigin = "anonymous";
+      img.onload = () => {
+        if (cancelled) return;
+        fullLoaded = true;
+        showImage(img, img.width, img.height, !usePreview);
+      };
       img.onerror = (err) => {
         console.error('Failed to load image:', err);
-        setImageLoaded(false);
+        if (!cancelled && !usePreview) {
+          setImageLoaded(false);
+        }
       };
       img.src = `http://localhost:5000${imageUrl}`;
+
+      return () => {
+        cancelled = true;
+      };
     } else {
       setImageLoaded(false);
       setImageObj(null);
       setCanvasSize({ width: 0, height: 0 });
     }
-  }, [imageUrl]);
+  }, [imageUrl, previewUrl, imageWidth, imageHeight]);
 
   // Keyboard handler
   useEffect(() => {